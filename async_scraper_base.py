@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+async_scraper_base - asyncio-native counterpart of scraper_base.ScraperBase
+"""
+
+import asyncio
+import email.parser
+import http.client
+import ssl
+import time
+import unittest
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request
+from urllib.parse import urljoin, urlsplit
+from circuit_breaker import CLOSED, COOLDOWN_SECONDS, FAILURE_THRESHOLD, \
+    OPEN, is_host_failure
+from retry_policy import RetryPolicy
+from http_pool import add_timing
+from scraper_base import _SCRAPE_TALLY, TEST_RSS, ScraperBase
+
+
+# default values:
+
+# timeout, in seconds, of a single http request (including redirects)
+HTTP_TIMEOUT_SECONDS = 30.0
+
+# maximum number of redirects followed before declaring failure
+MAX_REDIRECTS = 5
+
+# http codes that come with a 'Location' header to follow
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+async def _read_body(reader, headers):
+    """
+    reads the body of an http response whose headers are 'headers' from
+    asyncio stream reader 'reader', returns it as bytes
+    """
+    if headers.get("Transfer-Encoding", "").lower() == "chunked":
+        l_chunks = []
+        while True:
+            s_size = (await reader.readline()).split(b";")[0].strip()
+            n_size = int(s_size, 16)
+            if n_size == 0:
+                break
+            l_chunks.append(await reader.readexactly(n_size))
+            await reader.readline()
+        # skip trailers, if any, until the blank line
+        while (await reader.readline()).strip():
+            pass
+        return b"".join(l_chunks)
+
+    s_length = headers.get("Content-Length")
+    if s_length is not None:
+        return await reader.readexactly(int(s_length))
+
+    return await reader.read()
+
+
+def _decode_body(contents, headers):
+    """
+    undoes the content-encoding ('gzip' or 'deflate') of an http body,
+    raises request.URLError if it cannot be (as urllib3 does on the
+    blocking path)
+    """
+    s_encoding = headers.get("Content-Encoding", "").lower()
+    try:
+        if s_encoding == "gzip":
+            return zlib.decompress(contents, 16+zlib.MAX_WBITS)
+        if s_encoding == "deflate":
+            try:
+                return zlib.decompress(contents)
+            except zlib.error:
+                return zlib.decompress(contents, -zlib.MAX_WBITS)
+    except zlib.error as ex:
+        raise request.URLError("cannot decode %s body: %s" %
+                               (s_encoding, ex)) from ex
+    return contents
+
+
+async def _http_get_once(s_url, d_headers, d_timings=None):
+    """
+    performs one http GET of 's_url' without following redirects, returns
+    tuple (contents, headers, code), adding its timings to 'd_timings' as
+    async_http_get() does
+    """
+    url = urlsplit(s_url)
+    b_https = url.scheme == "https"
+    n_port = url.port or (443 if b_https else 80)
+    s_path = url.path or "/"
+    if url.query:
+        s_path += "?"+url.query
+
+    start_time = time.perf_counter()
+    reader, writer = await asyncio.open_connection(
+        url.hostname, n_port,
+        ssl=ssl.create_default_context() if b_https else None)
+    connect_time = time.perf_counter()
+    add_timing(d_timings, "connect", connect_time-start_time)
+    try:
+        d_all_headers = {
+            "Host": url.netloc,
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "close"
+            }
+        d_all_headers.update(d_headers)
+        s_request = "GET %s HTTP/1.1\r\n" % s_path
+        for s_key, s_value in d_all_headers.items():
+            s_request += "%s: %s\r\n" % (s_key, s_value)
+        writer.write((s_request+"\r\n").encode("latin-1"))
+        await writer.drain()
+
+        l_status = (await reader.readline()).decode("latin-1").split(None, 2)
+        if len(l_status) < 2 or not l_status[0].startswith("HTTP/"):
+            raise request.URLError("bad status line from %s" % s_url)
+        code = int(l_status[1])
+        headers_time = time.perf_counter()
+        add_timing(d_timings, "ttfb", headers_time-connect_time)
+
+        l_header_lines = []
+        while True:
+            s_line = await reader.readline()
+            if s_line in (b"\r\n", b"\n", b""):
+                break
+            l_header_lines.append(s_line)
+        headers = email.parser.BytesParser(
+            _class=http.client.HTTPMessage).parsebytes(
+                b"".join(l_header_lines))
+
+        if code in (204, 304) or 100 <= code < 200:
+            contents = b""
+        else:
+            contents = await _read_body(reader, headers)
+            add_timing(d_timings, "bytes", len(contents))
+            contents = _decode_body(contents, headers)
+        add_timing(d_timings, "download",
+                   time.perf_counter()-headers_time)
+    finally:
+        writer.close()
+        try:
+            # so that no socket is left closing once the loop is gone
+            await writer.wait_closed()
+        except OSError:
+            # the response (if any) is read, a failed close changes nothing
+            pass
+
+    return contents, headers, code
+
+
+async def async_http_get(s_url, d_headers=None,
+                         timeout=HTTP_TIMEOUT_SECONDS, d_timings=None):
+    """
+    non-blocking http GET of url string 's_url', following redirects,
+    returns tuple (contents, headers, code) like ScraperBase.fetch_html()
+    and raises the same exceptions urllib does (request.HTTPError for
+    http error codes, request.URLError for everything else). timings and
+    bytes are added to dictionary 'd_timings', if given, as
+    http_pool.HttpPool.get() does
+    """
+    async def get():
+        """
+        the GET, redirects included, so that the timeout covers them all
+        """
+        s_current_url = s_url
+        for _ in range(MAX_REDIRECTS+1):
+            contents, headers, code = await _http_get_once(
+                s_current_url, d_headers or {}, d_timings)
+            if code in REDIRECT_CODES and headers.get("Location"):
+                s_current_url = urljoin(s_current_url, headers["Location"])
+                continue
+            if code >= 400:
+                raise request.HTTPError(s_current_url, code,
+                                        http.client.responses.get(code, ""),
+                                        headers, None)
+            return contents, headers, code
+        raise request.URLError("too many redirects from %s" % s_url)
+
+    try:
+        return await asyncio.wait_for(get(), timeout)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+            ValueError) as ex:
+        if isinstance(ex, request.URLError):
+            raise
+        raise request.URLError(ex) from ex
+
+
+class AsyncScraperBase(ScraperBase):
+    """
+    asyncio-native scraper abstract base class - to derive from this class:
+    (1) implement scrape_worker() as a coroutine ('async def'), awaiting
+        fetch_html() and fetch_rss()
+    (2) await scrape(), which wraps scrape_worker()
+    a plain (non-coroutine) scrape_worker() still works but is run in a
+    worker thread, use scrape_async() to run existing ScraperBase objects
+    """
+
+    async def scrape_worker(self):
+        """
+        default scraping work, same as ScraperBase.scrape_worker() but
+        without blocking the event loop
+        """
+        if self._s_url is None:
+            self.log.warning("this object was initialized without a URL!")
+            return None
+        return self.extract((await self.fetch_html(self._s_url))[0])
+
+    async def scrape(self, b_only_new=False):
+        """
+        awaits scrape_worker() but with logging and timing infrastructure,
+        'b_only_new' is as in ScraperBase.scrape()
+        """
+        start_time = time.time()
+        # each asyncio task has its own context, so concurrent scrape()
+        # calls each count their own (to_thread() passes the context on)
+        d_tally = self.new_scrape_tally()
+        token = _SCRAPE_TALLY.set(d_tally)
+        try:
+            if asyncio.iscoroutinefunction(self.scrape_worker):
+                response = await self.scrape_worker()
+            else:
+                response = await asyncio.to_thread(self.scrape_worker)
+            if b_only_new:
+                response = self.filter_new(response)
+        finally:
+            _SCRAPE_TALLY.reset(token)
+        self.record_scrape(time.time()-start_time, d_tally)
+
+        return response
+
+    async def fetch_rss(self, s_url):
+        """
+        fetches the rss feed at a url given by url string s_url - the feed
+        is downloaded without blocking, then its bytes are parsed off the
+        event loop (on the parse executor, if any, with the same function as
+        ScraperBase.parse_rss(), see get_rss_parser()). like
+        ScraperBase.fetch_rss(), fresh or unchanged feeds come from the
+        result cache, and if the feed has not changed since it was last
+        fetched (http code 304) the previously parsed feed is returned
+        """
+        return await self._fetch_parsed(s_url, "rss", self._parse_rss)
+
+    async def fetch_headlines(self, s_url):
+        """
+        fetches the rss feed at a url given by url string s_url and returns
+        its entries as a list of headline.Headline records - like
+        fetch_rss(), but the parsed feed itself is not kept
+        """
+        return await self._fetch_parsed(s_url, "headlines",
+                                        self._parse_headlines)
+
+    async def _fetch_parsed(self, s_url, s_kind, parse):
+        """
+        same as ScraperBase._fetch_parsed(), but awaiting the download and
+        coroutine parse(contents, headers, s_url)
+        """
+        s_key = s_kind+" "+s_url
+        response = self.get_cached_result(s_key)
+        if response is not None:
+            return response
+        contents, headers, _ = await self.fetch_html(s_url)
+        if contents is None:
+            return await parse(b"", None, s_url)
+        response = self.get_cached_result(s_key, contents)
+        if response is not None:
+            return response
+        start_time = time.perf_counter()
+        response = await parse(contents, headers, s_url)
+        self.record_stage("parse", s_url, time.perf_counter()-start_time)
+        self._result_cache.put(s_key, contents, response)
+        return response
+
+    async def _parse_rss(self, contents, headers=None, s_url=None):
+        """
+        parses rss feed bytes 'contents' like ScraperBase.parse_rss(), but
+        off the event loop
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._parse_executor, self.get_rss_parser(), contents,
+            self.get_parse_headers(headers, s_url))
+
+    async def _parse_headlines(self, contents, headers=None, s_url=None):
+        """
+        parses rss feed bytes 'contents' like _parse_rss(), returns the
+        feed's entries as a list of headline.Headline records
+        """
+        return self.get_headlines(await self._parse_rss(contents, headers,
+                                                        s_url))
+
+    async def fetch_html(self, s_url):
+        """
+        fetches the html at a url given by url string s_url, returns tuple
+        (contents, headers, code) like ScraperBase.fetch_html()
+        """
+        breaker = self.get_breaker(s_url)
+        if not breaker.allow_request():
+            self.log.warning("circuit open, not fetching %s", s_url,
+                             extra=self.get_log_fields(s_url))
+            return None, None, None
+        d_headers = {
+            "User-Agent" : "",
+            "Referer" : "http://python.org"
+            }
+        s_key = "html "+s_url
+        cached = self._validator_store.get(s_key)
+        d_headers.update(self.get_conditional_headers(cached))
+
+        start_time = time.time()
+        n_tries = 0
+        contents = None
+        headers = None
+        code = None
+        b_success = False
+        # whether the host answered the last try, for its circuit breaker
+        b_host_up = False
+        b_cancelled = False
+        d_timings = {}
+        try:
+            while True:
+                n_tries += 1
+                try:
+                    contents, headers, code = await async_http_get(
+                        s_url, d_headers, d_timings=d_timings)
+                    self._last_scraped_url = s_url
+                    b_success = True
+                    b_host_up = True
+                    if code == 304 and cached:
+                        # not modified since last fetched, reuse those
+                        # contents
+                        contents = cached[2]
+                    else:
+                        self.save_validators(s_key, headers, contents)
+                    break
+                except (request.HTTPError, request.URLError) as ex:
+                    b_host_up = not is_host_failure(ex)
+                    delay = self._retry_policy.get_next_delay(
+                        n_tries, start_time, ex)
+                    if delay is None:
+                        self.log.error("Cannot open %s\n%s\ngiving up after "
+                                       "%d tries\n", s_url, ex, n_tries,
+                                       extra=self.get_log_fields(
+                                           s_url, attempt=n_tries))
+                        break
+                    self.log.error("Cannot open %s\n%s\nretrying in %2.2f "
+                                   "s\n", s_url, ex, delay,
+                                   extra=self.get_log_fields(
+                                       s_url, attempt=n_tries))
+                    await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            b_cancelled = True
+            raise
+        finally:
+            # also when something unexpected escapes, see
+            # ScraperBase.fetch_html() - but a caller giving up (e.g. its
+            # timeout) says nothing about the host
+            if b_cancelled:
+                breaker.release_probe()
+            elif b_host_up:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        self.record_fetch(s_url, b_success, n_tries, d_timings)
+
+        return contents, headers, code
+
+
+async def scrape_async(sobj, b_only_new=False):
+    """
+    awaits the scrape() of scraper object 'sobj' - AsyncScraperBase objects
+    are awaited directly, any other ScraperBase object is run unchanged in
+    a worker thread
+    """
+    if isinstance(sobj, AsyncScraperBase):
+        return await sobj.scrape(b_only_new)
+    return await asyncio.to_thread(sobj.scrape, b_only_new)
+
+
+async def scrape_all_async(l_scrapers, b_only_new=False):
+    """
+    runs the scrape() of all scraper objects in list 'l_scrapers'
+    concurrently, returns the list of their results (in the same order)
+    """
+    return await asyncio.gather(*[scrape_async(sobj, b_only_new)
+                                  for sobj in l_scrapers])
+
+
+TEST_ETAG = '"v1"'
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def setUp(self):
+        """
+        starts a local http server serving TEST_RSS at /rss, a redirect
+        to it at /moved, a body that is not the gzip it claims at /corrupt
+        and a response half a second late at /slow
+        """
+        from local_server import LocalServer
+        self._server = LocalServer({
+            "/rss": (200, {"ETag": TEST_ETAG,
+                           "Content-Type": "application/rss+xml"}, TEST_RSS),
+            "/moved": (302, {"Location": "/rss"}, b""),
+            "/corrupt": (200, {"Content-Encoding": "gzip"}, b"not gzip"),
+            "/slow": lambda handler: (time.sleep(0.5) or
+                                      (200, {}, b"slow"))})
+        self._s_base_url = self._server.s_base_url
+
+    def tearDown(self):
+        """
+        stops the local http server
+        """
+        self._server.close()
+
+    def test01(self):
+        """
+        tests async fetching and parsing of an rss feed through a redirect
+        """
+        class TestScraper(AsyncScraperBase):
+            """
+            async rss scraper
+            """
+            async def scrape_worker(self):
+                """
+                abstract method implementation - does all the scraping work
+                """
+                l_headlines = await self.fetch_headlines(self._s_url)
+                return [headline.title for headline in l_headlines]
+
+        sobj = TestScraper("async_scraper_base.log", "DEBUG",
+                           s_url=self._s_base_url+"/moved")
+        self.assertEqual(asyncio.run(sobj.scrape()),
+                         ["first headline", "second headline"])
+
+    def test02(self):
+        """
+        tests that http errors are retried and then given up on
+        """
+        sobj = AsyncScraperBase("async_scraper_base.log", "DEBUG",
+                                s_url=self._s_base_url+"/missing",
+                                retry_policy=RetryPolicy(
+                                    2, 0.01, retryable_codes=(404,)))
+        contents, headers, code = asyncio.run(
+            sobj.fetch_html(sobj._s_url))
+        self.assertIsNone(contents)
+        self.assertIsNone(headers)
+        self.assertIsNone(code)
+
+    def test03(self):
+        """
+        tests that an unchanged feed is not parsed again (conditional GET)
+        """
+        sobj = AsyncScraperBase("async_scraper_base.log", "DEBUG")
+        s_url = self._s_base_url+"/rss"
+        feed = asyncio.run(sobj.fetch_rss(s_url))
+        self.assertEqual(asyncio.run(sobj.fetch_html(s_url))[2], 304)
+        self.assertIs(asyncio.run(sobj.fetch_rss(s_url)), feed)
+
+    def test04(self):
+        """
+        tests that a plain ScraperBase object runs unchanged via scrape_async
+        """
+        class SyncScraper(ScraperBase):
+            """
+            blocking scraper
+            """
+            def scrape_worker(self):
+                """
+                abstract method implementation
+                """
+                return ["sync"]
+
+        sobj = SyncScraper("async_scraper_base.log", "DEBUG")
+        self.assertEqual(asyncio.run(scrape_all_async([sobj])), [["sync"]])
+
+    def test05(self):
+        """
+        tests that feeds parsed on an executor are the same (compact) ones
+        as the blocking scrapers get
+        """
+        s_url = self._s_base_url+"/rss"
+        with ThreadPoolExecutor(1) as executor:
+            feed = asyncio.run(AsyncScraperBase(
+                "async_scraper_base.log", "DEBUG",
+                parse_executor=executor).fetch_rss(s_url))
+            self.assertEqual(feed, ScraperBase(
+                "async_scraper_base.log", "DEBUG",
+                parse_executor=executor).fetch_rss(s_url))
+        self.assertEqual(set(feed.entries[0]), {"title", "link"})
+
+    def test06(self):
+        """
+        tests that only headline records are kept for fetch_headlines()
+        """
+        sobj = AsyncScraperBase("async_scraper_base.log", "DEBUG")
+        s_url = self._s_base_url+"/rss"
+        l_headlines = asyncio.run(sobj.fetch_headlines(s_url))
+        self.assertIs(asyncio.run(sobj.fetch_headlines(s_url)), l_headlines)
+        self.assertIsNone(sobj._result_cache.get("rss "+s_url))
+        self.assertIsNone(sobj._validator_store.get("headlines "+s_url))
+        self.assertEqual([headline.title for headline in l_headlines],
+                         ["first headline", "second headline"])
+
+    def test07(self):
+        """
+        tests that a body that cannot be decoded is a request.URLError, so
+        that it is retried and then given up on
+        """
+        s_url = self._s_base_url+"/corrupt"
+        with self.assertRaises(request.URLError):
+            asyncio.run(async_http_get(s_url))
+        sobj = AsyncScraperBase("async_scraper_base.log", "DEBUG",
+                                retry_policy=RetryPolicy(2, 0.0))
+        self.assertIsNone(asyncio.run(sobj.fetch_html(s_url))[0])
+
+    def test08(self):
+        """
+        tests that cancelled fetches are not failures of the host, and
+        that a cancelled half-open probe lets the next request probe
+        """
+        sobj = AsyncScraperBase("async_scraper_base.log", "DEBUG")
+        s_url = self._s_base_url+"/slow"
+        breaker = sobj.get_breaker(s_url)
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(sobj.fetch_html(s_url), 0.05))
+        self.assertEqual((breaker.get_state(), breaker.get_n_failures()),
+                         (CLOSED, 0))
+        for _ in range(FAILURE_THRESHOLD):
+            breaker.record_failure()
+        # the cooldown is over, the next fetch is the probe
+        breaker._opened_time -= COOLDOWN_SECONDS
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(sobj.fetch_html(s_url), 0.05))
+        self.assertEqual(breaker.get_state(), OPEN)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+benchmark.py - repeatable benchmarks of the scraping pipeline (fetching,
+feed and table parsing, logging) against an in-process http server of
+fixtures, with optional injected latency and errors
+"""
+
+import argparse
+import http.server
+import math
+import os.path
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from circuit_breaker import CircuitBreaker, get_open_hosts
+from http_pool import HttpPool
+from log_utils import Logger
+from result_cache import ResultCache
+from retry_policy import RetryPolicy
+from scraper_base import ScraperBase
+
+
+# default values:
+
+# number of timed calls of each stage
+N_ITERATIONS = 200
+
+# number of calls of each stage traced for their peak memory (tracing slows
+# calls down, so they are not the timed ones)
+N_MEMORY_ITERATIONS = 5
+
+# seconds the fixture server waits before each response
+LATENCY_SECONDS = 0.0
+
+# fraction of requests the fixture server answers with a 503
+ERROR_RATE = 0.0
+
+# number of items of the rss fixture
+N_RSS_ITEMS = 50
+
+# number of rows of the table of the html fixture
+N_TABLE_ROWS = 200
+
+# seed of the error injection, fixed so that runs are repeatable
+ERROR_SEED = 1
+
+# consecutive failures after which the benchmark's own circuit breakers
+# open (None: they never do, so that injected errors cannot make later
+# calls fail fast and skew the timings)
+BREAKER_THRESHOLD = None
+
+
+def make_rss_fixture(n_items=N_RSS_ITEMS):
+    """
+    returns an rss 2.0 feed (bytes) of 'n_items' items, shaped like the
+    outlets' feeds
+    """
+    l_items = []
+    for i_item in range(n_items):
+        l_items.append(
+            "<item><title>Headline number %d about the news of the day"
+            "</title><link>http://news.example.com/story/%d</link>"
+            "<guid>http://news.example.com/story/%d</guid>"
+            "<description>Summary of story %d, a sentence or two of text."
+            "</description><pubDate>Mon, 02 Jan 2006 15:%02d:05 GMT"
+            "</pubDate></item>" % (i_item, i_item, i_item, i_item,
+                                   i_item % 60))
+    return ("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+            "<rss version=\"2.0\"><channel><title>fixture</title>"
+            "<link>http://news.example.com/</link>%s</channel></rss>" %
+            "".join(l_items)).encode("utf-8")
+
+
+def make_html_fixture(n_rows=N_TABLE_ROWS):
+    """
+    returns an html page (bytes) with a navigation table, then a data table
+    of 'n_rows' rows, then as much markup again after it
+    """
+    s_filler = "<div class=\"story\"><a href=\"/x\">link</a> <p>text</p>" \
+        "</div>\n"*n_rows
+    l_rows = ["<tr><td>%d</td><td> name %d </td><td><b>%d.%02d</b></td>"
+              "</tr>\n" % (i_row, i_row, i_row, i_row % 100)
+              for i_row in range(n_rows)]
+    return ("<html><head><title>fixture</title></head><body>"
+            "<table><tr><td>home</td><td>news</td></tr></table>\n%s"
+            "<table>\n%s</table>\n%s</body></html>" %
+            (s_filler, "".join(l_rows), s_filler)).encode("utf-8")
+
+
+def get_percentile(l_values, percent):
+    """
+    returns the 'percent' percentile (nearest rank) of list 'l_values'
+    """
+    l_sorted = sorted(l_values)
+    n_rank = int(math.ceil(percent/100.0*len(l_sorted)))
+    return l_sorted[max(0, min(len(l_sorted), n_rank)-1)]
+
+
+class FixtureServer():
+    """
+    in-process http server of fixtures: 'd_fixtures' is a dictionary of
+    url path -> (content type, bytes). every response is delayed by
+    'latency' seconds and a fraction 'error_rate' of the requests get a 503
+    """
+
+    def __init__(self, d_fixtures, latency=LATENCY_SECONDS,
+                 error_rate=ERROR_RATE, n_seed=ERROR_SEED):
+        """
+        constructor
+        """
+        self.n_requests = 0
+        self.n_errors = 0
+        lock = threading.Lock()
+        rand = random.Random(n_seed)
+        fixture_server = self
+
+        class FixtureHandler(http.server.BaseHTTPRequestHandler):
+            """
+            serves the fixtures
+            """
+            protocol_version = "HTTP/1.1"
+            # headers and body are separate writes, which with Nagle's
+            # algorithm and delayed acks would add ~40 ms to each response
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                """
+                handles GET requests
+                """
+                if latency:
+                    time.sleep(latency)
+                with lock:
+                    fixture_server.n_requests += 1
+                    b_error = rand.random() < error_rate
+                    if b_error:
+                        fixture_server.n_errors += 1
+                fixture = d_fixtures.get(self.path)
+                if b_error or fixture is None:
+                    self.send_response(503 if b_error else 404)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", fixture[0])
+                self.send_header("Content-Length", str(len(fixture[1])))
+                self.end_headers()
+                self.wfile.write(fixture[1])
+
+            def log_message(self, *args):
+                """
+                keeps benchmark output quiet
+                """
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0),
+                                                       FixtureHandler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        starts serving, in a background thread
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        stops serving
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_url(self, s_path):
+        """
+        returns the url of fixture path 's_path'
+        """
+        return "http://127.0.0.1:%d%s" % (self._server.server_port, s_path)
+
+
+class CountingBreaker(CircuitBreaker):
+    """
+    circuit breaker that counts the requests it refuses in 'n_refused'
+    """
+    n_refused = 0
+
+    def allow_request(self):
+        """
+        returns True if a request may be made now, see
+        CircuitBreaker.allow_request()
+        """
+        b_allowed = super().allow_request()
+        if not b_allowed:
+            self.n_refused += 1
+        return b_allowed
+
+
+class BenchmarkScraper(ScraperBase):
+    """
+    scraper with its own circuit breakers (CountingBreaker) and connection
+    pool, so that benchmarks neither use nor change the process-wide ones.
+    the breakers open after 'n_breaker_threshold' consecutive failures, or
+    never if it is None
+    """
+
+    def __init__(self, *args, n_breaker_threshold=BREAKER_THRESHOLD,
+                 **kwargs):
+        """
+        constructor - the other arguments are ScraperBase's
+        """
+        kwargs.setdefault("http_pool", HttpPool())
+        ScraperBase.__init__(self, *args, **kwargs)
+        if n_breaker_threshold is None:
+            n_breaker_threshold = math.inf
+        self._n_breaker_threshold = n_breaker_threshold
+        self._d_breakers = {}
+
+    def get_host_breaker(self, s_host):
+        """
+        returns this scraper's circuit breaker of host 's_host'
+        """
+        breaker = self._d_breakers.get(s_host)
+        if breaker is None:
+            breaker = self._d_breakers.setdefault(
+                s_host, CountingBreaker(self._n_breaker_threshold))
+        return breaker
+
+    def get_n_refused(self):
+        """
+        returns the number of fetches its circuit breakers have refused
+        """
+        return sum(breaker.n_refused
+                   for breaker in list(self._d_breakers.values()))
+
+    def close(self):
+        """
+        closes the connections of its pool
+        """
+        self._http_pool.clear()
+
+
+def run_stage(s_stage, func, n_iterations=N_ITERATIONS,
+              n_memory_iterations=N_MEMORY_ITERATIONS, get_n_refused=None):
+    """
+    calls 'func' (no arguments) 'n_iterations' times, then traces
+    'n_memory_iterations' more calls, returns a dictionary of the stage's
+    results: stage name, number of calls, calls per second, p50 and p99
+    latencies in seconds and the peak traced memory in bytes. if function
+    'get_n_refused' (e.g. BenchmarkScraper.get_n_refused) is given, the
+    number of timed calls refused by an open circuit is added as
+    "circuit_open"
+    """
+    l_latencies = []
+    if get_n_refused is not None:
+        n_refused = get_n_refused()
+    start_time = time.perf_counter()
+    for _ in range(n_iterations):
+        call_time = time.perf_counter()
+        func()
+        l_latencies.append(time.perf_counter()-call_time)
+    elapsed_time = time.perf_counter()-start_time
+    if get_n_refused is not None:
+        n_refused = get_n_refused()-n_refused
+
+    n_peak_bytes = 0
+    if n_memory_iterations:
+        b_tracing = tracemalloc.is_tracing()
+        if not b_tracing:
+            tracemalloc.start()
+        try:
+            for _ in range(n_memory_iterations):
+                tracemalloc.reset_peak()
+                n_before = tracemalloc.get_traced_memory()[0]
+                func()
+                n_peak_bytes = max(n_peak_bytes,
+                                   tracemalloc.get_traced_memory()[1]-n_before)
+        finally:
+            if not b_tracing:
+                tracemalloc.stop()
+
+    d_result = {
+        "stage": s_stage,
+        "iterations": n_iterations,
+        "throughput": n_iterations/elapsed_time if elapsed_time else 0.0,
+        "p50": get_percentile(l_latencies, 50),
+        "p99": get_percentile(l_latencies, 99),
+        "peak_bytes": n_peak_bytes}
+    if get_n_refused is not None:
+        d_result["circuit_open"] = n_refused
+    return d_result
+
+
+class Benchmark():
+    """
+    benchmarks fetch_html(), fetch_rss() (download and parse, without the
+    result cache), get_table_from_html() and Logger.debug() against a
+    FixtureServer of make_rss_fixture() and make_html_fixture(), fetching
+    with a BenchmarkScraper whose breakers open after
+    'n_breaker_threshold' consecutive failures (None: never)
+    """
+
+    def __init__(self, n_iterations=N_ITERATIONS, latency=LATENCY_SECONDS,
+                 error_rate=ERROR_RATE, n_rss_items=N_RSS_ITEMS,
+                 n_table_rows=N_TABLE_ROWS,
+                 n_memory_iterations=N_MEMORY_ITERATIONS,
+                 n_breaker_threshold=BREAKER_THRESHOLD):
+        """
+        constructor
+        """
+        self._n_iterations = n_iterations
+        self._n_memory_iterations = n_memory_iterations
+        self._latency = latency
+        self._error_rate = error_rate
+        self._n_breaker_threshold = n_breaker_threshold
+        self._rss = make_rss_fixture(n_rss_items)
+        self._html = make_html_fixture(n_table_rows)
+
+    def run(self):
+        """
+        runs all the stages, returns the list of run_stage() results, to
+        which the fetching stages add the number of injected errors (the
+        timed calls refused by an open circuit, "circuit_open", return
+        right away and so make their stage look faster than it is)
+        """
+        d_fixtures = {
+            "/rss": ("application/rss+xml", self._rss),
+            "/html": ("text/html; charset=utf-8", self._html)}
+        l_results = []
+        with tempfile.TemporaryDirectory() as s_dir, \
+                FixtureServer(d_fixtures, self._latency,
+                              self._error_rate) as server:
+            # injected errors are retried right away, up to 5 times
+            sobj = BenchmarkScraper(
+                os.path.join(s_dir, "benchmark_scraper.log"), "DEBUG",
+                retry_policy=RetryPolicy(5, 0.0, 0.0),
+                result_cache=ResultCache(n_max_entries=0),
+                n_breaker_threshold=self._n_breaker_threshold)
+
+            for s_stage, s_path, fetch in (
+                    ("fetch_html", "/html", sobj.fetch_html),
+                    ("fetch_rss", "/rss", sobj.fetch_rss)):
+                s_url = server.get_url(s_path)
+                n_errors = server.n_errors
+                d_result = run_stage(s_stage, lambda: fetch(s_url),
+                                     self._n_iterations,
+                                     self._n_memory_iterations,
+                                     sobj.get_n_refused)
+                d_result["errors"] = server.n_errors-n_errors
+                l_results.append(d_result)
+            sobj.close()
+
+            s_html = self._html
+            l_results.append(run_stage(
+                "get_table_from_html",
+                lambda: ScraperBase.get_table_from_html(s_html, 1),
+                self._n_iterations, self._n_memory_iterations))
+
+            log = Logger(os.path.join(s_dir, "benchmark.log"), "DEBUG")
+            l_results.append(run_stage(
+                "log", lambda: log.debug("url=http://x/, duration=0.1 "
+                                         "seconds"),
+                self._n_iterations, self._n_memory_iterations))
+
+        return l_results
+
+
+def format_results(l_results):
+    """
+    returns the run_stage() results of list 'l_results' as a text table
+    """
+    l_lines = ["%-20s %8s %10s %10s %10s %10s %7s %7s" % (
+        "stage", "calls", "calls/s", "p50 ms", "p99 ms", "peak KB", "errors",
+        "refused")]
+    for d_result in l_results:
+        l_lines.append("%-20s %8d %10.1f %10.3f %10.3f %10.1f %7s %7s" % (
+            d_result["stage"], d_result["iterations"], d_result["throughput"],
+            d_result["p50"]*1000.0, d_result["p99"]*1000.0,
+            d_result["peak_bytes"]/1024.0, d_result.get("errors", "-"),
+            d_result.get("circuit_open", "-")))
+    n_refused = sum(d_result.get("circuit_open", 0)
+                    for d_result in l_results)
+    if n_refused:
+        l_lines.append("warning: %d calls were refused by an open circuit "
+                       "and returned right away, their stages' timings are "
+                       "skewed" % n_refused)
+    return "\n".join(l_lines)
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests the fixture server's error injection and the percentiles
+        """
+        with FixtureServer({"/": ("text/plain", b"ok")},
+                           error_rate=0.5) as server:
+            sobj = ScraperBase("benchmark.log", "DEBUG",
+                               retry_policy=RetryPolicy(20, 0.0, 0.0))
+            for _ in range(10):
+                self.assertEqual(sobj.fetch_html(server.get_url("/"))[0],
+                                 b"ok")
+            self.assertGreater(server.n_errors, 0)
+            self.assertEqual(server.n_requests, 10+server.n_errors)
+        self.assertEqual(get_percentile(list(range(1, 101)), 50), 50)
+        self.assertEqual(get_percentile(list(range(1, 101)), 99), 99)
+        self.assertEqual(get_percentile([3.0], 99), 3.0)
+
+    def test02(self):
+        """
+        tests a short run of all the stages
+        """
+        l_results = Benchmark(n_iterations=5, n_memory_iterations=1,
+                              n_rss_items=5, n_table_rows=5).run()
+        self.assertEqual([d_result["stage"] for d_result in l_results],
+                         ["fetch_html", "fetch_rss", "get_table_from_html",
+                          "log"])
+        for d_result in l_results:
+            self.assertGreater(d_result["throughput"], 0.0)
+            self.assertLessEqual(d_result["p50"], d_result["p99"])
+            self.assertGreater(d_result["peak_bytes"], 0)
+        self.assertIn("get_table_from_html", format_results(l_results))
+
+    def test03(self):
+        """
+        tests that the benchmark's breakers are its own, never open by
+        default, and that calls refused by an open one are reported
+        """
+        l_results = Benchmark(n_iterations=20, n_memory_iterations=0,
+                              error_rate=1.0, n_rss_items=5,
+                              n_table_rows=5).run()
+        self.assertEqual([d_result["circuit_open"]
+                          for d_result in l_results[:2]], [0, 0])
+        self.assertEqual(l_results[0]["errors"], 20*5)
+        l_results = Benchmark(n_iterations=20, n_memory_iterations=0,
+                              error_rate=1.0, n_rss_items=5,
+                              n_table_rows=5, n_breaker_threshold=3).run()
+        self.assertEqual([d_result["circuit_open"]
+                          for d_result in l_results[:2]], [17, 20])
+        self.assertIn("37 calls were refused", format_results(l_results))
+        self.assertEqual(get_open_hosts(), set())
+
+
+def main(l_args):
+    """
+    runs the benchmark with command line options 'l_args', prints the results
+    """
+    parser = argparse.ArgumentParser(prog="benchmark.py run",
+                                     description=__doc__.strip())
+    parser.add_argument("-n", "--iterations", type=int, default=N_ITERATIONS,
+                        help="timed calls of each stage")
+    parser.add_argument("-l", "--latency", type=float,
+                        default=LATENCY_SECONDS,
+                        help="seconds the server waits before responding")
+    parser.add_argument("-e", "--error-rate", type=float, default=ERROR_RATE,
+                        help="fraction of requests answered with a 503")
+    parser.add_argument("--rss-items", type=int, default=N_RSS_ITEMS,
+                        help="items of the rss fixture")
+    parser.add_argument("--table-rows", type=int, default=N_TABLE_ROWS,
+                        help="rows of the html fixture's table")
+    parser.add_argument("--breaker-threshold", type=int,
+                        default=BREAKER_THRESHOLD,
+                        help="consecutive failures that open the circuit "
+                        "(default: it never opens)")
+    args = parser.parse_args(l_args)
+    print(format_results(Benchmark(
+        args.iterations, args.latency, args.error_rate, args.rss_items,
+        args.table_rows, n_breaker_threshold=args.breaker_threshold).run()))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "run":
+        main(sys.argv[2:])
+    else:
+        unittest.main()
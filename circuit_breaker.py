@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+circuit_breaker.py - per-host circuit breakers, so that hosts which keep
+failing are failed fast instead of paying the whole retry budget each time
+"""
+
+import socket
+import threading
+import time
+import unittest
+from urllib import request
+
+
+# default values:
+
+# number of consecutive failures after which a host's circuit opens
+FAILURE_THRESHOLD = 3
+
+# seconds an open circuit waits before letting one probe request through
+COOLDOWN_SECONDS = 300.0
+
+# circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    """
+    exception for requests refused because their host's circuit is open
+    """
+    def __init__(self, value):
+        """
+        This is the exception constructor method
+        """
+        Exception.__init__(self)
+        self.value = value
+
+    def __str__(self):
+        """
+        Convert error object to a string
+        """
+        return repr(self.value)
+
+
+class CircuitBreaker():
+    """
+    circuit breaker: closed (requests go through) until 'n_failure_threshold'
+    consecutive failures, then open (requests are refused) for 'cooldown'
+    seconds, then half-open: a single probe request goes through, closing
+    the circuit if it succeeds and reopening it if it fails
+    """
+
+    def __init__(self, n_failure_threshold=FAILURE_THRESHOLD,
+                 cooldown=COOLDOWN_SECONDS):
+        """
+        constructor
+        """
+        self._n_failure_threshold = n_failure_threshold
+        self._cooldown = cooldown
+        self._state = CLOSED
+        self._n_failures = 0
+        self._opened_time = None
+        self._lock = threading.Lock()
+
+    def get_state(self):
+        """
+        returns the state of the circuit: CLOSED, OPEN or HALF_OPEN
+        """
+        return self._state
+
+    def get_n_failures(self):
+        """
+        returns the number of consecutive failures
+        """
+        return self._n_failures
+
+    def is_open(self):
+        """
+        returns True if a request made now would be refused
+        """
+        with self._lock:
+            if self._state == OPEN:
+                return time.time()-self._opened_time < self._cooldown
+            return self._state == HALF_OPEN
+
+    def allow_request(self):
+        """
+        returns True if a request may be made now - when the cooldown of an
+        open circuit has passed, this lets the single half-open probe through
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and \
+                    time.time()-self._opened_time >= self._cooldown:
+                self._state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        """
+        records a successful request, closing the circuit
+        """
+        with self._lock:
+            self._state = CLOSED
+            self._n_failures = 0
+            self._opened_time = None
+
+    def release_probe(self):
+        """
+        records a request given up without a result (e.g. cancelled by its
+        caller), which says nothing about the host: a closed circuit is
+        left as it is, and a half-open one goes back to open with its
+        cooldown over, so that the next request is the probe
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._state = OPEN
+
+    def record_failure(self):
+        """
+        records a failed request, opening the circuit if there were too many
+        consecutive failures or if it was the half-open probe that failed
+        """
+        with self._lock:
+            self._n_failures += 1
+            if self._state == HALF_OPEN or \
+                    self._n_failures >= self._n_failure_threshold:
+                self._state = OPEN
+                self._opened_time = time.time()
+
+
+def is_host_failure(ex):
+    """
+    returns True if exception 'ex' (raised by a fetch) says that the host
+    is failing: connection errors, timeouts and 5xx http codes - not 4xx
+    codes, which are about the url (a bad path) and not the host
+    """
+    if isinstance(ex, request.HTTPError):
+        return ex.code >= 500
+    return isinstance(ex, (request.URLError, socket.timeout, OSError))
+
+
+_BREAKERS = {}
+
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(s_host):
+    """
+    returns the circuit breaker of host 's_host', shared by all scrapers in
+    this process (created, with the default parameters, if needed)
+    """
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(s_host)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            _BREAKERS[s_host] = breaker
+        return breaker
+
+
+def get_breaker_states():
+    """
+    returns a dictionary of host -> (state, number of consecutive failures)
+    """
+    with _BREAKERS_LOCK:
+        return dict((s_host, (breaker.get_state(), breaker.get_n_failures()))
+                    for s_host, breaker in _BREAKERS.items())
+
+
+def get_open_hosts():
+    """
+    returns the set of hosts whose requests would be refused right now
+    """
+    with _BREAKERS_LOCK:
+        l_items = list(_BREAKERS.items())
+    return set(s_host for s_host, breaker in l_items if breaker.is_open())
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests the closed -> open -> half-open -> closed / open cycle
+        """
+        breaker = CircuitBreaker(n_failure_threshold=2, cooldown=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), OPEN)
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.allow_request())
+        time.sleep(0.06)
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.get_state(), HALF_OPEN)
+        # only one probe at a time
+        self.assertFalse(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), OPEN)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow_request())
+        # a probe given up on lets the next request probe
+        breaker.release_probe()
+        self.assertEqual(breaker.get_state(), OPEN)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.get_state(), CLOSED)
+        breaker.release_probe()
+        self.assertEqual(breaker.get_state(), CLOSED)
+
+    def test02(self):
+        """
+        tests the process-wide registry
+        """
+        breaker = get_breaker("breaker.test")
+        self.assertIs(get_breaker("breaker.test"), breaker)
+        for _ in range(FAILURE_THRESHOLD):
+            breaker.record_failure()
+        self.assertIn("breaker.test", get_open_hosts())
+        self.assertEqual(get_breaker_states()["breaker.test"],
+                         (OPEN, FAILURE_THRESHOLD))
+        breaker.record_success()
+        self.assertNotIn("breaker.test", get_open_hosts())
+
+    def test03(self):
+        """
+        tests which fetch errors count as failures of the host
+        """
+        self.assertTrue(is_host_failure(request.HTTPError(
+            "http://x", 503, "", {}, None)))
+        self.assertFalse(is_host_failure(request.HTTPError(
+            "http://x", 404, "", {}, None)))
+        self.assertTrue(is_host_failure(request.URLError(
+            ConnectionRefusedError())))
+        self.assertTrue(is_host_failure(socket.timeout()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+dedup_index.py - index of the headlines already seen, so that repeated
+scrapes of a feed can return only what is new
+"""
+
+import collections
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+import unittest
+from headline import Headline
+
+
+# default values:
+
+# maximum number of keys remembered (oldest ones are evicted first)
+MAX_ENTRIES = 100000
+
+# seconds a key is remembered after it was last seen, None for no limit
+MAX_AGE_SECONDS = 7*24*3600.0
+
+# on-disk record: 8 byte key hash, then the time it was last seen (double)
+RECORD_FORMAT = "<Qd"
+
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+
+def get_key_hash(s_key):
+    """
+    returns the 64-bit hash (an int) of string 's_key'
+    """
+    return int.from_bytes(
+        hashlib.blake2b(s_key.encode("utf-8"), digest_size=8).digest(),
+        "little")
+
+
+class DedupIndex():
+    """
+    set of 64-bit hashes of headline keys (guid, else link, else title)
+    with eviction by age and by size, optionally saved to a file
+    """
+
+    def __init__(self, s_filename=None, n_max_entries=MAX_ENTRIES,
+                 max_age_seconds=MAX_AGE_SECONDS):
+        """
+        constructor - if 's_filename' is given the index is loaded from
+        that file (if it exists) and save() writes it there
+        """
+        self._s_filename = s_filename
+        self._n_max_entries = n_max_entries
+        self._max_age_seconds = max_age_seconds
+        # key hash -> time last seen, least recently seen first
+        self._d_seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if s_filename is not None and os.path.exists(s_filename):
+            self.load()
+
+    def __len__(self):
+        return len(self._d_seen)
+
+    def __contains__(self, s_key):
+        return get_key_hash(s_key) in self._d_seen
+
+    def get_filename(self):
+        """
+        returns the name of the file of the index, None if it has none
+        """
+        return self._s_filename
+
+    def _evict(self, now):
+        """
+        drops the keys that are too old or too many (caller holds the lock)
+        """
+        while len(self._d_seen) > self._n_max_entries:
+            self._d_seen.popitem(last=False)
+        if self._max_age_seconds is not None:
+            min_time = now-self._max_age_seconds
+            while self._d_seen and \
+                    next(iter(self._d_seen.values())) < min_time:
+                self._d_seen.popitem(last=False)
+
+    def filter_new(self, l_items, now=None):
+        """
+        returns the items of list 'l_items' (headline.Headline records or
+        key strings) that were not seen before, and marks them all as seen -
+        other items (e.g. the rows of a table) have no key, they are all
+        returned and nothing is marked for them
+        """
+        if now is None:
+            now = time.time()
+        l_new = []
+        with self._lock:
+            self._evict(now)
+            for item in l_items:
+                if isinstance(item, Headline):
+                    n_hash = get_key_hash(item.get_key())
+                elif isinstance(item, str):
+                    n_hash = get_key_hash(item)
+                else:
+                    l_new.append(item)
+                    continue
+                if n_hash not in self._d_seen:
+                    l_new.append(item)
+                else:
+                    self._d_seen.move_to_end(n_hash)
+                self._d_seen[n_hash] = now
+            self._evict(now)
+        return l_new
+
+    def save(self):
+        """
+        writes the index to its file, atomically - raises ValueError if the
+        index has no file
+        """
+        if self._s_filename is None:
+            raise ValueError("this dedup index has no file to save to")
+        with self._lock:
+            s_tmp_filename = self._s_filename+".tmp"
+            with open(s_tmp_filename, "wb") as h_file:
+                for n_hash, seen_time in self._d_seen.items():
+                    h_file.write(struct.pack(RECORD_FORMAT, n_hash,
+                                             seen_time))
+            os.replace(s_tmp_filename, self._s_filename)
+
+    def load(self):
+        """
+        reads the index from its file, dropping keys that are too old
+        """
+        with open(self._s_filename, "rb") as h_file:
+            s_data = h_file.read()
+        with self._lock:
+            self._d_seen.clear()
+            n_size = len(s_data)-len(s_data) % RECORD_SIZE
+            for n_hash, seen_time in struct.iter_unpack(RECORD_FORMAT,
+                                                        s_data[:n_size]):
+                self._d_seen[n_hash] = seen_time
+            self._evict(time.time())
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests filtering and eviction by size and age
+        """
+        index = DedupIndex(n_max_entries=2, max_age_seconds=10.0)
+        l_headlines = [Headline("X", "a", guid="1"), Headline("X", "b")]
+        self.assertEqual(index.filter_new(l_headlines, 100.0), l_headlines)
+        self.assertEqual(index.filter_new(l_headlines, 101.0), [])
+        self.assertEqual(index.filter_new(["c"], 102.0), ["c"])
+        # "1" was evicted, the least recently seen of three
+        self.assertEqual(len(index), 2)
+        self.assertNotIn("1", index)
+        self.assertEqual(index.filter_new(["b", "d"], 200.0), ["b", "d"])
+        self.assertEqual(len(index), 2)
+        # table rows have no key, they are passed through
+        l_rows = [["row", "cells"], ["row", "cells"]]
+        self.assertEqual(index.filter_new(l_rows+["d"], 201.0), l_rows)
+        self.assertEqual(index.filter_new(l_rows, 202.0), l_rows)
+        self.assertEqual(len(index), 2)
+
+    def test02(self):
+        """
+        tests saving and loading
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_filename = os.path.join(s_dir, "dedup.idx")
+            index = DedupIndex(s_filename)
+            index.filter_new(["a", "b"])
+            index.save()
+            index = DedupIndex(s_filename)
+            self.assertEqual(index.filter_new(["a", "c"]), ["c"])
+        with self.assertRaises(ValueError):
+            DedupIndex().save()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,9 @@
 file_utils - io from file files w/multiple objects
 """
 
+import mmap
+import os
+import tempfile
 import unittest
 
 BUFFER_SIZE = 64*1024
@@ -79,6 +82,133 @@ class ReverseFileIterator():
         """
         return [i for i in self]
 
+class MmapReverseFileIterator():
+    """
+    iterates through the lines of a file from last to first, like
+    ReverseFileIterator, but on a read-only memory map of the file's bytes,
+    cut into batches of whole lines at newline bytes (found with rfind()),
+    so multi-byte characters are never split. lines are decoded a batch
+    at a time or, if 's_encoding' is None, returned without a copy as
+    memoryviews of the map, which are valid until close() (or the end of a
+    with block). a final '\r' of a line is dropped, like text mode does
+    """
+    def __init__(self, s_filename, s_encoding="utf-8", s_errors="replace"):
+        """
+        setup
+        """
+        self._s_encoding = s_encoding
+        self._s_errors = s_errors
+        self._mmap = None
+        self._view = None
+        self._l_lines = []
+        # the lines not batched yet are the bytes before offset self._end,
+        # if there are any (there is a line, maybe empty, if self._end is 0)
+        self._end = -1
+        with open(s_filename, "rb") as h_file:
+            if os.fstat(h_file.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(h_file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+        if self._mmap is not None:
+            self._view = memoryview(self._mmap)
+            self._end = len(self._mmap)
+            if self._mmap[self._end-1] == 10:
+                # no empty line after the final newline
+                self._end -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        unmaps the file (unless returned memoryviews are still in use, then
+        it is unmapped once they are all gone)
+        """
+        self._l_lines = []
+        self._end = -1
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+
+    def __iter__(self):
+        """
+        part of allowing this class's objects to also be used as iterators
+        """
+        return self
+
+    def __next__(self):
+        """
+        next..
+        """
+        if not self._l_lines:
+            if self._end < 0:
+                raise StopIteration
+            self._read_next_batch()
+        return self._l_lines.pop()
+
+    def _read_next_batch(self):
+        """
+        cuts the last (about BUFFER_SIZE bytes of) whole lines not batched
+        yet into self._l_lines
+        """
+        n_end = self._end
+        n_start = self._mmap.rfind(b"\n", 0, max(0, n_end-BUFFER_SIZE))+1
+        self._end = n_start-1
+        if self._s_encoding is not None:
+            s_batch = str(self._mmap[n_start:n_end], self._s_encoding,
+                          self._s_errors)
+            if "\r" in s_batch:
+                s_batch = s_batch.replace("\r\n", "\n")
+                if s_batch[-1:] == "\r":
+                    s_batch = s_batch[:-1]
+            self._l_lines = s_batch.split("\n")
+            return
+        l_lines = []
+        mmap_rfind = self._mmap.rfind
+        view = self._view
+        while True:
+            n_line_start = mmap_rfind(b"\n", n_start, n_end)+1
+            if n_line_start == 0:
+                n_line_start = n_start
+            n_line_end = n_end
+            if n_line_end > n_line_start and view[n_line_end-1] == 13:
+                n_line_end -= 1
+            l_lines.append(view[n_line_start:n_line_end])
+            if n_line_start <= n_start:
+                break
+            n_end = n_line_start-1
+        l_lines.reverse()
+        self._l_lines = l_lines
+
+    def iter_batches(self):
+        """
+        generator of the lines not returned yet a batch (a list of lines in
+        file order) at a time, the last batch first - for callers that
+        process many lines per call
+        """
+        while self._l_lines or self._end >= 0:
+            if not self._l_lines:
+                self._read_next_batch()
+            l_lines, self._l_lines = self._l_lines, []
+            yield l_lines
+
+    def all(self):
+        """
+        runs next() over and over until the end
+        """
+        return [i for i in self]
+
 class ModuleTests(unittest.TestCase):
     """
     module tests
@@ -92,6 +222,38 @@ class ModuleTests(unittest.TestCase):
         for s_line in ReverseFileIterator(s_filename):
             print(s_line)
 
+    def test_mmap(self):
+        """
+        tests that the memory mapped iterator returns the same lines as
+        ReverseFileIterator, also with multi-byte characters on buffer
+        boundaries, and as memoryviews
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_filename = os.path.join(s_dir, "lines.txt")
+            l_contents = [
+                "", "\n", "a", "a\n", "\na\n\nb", "a\r\nb\r\n",
+                "".join("line %d é ü 中\n" % i for i in range(10000))]
+            for s_contents in l_contents:
+                with open(s_filename, "w", encoding="utf-8",
+                          newline="") as h_file:
+                    h_file.write(s_contents)
+                l_lines = s_contents.replace("\r\n", "\n").split("\n")
+                if l_lines[-1] == "" and len(l_lines) > 1:
+                    del l_lines[-1]
+                if s_contents == "":
+                    l_lines = []
+                l_lines.reverse()
+                with MmapReverseFileIterator(s_filename) as iterator:
+                    self.assertEqual(iterator.all(), l_lines)
+                with MmapReverseFileIterator(s_filename, None) as iterator:
+                    self.assertEqual(
+                        [str(line, "utf-8") for line in iterator], l_lines)
+                with MmapReverseFileIterator(s_filename) as iterator:
+                    l_batches = list(iterator.iter_batches())
+                self.assertEqual(
+                    [s_line for l_batch in reversed(l_batches)
+                     for s_line in l_batch], list(reversed(l_lines)))
+
 
 if __name__ == '__main__':
     unittest.main()
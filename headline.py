@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+headline.py - compact headline records, what the news scrapers return
+"""
+
+import calendar
+import pickle
+import unittest
+import feedparser
+
+
+class Headline():
+    """
+    one headline: its source (outlet name), title, link, guid (the feed's
+    unique id of the entry) and publish time (seconds since the epoch),
+    any of the last three may be None
+    """
+    __slots__ = ("source", "title", "link", "guid", "published")
+
+    def __init__(self, source, title, link=None, guid=None, published=None):
+        """
+        constructor
+        """
+        self.source = source
+        self.title = title
+        self.link = link
+        self.guid = guid
+        self.published = published
+
+    @classmethod
+    def from_entry(cls, s_source, entry):
+        """
+        returns the headline of feedparser feed entry 'entry' from outlet
+        's_source'
+        """
+        time_struct = entry.get("published_parsed") or \
+            entry.get("updated_parsed")
+        return cls(s_source, entry.get("title"), entry.get("link"),
+                   entry.get("id"),
+                   calendar.timegm(time_struct) if time_struct else None)
+
+    def get_key(self):
+        """
+        returns the string that identifies this headline's story across
+        fetches: its guid, or its link if it has no guid, or its title
+        """
+        return self.guid or self.link or self.title
+
+    def as_tuple(self):
+        """
+        returns tuple (source, title, link, guid, published)
+        """
+        return self.source, self.title, self.link, self.guid, self.published
+
+    def __eq__(self, other):
+        if not isinstance(other, Headline):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __getstate__(self):
+        return self.as_tuple()
+
+    def __setstate__(self, state):
+        self.source, self.title, self.link, self.guid, self.published = state
+
+    def __repr__(self):
+        return "Headline(%r, %r, %r, %r, %r)" % self.as_tuple()
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests building headlines from feed entries, and pickling them
+        """
+        feed = feedparser.parse(
+            b"<rss version='2.0'><channel><item><title>t</title>"
+            b"<link>http://x/1</link><guid>g1</guid>"
+            b"<pubDate>Thu, 01 Jan 1970 00:01:00 GMT</pubDate></item>"
+            b"<item><title>u</title></item></channel></rss>")
+        headline = Headline.from_entry("X", feed.entries[0])
+        self.assertEqual(headline.as_tuple(),
+                         ("X", "t", "http://x/1", "g1", 60))
+        self.assertEqual(headline.get_key(), "g1")
+        self.assertEqual(Headline.from_entry("X", feed.entries[1]).get_key(),
+                         "u")
+        self.assertEqual(pickle.loads(pickle.dumps(headline)), headline)
+        self.assertFalse(hasattr(headline, "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+headline_clusters.py - incremental clustering of near-duplicate headlines
+across outlets, using shingling and MinHash / LSH (locality sensitive
+hashing) so that each new headline is compared only to a few candidates
+"""
+
+import collections
+import random
+import re
+import time
+import unittest
+import zlib
+from dedup_index import MAX_AGE_SECONDS, MAX_ENTRIES
+from headline import Headline
+
+
+# default values:
+
+# LSH bands and rows per band, the number of MinHash values per headline is
+# N_BANDS*N_ROWS - headlines whose shingles have a Jaccard similarity of
+# 0.5 share a band with probability 1-(1-0.5**N_ROWS)**N_BANDS (~0.93)
+N_BANDS = 20
+N_ROWS = 3
+
+# minimum Jaccard similarity of the shingle sets of two headlines for them
+# to be in the same cluster
+SIMILARITY_THRESHOLD = 0.5
+
+# seed of the MinHash hash functions, fixed so that signatures are stable
+MINHASH_SEED = 1
+
+# a Mersenne prime larger than any 32-bit shingle hash
+PRIME = (1 << 61)-1
+
+# words that say nothing about the story
+STOP_WORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has",
+    "have", "in", "is", "it", "its", "of", "on", "or", "says", "that", "the",
+    "to", "was", "were", "will", "with"))
+
+RE_WORD = re.compile(r"\w+")
+
+
+def get_shingles(s_title):
+    """
+    returns the set of shingles of headline title 's_title': its words,
+    lower-cased, without stop words - headlines are too short and too
+    freely reworded across outlets for longer shingles to match
+    """
+    return set(s_word for s_word in RE_WORD.findall(s_title.lower())
+               if s_word not in STOP_WORDS)
+
+
+def get_jaccard(set_a, set_b):
+    """
+    returns the Jaccard similarity of sets 'set_a' and 'set_b' (0.0 if
+    both are empty: headlines without shingles say nothing alike)
+    """
+    if not set_a and not set_b:
+        return 0.0
+    return len(set_a & set_b)/float(len(set_a | set_b))
+
+
+class HeadlineClusterer():
+    """
+    groups near-duplicate headlines into clusters, incrementally: each
+    add() assigns the new headlines to existing clusters (merging clusters
+    that a headline links) or to new ones. candidates are found through the
+    LSH buckets of the headlines' MinHash signatures and then verified with
+    the exact Jaccard similarity of their shingles. like a
+    dedup_index.DedupIndex, it forgets the headlines that are too old or
+    too many (least recently added first)
+    """
+
+    def __init__(self, n_bands=N_BANDS, n_rows=N_ROWS,
+                 similarity_threshold=SIMILARITY_THRESHOLD,
+                 n_max_entries=MAX_ENTRIES, max_age_seconds=MAX_AGE_SECONDS):
+        """
+        constructor
+        """
+        self._n_bands = n_bands
+        self._n_rows = n_rows
+        self._similarity_threshold = similarity_threshold
+        self._n_max_entries = n_max_entries
+        self._max_age_seconds = max_age_seconds
+        rand = random.Random(MINHASH_SEED)
+        self._l_hash_params = [
+            (rand.randrange(1, PRIME), rand.randrange(PRIME))
+            for _ in range(n_bands*n_rows)]
+        # headline id -> (headline, its key, its shingles, its LSH bands,
+        # time last added), least recently added first
+        self._d_entries = collections.OrderedDict()
+        self._n_next_id = 0
+        # headline key -> headline id, to ignore headlines added before
+        self._d_keys = {}
+        # (band number, band of signature) -> set of headline ids
+        self._d_buckets = {}
+        # headline id -> cluster id, and cluster id -> set of headline ids
+        # (a cluster's id is that of its first headline)
+        self._d_cluster_ids = {}
+        self._d_clusters = {}
+
+    def __len__(self):
+        return len(self._d_entries)
+
+    def get_signature(self, set_shingles):
+        """
+        returns the MinHash signature (a list) of shingle set 'set_shingles'
+        """
+        l_hashes = [zlib.crc32(s_shingle.encode("utf-8"))
+                    for s_shingle in set_shingles] or [0]
+        return [min((n_a*n_hash+n_b) % PRIME for n_hash in l_hashes)
+                for n_a, n_b in self._l_hash_params]
+
+    def _remove(self, i_headline):
+        """
+        forgets headline id 'i_headline'
+        """
+        _, s_key, _, l_bands, _ = self._d_entries.pop(i_headline)
+        del self._d_keys[s_key]
+        for band in l_bands:
+            set_bucket = self._d_buckets[band]
+            set_bucket.discard(i_headline)
+            if not set_bucket:
+                del self._d_buckets[band]
+        i_cluster = self._d_cluster_ids.pop(i_headline)
+        set_cluster = self._d_clusters[i_cluster]
+        set_cluster.discard(i_headline)
+        if not set_cluster:
+            del self._d_clusters[i_cluster]
+
+    def _evict(self, now):
+        """
+        forgets the headlines that are too old or too many
+        """
+        while len(self._d_entries) > self._n_max_entries:
+            self._remove(next(iter(self._d_entries)))
+        if self._max_age_seconds is not None:
+            min_time = now-self._max_age_seconds
+            while self._d_entries and \
+                    next(iter(self._d_entries.values()))[4] < min_time:
+                self._remove(next(iter(self._d_entries)))
+
+    def _merge(self, i_cluster, i_other):
+        """
+        moves the headlines of cluster 'i_other' into cluster 'i_cluster'
+        """
+        set_other = self._d_clusters.pop(i_other)
+        for i_headline in set_other:
+            self._d_cluster_ids[i_headline] = i_cluster
+        self._d_clusters[i_cluster].update(set_other)
+
+    def add(self, l_headlines, now=None):
+        """
+        adds the headline.Headline records of list 'l_headlines' (those
+        already added are only marked as added now), returns the set of
+        cluster ids that changed or were created
+        """
+        if now is None:
+            now = time.time()
+        self._evict(now)
+        set_changed = set()
+        for headline in l_headlines:
+            s_key = "%s %s" % (headline.source, headline.get_key())
+            i_new = self._d_keys.get(s_key)
+            if i_new is not None:
+                self._d_entries[i_new] = self._d_entries[i_new][:4]+(now,)
+                self._d_entries.move_to_end(i_new)
+                continue
+            i_new = self._n_next_id
+            self._n_next_id += 1
+            self._d_keys[s_key] = i_new
+            set_shingles = get_shingles(headline.title or "")
+            l_bands = []
+            set_candidates = set()
+            if set_shingles:
+                # headlines without shingles are like no other one
+                l_signature = self.get_signature(set_shingles)
+                for i_band in range(self._n_bands):
+                    band = (i_band, tuple(l_signature[
+                        i_band*self._n_rows:(i_band+1)*self._n_rows]))
+                    set_bucket = self._d_buckets.setdefault(band, set())
+                    set_candidates.update(set_bucket)
+                    set_bucket.add(i_new)
+                    l_bands.append(band)
+            self._d_entries[i_new] = (headline, s_key, set_shingles,
+                                      l_bands, now)
+            self._d_cluster_ids[i_new] = i_new
+            self._d_clusters[i_new] = set([i_new])
+
+            i_cluster = i_new
+            for i_other in sorted(set_candidates):
+                if get_jaccard(set_shingles, self._d_entries[i_other][2]) < \
+                        self._similarity_threshold:
+                    continue
+                i_other_cluster = self._d_cluster_ids[i_other]
+                if i_other_cluster == i_cluster:
+                    continue
+                # the older cluster takes in the newer one
+                if i_other_cluster > i_cluster:
+                    i_cluster, i_other_cluster = i_other_cluster, i_cluster
+                self._merge(i_other_cluster, i_cluster)
+                set_changed.discard(i_cluster)
+                i_cluster = i_other_cluster
+            set_changed.add(i_cluster)
+
+        self._evict(now)
+        return set(i_cluster for i_cluster in set_changed
+                   if i_cluster in self._d_clusters)
+
+    def add_sweep(self, d_results, now=None):
+        """
+        adds the headlines of a scraper_runner.ScraperRunner.run() result
+        'd_results', returns the set of cluster ids that changed
+        """
+        l_headlines = []
+        for result in d_results.values():
+            if isinstance(result[0], list):
+                l_headlines.extend(headline for headline in result[0]
+                                   if isinstance(headline, Headline))
+        return self.add(l_headlines, now)
+
+    def get_cluster(self, i_cluster):
+        """
+        returns the list of headlines of cluster id 'i_cluster', in the
+        order they were first added
+        """
+        return [self._d_entries[i_headline][0] for i_headline
+                in sorted(self._d_clusters.get(i_cluster, ()))]
+
+    def get_clusters(self, n_min_size=1):
+        """
+        returns a dictionary of cluster id -> list of its headlines, for
+        clusters with at least 'n_min_size' headlines
+        """
+        return dict((i_cluster, self.get_cluster(i_cluster))
+                    for i_cluster, set_cluster in self._d_clusters.items()
+                    if len(set_cluster) >= n_min_size)
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests that the same story from different outlets is clustered,
+        incrementally, and that unrelated stories are not
+        """
+        clusterer = HeadlineClusterer()
+        clusterer.add([
+            Headline("CNN", "Senate passes sweeping climate bill"),
+            Headline("NPR",
+                     "Wildfire forces thousands to evacuate in Oregon")])
+        set_changed = clusterer.add([
+            Headline("Reuters", "Senate passes sweeping climate bill, "
+                                "sends it to House"),
+            Headline("BBC",
+                     "Thousands evacuate as wildfire spreads in Oregon"),
+            Headline("NYT", "Stocks rally on strong jobs report")])
+        d_clusters = clusterer.get_clusters(2)
+        self.assertEqual(len(d_clusters), 2)
+        self.assertEqual(len(set_changed), 3)
+        l_sources = sorted(sorted(headline.source for headline in l_cluster)
+                           for l_cluster in d_clusters.values())
+        self.assertEqual(l_sources, [["BBC", "NPR"], ["CNN", "Reuters"]])
+        self.assertEqual(len(clusterer.get_clusters()), 3)
+        # adding the same headlines again changes nothing
+        self.assertEqual(clusterer.add([Headline(
+            "NYT", "Stocks rally on strong jobs report")]), set())
+
+    def test02(self):
+        """
+        tests that headlines without shingles are not clustered, and that
+        old headlines are forgotten
+        """
+        clusterer = HeadlineClusterer()
+        clusterer.add([Headline("CNN", ""), Headline("NPR", "The"),
+                       Headline("BBC", "It is a...")])
+        self.assertEqual(clusterer.get_clusters(2), {})
+        self.assertEqual(get_jaccard(set(), set()), 0.0)
+        clusterer = HeadlineClusterer(n_max_entries=3, max_age_seconds=10.0)
+        clusterer.add([Headline("CNN", "Senate passes climate bill")], 100.0)
+        clusterer.add([Headline("NPR", "Senate passes climate bill")], 105.0)
+        self.assertEqual(len(clusterer.get_clusters(2)), 1)
+        # CNN's is too old, so NPR's cluster loses it
+        l_headlines = [Headline("BBC", "Stocks rally"),
+                       Headline("NYT", "Stocks rally")]
+        set_changed = clusterer.add(l_headlines, 112.0)
+        self.assertEqual(len(clusterer), 3)
+        self.assertEqual(len(set_changed), 1)
+        d_clusters = clusterer.get_clusters()
+        self.assertEqual(sorted(len(l_cluster)
+                                for l_cluster in d_clusters.values()),
+                         [1, 2])
+        clusterer.add([Headline("Reuters", "Stocks rally")], 120.0)
+        self.assertEqual(len(clusterer), 3)
+        l_cluster = list(clusterer.get_clusters(3).values())[0]
+        self.assertEqual([headline.source for headline in l_cluster],
+                         ["BBC", "NYT", "Reuters"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+html_table.py - streaming (SAX-style) extraction of one html table, which
+stops parsing as soon as that table is complete
+"""
+
+import html
+import unittest
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
+from bs4.dammit import UnicodeDammit
+from regexp_utils import RE_HTML_TEXT
+
+
+# number of characters fed to the parser at a time
+CHUNK_SIZE = 64*1024
+
+# BeautifulSoup tree builders that may be chosen: html.parser (the default,
+# always there) and the faster lxml, which repairs malformed html
+# differently, so that it may give other tables
+DEFAULT_PARSER_BACKEND = "html.parser"
+PARSER_BACKENDS = (DEFAULT_PARSER_BACKEND, "lxml")
+
+# tags that never have content, as BeautifulSoup (html.parser) treats them
+VOID_TAGS = frozenset((
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed",
+    "frame", "hr", "image", "img", "input", "isindex", "keygen", "link",
+    "menuitem", "meta", "nextid", "param", "source", "spacer", "track",
+    "wbr"))
+
+
+class _TableDone(Exception):
+    """
+    raised by the parser to stop parsing once the table is complete
+    """
+
+
+class TableParser(HTMLParser):
+    """
+    collects the rows of table number 'i_table' (zero indexing, counting
+    nested tables too, in document order) with the same results as
+    BeautifulSoup(html, "html.parser"): every <tr> in the table (nested
+    tables' rows included) is a row, every <td> in a row (nested ones
+    included) is a cell, and the text of a cell is the first run of text
+    in its html (as RE_HTML_TEXT finds it, which in <script> and <style>
+    text stops at the first '<'), with its whitespace collapsed
+    """
+
+    def __init__(self, i_table):
+        """
+        constructor
+        """
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self._i_table = i_table
+        self._n_tables = 0
+        # names of all the open tags, plus (for those in the table) their
+        # row or cell, as BeautifulSoup's tag stack would have them
+        self._l_stack = []
+        # depth of the table in the stack, None before the table starts
+        self._i_table_depth = None
+        # rows in the order they started, each [list of cells, b_closed],
+        # and each cell a one-element list [text or None]
+        self._l_rows = []
+        self._n_rows_done = 0
+        self._l_open_cells = []
+        self._l_data = []
+        self.b_done = False
+
+    def pop_done_rows(self):
+        """
+        returns the list of rows completed (and not returned) so far, in
+        the order they started, as lists of cell texts
+        """
+        l_done = []
+        while self._n_rows_done < len(self._l_rows) and \
+                self._l_rows[self._n_rows_done][1]:
+            l_done.append([cell[0] for cell
+                           in self._l_rows[self._n_rows_done][0]])
+            self._l_rows[self._n_rows_done] = None
+            self._n_rows_done += 1
+        return l_done
+
+    def _flush_data(self):
+        """
+        gives the text just collected to the open cells that have none yet
+        """
+        if self._l_data:
+            s_text = "".join(self._l_data)
+            self._l_data = []
+            if self.cdata_elem is None:
+                s_text = html.escape(s_text, quote=False)
+            else:
+                # <script> and <style> text is written out unescaped, the
+                # text found in it is its first run between a '>' and a '<'
+                # (the tags around it included), if any
+                l_texts = RE_HTML_TEXT.findall(">"+s_text+"<")
+                if not l_texts:
+                    return
+                s_text = l_texts[0]
+            s_text = " ".join(s_text.split())
+            for cell in self._l_open_cells:
+                if cell[0] is None:
+                    cell[0] = s_text
+
+    def handle_starttag(self, tag, attrs):
+        """
+        handles start tags
+        """
+        self._flush_data()
+        if tag in VOID_TAGS:
+            return
+        item = None
+        if self._i_table_depth is None:
+            if tag == "table":
+                if self._n_tables == self._i_table:
+                    self._i_table_depth = len(self._l_stack)
+                self._n_tables += 1
+        elif tag == "tr":
+            item = [[], False]
+            self._l_rows.append(item)
+        elif tag == "td":
+            # cells outside of any row are in no row's findAll('td')
+            l_rows = [row for s_tag, row
+                      in self._l_stack[self._i_table_depth:] if s_tag == "tr"]
+            if l_rows:
+                item = [None]
+                self._l_open_cells.append(item)
+                for row in l_rows:
+                    row[0].append(item)
+        self._l_stack.append((tag, item))
+
+    def handle_startendtag(self, tag, attrs):
+        """
+        handles self-closing tags (<x/>) as a start tag then an end tag
+        """
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        """
+        handles end tags - like BeautifulSoup, closes every tag opened
+        since the most recent open tag with that name, if there is one (an
+        end tag without one is dropped and so does not end the text)
+        """
+        for i_depth in range(len(self._l_stack)-1, -1, -1):
+            if self._l_stack[i_depth][0] == tag:
+                break
+        else:
+            return
+        self._flush_data()
+        while len(self._l_stack) > i_depth:
+            s_tag, item = self._l_stack.pop()
+            if s_tag == "tr" and item is not None:
+                item[1] = True
+            elif s_tag == "td" and item is not None:
+                self._l_open_cells.remove(item)
+                if item[0] is None:
+                    # no text at all, as it fails in get_text_from_html()
+                    raise IndexError("list index out of range")
+        if self._i_table_depth is not None and \
+                len(self._l_stack) <= self._i_table_depth:
+            self.b_done = True
+            raise _TableDone()
+
+    def handle_data(self, data):
+        """
+        collects text - the text of a cell is read from its html, where
+        consecutive text nodes run together
+        """
+        if self._l_open_cells:
+            self._l_data.append(data)
+
+    def handle_comment(self, data):
+        """
+        comments end text nodes
+        """
+        self._flush_data()
+
+    def handle_decl(self, decl):
+        """
+        declarations end text nodes
+        """
+        self._flush_data()
+
+    def handle_pi(self, data):
+        """
+        processing instructions end text nodes
+        """
+        self._flush_data()
+
+    def finish(self):
+        """
+        closes all the tags still open at the end of the document
+        """
+        self.close()
+        self._flush_data()
+        if self._i_table_depth is None:
+            raise IndexError("list index out of range")
+        try:
+            while self._l_stack:
+                self.handle_endtag(self._l_stack[-1][0])
+        except _TableDone:
+            pass
+
+
+def iter_table_rows(s_html, i_table=0):
+    """
+    generator of the rows of table 'i_table' (zero indexing, non-negative)
+    of html 's_html' (a string, bytes or a file), each row a list of cell
+    texts, same as get_table_from_soup() with "html.parser" but parsing
+    only up to the end of that table, a chunk at a time
+    """
+    if hasattr(s_html, "read"):
+        s_html = s_html.read()
+    if isinstance(s_html, bytes):
+        s_html = UnicodeDammit(s_html, is_html=True).unicode_markup
+    parser = TableParser(i_table)
+    try:
+        for i_start in range(0, len(s_html), CHUNK_SIZE):
+            parser.feed(s_html[i_start:i_start+CHUNK_SIZE])
+            for l_row in parser.pop_done_rows():
+                yield l_row
+    except _TableDone:
+        pass
+    if not parser.b_done:
+        parser.finish()
+    for l_row in parser.pop_done_rows():
+        yield l_row
+
+
+def get_parser_backend(s_parser=None):
+    """
+    returns the name of BeautifulSoup tree builder 's_parser' if it is
+    installed, else (or if it is None) DEFAULT_PARSER_BACKEND
+    """
+    if s_parser is not None and builder_registry.lookup(s_parser) is not None:
+        return s_parser
+    return DEFAULT_PARSER_BACKEND
+
+
+def make_soup(s_html, s_parser=None):
+    """
+    returns the BeautifulSoup tree of html 's_html' built with tree builder
+    's_parser' (see get_parser_backend(), None for DEFAULT_PARSER_BACKEND)
+    """
+    return BeautifulSoup(s_html, features=get_parser_backend(s_parser))
+
+
+def get_table_from_soup(s_html, i_table=0, s_parser=None):
+    """
+    the BeautifulSoup way of getting table 'i_table' (any index, negative
+    ones included) of html 's_html', building the tree of the whole page
+    with tree builder 's_parser' - iter_table_rows() agrees with it for
+    "html.parser" (other builders may repair malformed html differently)
+    """
+    soup = make_soup(s_html, s_parser)
+    table = soup('table')[i_table]
+    l_text_rows = []
+    for html_row in table.findAll('tr'):
+        l_text_cells = []
+        for html_cell in html_row.findAll('td'):
+            s_text = RE_HTML_TEXT.findall(str(html_cell))[0]
+            l_text_cells.append(" ".join(s_text.split()))
+        l_text_rows.append(l_text_cells)
+    return l_text_rows
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests that the streaming extractor agrees with BeautifulSoup
+        """
+        l_pages = [
+            "<table><tr><td>a</td><td> b \n c </td></tr></table>",
+            "<p>x</p><table><tr><td>1</td></tr></table>"
+            "<table><tr><td><b>bold</b> rest</td><td>&amp; &lt;</td></tr>"
+            "<tr><td>\n  <i>ws first</i></td></tr></table>",
+            # unclosed cells and rows, nested tables, comments
+            "<table><tr><td>a<td>b<tr><td><!-- c -->c"
+            "<table><tr><td>in</td></tr></table></td></tr></table>",
+            # a div closing the table early, then more tables
+            "<div><table><tr><td>x</div><table><tr><td>y</td></tr></table>",
+            # unclosed table at the end of the document
+            "<table><tr><td>last<td>one",
+            # stray end tags, a cell outside of rows, whitespace-only text
+            "<table><td></td><tr><td>a</p>&amp;</b> b<td>\n <br>c</table>",
+            # script and style text, unescaped, with '<' and '>' in it
+            "<table><tr><td><script>if (a<b) x()</script>t</td>"
+            "<td><style>p>b{}</style>s</td><td><script><</script>u</td>"
+            "</tr></table>",
+            ]
+        for s_page in l_pages:
+            for i_table in range(s_page.count("<table>")):
+                l_rows = get_table_from_soup(s_page, i_table, "html.parser")
+                self.assertEqual(list(iter_table_rows(s_page, i_table)),
+                                 l_rows, (s_page, i_table))
+                self.assertEqual(
+                    list(iter_table_rows(s_page.encode("utf-8"), i_table)),
+                    l_rows)
+
+    def test02(self):
+        """
+        tests errors and early stopping on a long page
+        """
+        with self.assertRaises(IndexError):
+            list(iter_table_rows("<table></table>", 1))
+        with self.assertRaises(IndexError):
+            list(iter_table_rows("<table><tr><td></td></tr></table>"))
+        s_page = "<table><tr><td>first</td></tr></table>" + \
+            "<table><tr><td>x</td></tr></table>"*(CHUNK_SIZE//10)
+        rows = iter_table_rows(s_page)
+        self.assertEqual(next(rows), ["first"])
+
+    def test03(self):
+        """
+        tests parser backend selection
+        """
+        self.assertEqual(get_parser_backend("html.parser"), "html.parser")
+        self.assertEqual(get_parser_backend(), DEFAULT_PARSER_BACKEND)
+        self.assertEqual(get_parser_backend("no-such-parser"),
+                         DEFAULT_PARSER_BACKEND)
+        # well-formed tables come out the same with every installed backend
+        s_page = "<table><tr><td>a</td><td>b c</td></tr></table>"
+        for s_backend in PARSER_BACKENDS:
+            if get_parser_backend(s_backend) == s_backend:
+                self.assertEqual(get_table_from_soup(s_page, -1, s_backend),
+                                 [["a", "b c"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
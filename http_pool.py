@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+http_pool.py - process-wide keep-alive http connection pool, so that
+repeated fetches to the same host reuse their sockets
+"""
+
+import collections
+import threading
+import time
+import unittest
+from urllib import request
+from urllib.parse import urljoin, urlsplit
+import certifi
+import urllib3
+
+
+# default values:
+
+# maximum number of simultaneous connections to any one host
+MAX_CONNECTIONS_PER_HOST = 4
+
+# maximum number of hosts whose connections are kept (least recently used
+# hosts beyond that are dropped)
+MAX_HOSTS = 32
+
+# seconds a host's connections may stay unused before they are closed
+IDLE_TIMEOUT_SECONDS = 60.0
+
+# timeout, in seconds, of connecting and of each read
+HTTP_TIMEOUT_SECONDS = 30.0
+
+# maximum number of redirects followed before declaring failure
+MAX_REDIRECTS = 5
+
+# http codes that come with a 'Location' header to follow
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class _ConnectTimer():
+    """
+    mixin of urllib3 connections that adds up the seconds spent connecting
+    (dns lookup, tcp and tls handshakes), see HttpPool.get()
+    """
+    connect_seconds = 0.0
+
+    def connect(self):
+        """
+        connects, timed
+        """
+        start_time = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            self.connect_seconds += time.perf_counter()-start_time
+
+
+class _TimedHTTPConnection(_ConnectTimer, urllib3.connection.HTTPConnection):
+    """
+    http connection that times its connecting
+    """
+
+
+class _TimedHTTPSConnection(_ConnectTimer,
+                            urllib3.connection.HTTPSConnection):
+    """
+    https connection that times its connecting
+    """
+
+
+def add_timing(d_timings, s_key, value):
+    """
+    adds 'value' to entry 's_key' of dictionary 'd_timings', if it is not
+    None
+    """
+    if d_timings is not None:
+        d_timings[s_key] = d_timings.get(s_key, 0)+value
+
+
+class HttpPool():
+    """
+    keep-alive connection pool with one urllib3 connection pool per host
+    (scheme, host, port), a per-host connection limit and an idle timeout
+    """
+
+    def __init__(self, n_max_per_host=MAX_CONNECTIONS_PER_HOST,
+                 n_max_hosts=MAX_HOSTS, idle_timeout=IDLE_TIMEOUT_SECONDS,
+                 timeout=HTTP_TIMEOUT_SECONDS):
+        """
+        constructor
+        """
+        self._n_max_per_host = n_max_per_host
+        self._n_max_hosts = n_max_hosts
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        # (scheme, host, port) -> [urllib3 pool, time last used]
+        self._d_pools = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_pool(self, s_url):
+        """
+        returns the urllib3 connection pool for the host of url 's_url',
+        creating it if needed and closing pools that have been idle too long
+        """
+        url = urlsplit(s_url)
+        key = (url.scheme, url.hostname, url.port)
+        now = time.time()
+        with self._lock:
+            for old_key in list(self._d_pools):
+                pool, last_used = self._d_pools[old_key]
+                if now-last_used > self._idle_timeout:
+                    del self._d_pools[old_key]
+                    pool.close()
+            if key in self._d_pools:
+                self._d_pools.move_to_end(key)
+                self._d_pools[key][1] = now
+                return self._d_pools[key][0]
+            d_kwargs = {}
+            if url.scheme == "https":
+                d_kwargs["ca_certs"] = certifi.where()
+            pool = urllib3.connection_from_url(
+                s_url, maxsize=self._n_max_per_host, block=True,
+                timeout=self._timeout, retries=False, **d_kwargs)
+            pool.ConnectionCls = _TimedHTTPSConnection \
+                if url.scheme == "https" else _TimedHTTPConnection
+            self._d_pools[key] = [pool, now]
+            while len(self._d_pools) > self._n_max_hosts:
+                self._d_pools.popitem(last=False)[1][0].close()
+            return pool
+
+    def get(self, s_url, d_headers=None, d_timings=None):
+        """
+        http GET of url string 's_url', following redirects, returns tuple
+        (contents, headers, code) like ScraperBase.fetch_html() and raises
+        the same exceptions urllib does (request.HTTPError for http error
+        codes, request.URLError for everything else). if dictionary
+        'd_timings' is given, the seconds spent connecting ("connect", dns
+        included, 0 on a reused connection), from then until the response
+        headers ("ttfb") and reading the body ("download") and the number
+        of bytes read ("bytes") are added to it, redirects included
+        """
+        s_current_url = s_url
+        try:
+            for _ in range(MAX_REDIRECTS+1):
+                url = urlsplit(s_current_url)
+                s_path = url.path or "/"
+                if url.query:
+                    s_path += "?"+url.query
+                start_time = time.perf_counter()
+                response = self._get_pool(s_current_url).urlopen(
+                    "GET", s_path, headers=d_headers, redirect=False,
+                    assert_same_host=False, preload_content=False)
+                headers_time = time.perf_counter()
+                connect_seconds = 0.0
+                if response.connection is not None:
+                    connect_seconds = response.connection.connect_seconds
+                    response.connection.connect_seconds = 0.0
+                add_timing(d_timings, "connect", connect_seconds)
+                add_timing(d_timings, "ttfb",
+                            headers_time-start_time-connect_seconds)
+                code = response.status
+                if code in REDIRECT_CODES and response.headers.get("Location"):
+                    s_current_url = urljoin(s_current_url,
+                                            response.headers["Location"])
+                    response.drain_conn()
+                    continue
+                if code >= 400:
+                    response.drain_conn()
+                    raise request.HTTPError(s_current_url, code,
+                                            response.reason,
+                                            response.headers, None)
+                contents = response.data
+                add_timing(d_timings, "download",
+                            time.perf_counter()-headers_time)
+                add_timing(d_timings, "bytes", response.tell())
+                return contents, response.headers, code
+        except urllib3.exceptions.HTTPError as ex:
+            # report the underlying socket error (e.g. socket.gaierror) when
+            # there is one, like urllib does
+            reason = ex
+            while reason.__context__ is not None and \
+                    isinstance(reason, urllib3.exceptions.HTTPError):
+                reason = reason.__context__
+            raise request.URLError(reason) from ex
+        raise request.URLError("too many redirects from %s" % s_url)
+
+    def clear(self):
+        """
+        closes all the pooled connections
+        """
+        with self._lock:
+            while self._d_pools:
+                self._d_pools.popitem()[1][0].close()
+
+
+_SHARED_POOL = HttpPool()
+
+
+def get_shared_pool():
+    """
+    returns the connection pool shared by all scrapers in this process
+    """
+    return _SHARED_POOL
+
+
+def configure_shared_pool(n_max_per_host=MAX_CONNECTIONS_PER_HOST,
+                          n_max_hosts=MAX_HOSTS,
+                          idle_timeout=IDLE_TIMEOUT_SECONDS,
+                          timeout=HTTP_TIMEOUT_SECONDS):
+    """
+    replaces the shared connection pool with one that has the given pool
+    size and idle timeout (in seconds), closing the old pool's connections
+    """
+    # pylint: disable=global-statement
+    global _SHARED_POOL
+    old_pool = _SHARED_POOL
+    _SHARED_POOL = HttpPool(n_max_per_host, n_max_hosts, idle_timeout,
+                            timeout)
+    old_pool.clear()
+    return _SHARED_POOL
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def setUp(self):
+        """
+        starts a local http server that answers with the client's port
+        number, and with a redirect to that at /moved
+        """
+        from local_server import LocalServer
+        self._server = LocalServer({
+            "/": lambda handler: (
+                200, {}, str(handler.client_address[1]).encode()),
+            "/moved": (301, {"Location": "/"}, b"")})
+        self._s_url = self._server.get_url()
+
+    def tearDown(self):
+        """
+        stops the local http server
+        """
+        self._server.close()
+
+    def test01(self):
+        """
+        tests that repeated fetches reuse one socket
+        """
+        pool = HttpPool()
+        l_ports = [pool.get(self._s_url)[0] for _ in range(5)]
+        l_ports.append(pool.get(self._s_url+"moved")[0])
+        self.assertEqual(len(set(l_ports)), 1)
+        pool.clear()
+
+    def test02(self):
+        """
+        tests that idle connections are closed and errors are converted
+        """
+        pool = HttpPool(idle_timeout=0.0)
+        s_port = pool.get(self._s_url)[0]
+        time.sleep(0.01)
+        self.assertNotEqual(pool.get(self._s_url)[0], s_port)
+        pool.clear()
+        with self.assertRaises(request.URLError) as context:
+            HttpPool(timeout=1.0).get("http://127.0.0.1:1/")
+        self.assertIsInstance(context.exception.reason, ConnectionError)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+local_server.py - configurable local http server for module tests
+"""
+
+import http.server
+import threading
+import unittest
+from urllib import request
+
+
+class LocalServer():
+    """
+    keep-alive http server on a free local port, serving in a daemon thread
+    until close() (or the end of a 'with' block). 'd_routes' maps request
+    paths to responses, each a tuple (code, dictionary of headers, body
+    bytes), a list of such tuples (served one per request, in order) or a
+    function of the request handler returning such a tuple. other paths
+    get a 404. responses with an ETag get a 304 (without body) when the
+    request has it in If-None-Match. the paths requested are appended to
+    'l_paths'
+    """
+
+    def __init__(self, d_routes):
+        """
+        constructor - starts the server
+        """
+        self.l_paths = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """
+            serves the routes of the server
+            """
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                """
+                handles GET requests
+                """
+                server.l_paths.append(self.path)
+                response = d_routes.get(self.path)
+                if response is None:
+                    self.send_error(404)
+                    return
+                if isinstance(response, list):
+                    response = response.pop(0)
+                elif callable(response):
+                    response = response(self)
+                code, d_headers, body = response
+                s_etag = d_headers.get("ETag")
+                if s_etag is not None and \
+                        self.headers.get("If-None-Match") == s_etag:
+                    code, body = 304, b""
+                self.send_response(code)
+                for s_name, s_value in d_headers.items():
+                    self.send_header(s_name, s_value)
+                if code != 304 and "Content-Length" not in d_headers:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                """
+                keeps test output quiet
+                """
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0),
+                                                       Handler)
+        self.s_base_url = "http://127.0.0.1:%d" % self._server.server_port
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_url(self, s_path="/"):
+        """
+        returns the url of path 's_path' on the server
+        """
+        return self.s_base_url+s_path
+
+    def close(self):
+        """
+        stops the server
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests fixed, sequenced and computed responses, 304s and 404s
+        """
+        with LocalServer({
+                "/": (200, {"ETag": '"v1"'}, b"page"),
+                "/seq": [(200, {}, b"1"), (200, {}, b"2")],
+                "/path": lambda handler: (200, {}, handler.path.encode())
+                }) as server:
+            with request.urlopen(server.get_url()) as response:
+                self.assertEqual(response.read(), b"page")
+            with self.assertRaises(request.HTTPError) as context:
+                request.urlopen(request.Request(
+                    server.get_url(), headers={"If-None-Match": '"v1"'}))
+            self.assertEqual(context.exception.code, 304)
+            self.assertEqual([request.urlopen(server.get_url("/seq")).read()
+                              for _ in range(2)], [b"1", b"2"])
+            self.assertEqual(request.urlopen(server.get_url("/path")).read(),
+                             b"/path")
+            with self.assertRaises(request.HTTPError) as context:
+                request.urlopen(server.get_url("/missing"))
+            self.assertEqual(context.exception.code, 404)
+            self.assertEqual(len(server.l_paths), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+log_analyzer.py - verifies the last sessions of many scrapers' logs (each
+log read together with its rotated backups) in parallel processes, and
+adds up their warnings, errors, criticals and durations
+"""
+
+import glob
+import os.path
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pprint import pprint
+from log_utils import LogUtilsError, verify_last_log_session
+
+
+# default values:
+
+# maximum number of processes verifying logs at the same time
+MAX_WORKERS = os.cpu_count() or 1
+
+# glob pattern (relative to this file's directory) of the scraper logs
+SCRAPER_LOGS_GLOB = "scrape_*.log"
+
+# counts added up over all the logs by get_totals()
+COUNT_KEYS = ("lines", "warnings", "errors", "criticals")
+
+
+def analyze_log(s_log_filename):
+    """
+    verifies the last session of log 's_log_filename' and its backups (see
+    log_utils.verify_last_log_session()), returns a dictionary with its
+    "duration" (seconds), "lines", "warnings", "errors" and "criticals",
+    and an "error" message that is None if the session is fine (all the
+    others are None if it is not)
+    """
+    d_result = {"duration": None, "error": None}
+    d_result.update((s_key, None) for s_key in COUNT_KEYS)
+    try:
+        t_session = verify_last_log_session(s_log_filename, b_rotated=True)
+    except (LogUtilsError, OSError, ValueError) as ex:
+        d_result["error"] = str(ex)
+        return d_result
+    d_result["duration"] = t_session[0].total_seconds()
+    d_result.update(zip(COUNT_KEYS, t_session[1:]))
+    return d_result
+
+
+def analyze_logs(l_log_filenames, n_max_workers=MAX_WORKERS, executor=None):
+    """
+    runs analyze_log() over logs 'l_log_filenames' on 'executor' (e.g.
+    scraper_base.get_parse_pool()) or, if None, on a process pool of up to
+    'n_max_workers' processes, returns a dictionary of log filename ->
+    analyze_log() result
+    """
+    if executor is None:
+        n_workers = max(1, min(n_max_workers, len(l_log_filenames)))
+        with ProcessPoolExecutor(n_workers) as executor:
+            return analyze_logs(l_log_filenames, executor=executor)
+    return dict(zip(l_log_filenames,
+                    executor.map(analyze_log, l_log_filenames)))
+
+
+def get_totals(d_results):
+    """
+    returns the analyze_logs() results 'd_results' added up: the "logs"
+    analyzed, the number of "failed" ones, the sums of the COUNT_KEYS and
+    the "duration" (sum) and "max_duration" of the sessions
+    """
+    d_totals = dict((s_key, 0) for s_key in COUNT_KEYS)
+    d_totals.update(logs=len(d_results), failed=0, duration=0.0,
+                    max_duration=0.0)
+    for d_result in d_results.values():
+        if d_result["error"] is not None:
+            d_totals["failed"] += 1
+            continue
+        for s_key in COUNT_KEYS:
+            d_totals[s_key] += d_result[s_key]
+        d_totals["duration"] += d_result["duration"]
+        d_totals["max_duration"] = max(d_totals["max_duration"],
+                                       d_result["duration"])
+    return d_totals
+
+
+def get_scraper_logs(s_dir=None):
+    """
+    returns the sorted list of the scraper logs (scrape_*.log, backups not
+    included) in directory 's_dir' (default: the directory of this file)
+    """
+    if s_dir is None:
+        s_dir = os.path.dirname(os.path.abspath(__file__))
+    return sorted(glob.glob(os.path.join(s_dir, SCRAPER_LOGS_GLOB)))
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    @staticmethod
+    def _write_lines(s_filename, l_lines, start_dtime):
+        """
+        writes log lines (level, message) one second apart from
+        'start_dtime', returns the time after the last one
+        """
+        with open(s_filename, "w") as h_file:
+            for s_level, s_message in l_lines:
+                h_file.write("%s,000 %s %s\n" % (
+                    start_dtime.strftime("%Y-%m-%d %H:%M:%S"), s_level,
+                    s_message))
+                start_dtime += timedelta(seconds=1)
+        return start_dtime
+
+    def test01(self):
+        """
+        tests sessions spanning rotations, and parallel analysis
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_rotated = os.path.join(s_dir, "scrape_a.log")
+            dtime = datetime(2024, 1, 1)
+            # oldest backup first, the session starts in the 2nd backup
+            dtime = self._write_lines(
+                s_rotated+".2", [("WARNING", "START"), ("WARNING", "END"),
+                                 ("WARNING", "START"), ("ERROR", "x")], dtime)
+            dtime = self._write_lines(
+                s_rotated+".1", [("CRITICAL", "y"), ("INFO", "z")], dtime)
+            self._write_lines(
+                s_rotated, [("WARNING", "w"), ("WARNING", "END")], dtime)
+            with self.assertRaises(LogUtilsError):
+                verify_last_log_session(s_rotated)
+            s_plain = os.path.join(s_dir, "scrape_b.log")
+            self._write_lines(s_plain, [("WARNING", "START"),
+                                        ("DEBUG", "d"), ("WARNING", "END")],
+                              dtime)
+            s_broken = os.path.join(s_dir, "scrape_c.log")
+            self._write_lines(s_broken, [("WARNING", "START")], dtime)
+            l_logs = get_scraper_logs(s_dir)
+            self.assertEqual(l_logs, [s_rotated, s_plain, s_broken])
+            d_results = analyze_logs(l_logs, 2)
+            self.assertEqual(d_results[s_rotated], {
+                "duration": 5.0, "lines": 6, "warnings": 3, "errors": 1,
+                "criticals": 1, "error": None})
+            self.assertEqual(d_results[s_plain]["duration"], 2.0)
+            self.assertIn("END", d_results[s_broken]["error"])
+            self.assertEqual(get_totals(d_results), {
+                "logs": 3, "failed": 1, "lines": 9, "warnings": 5,
+                "errors": 1, "criticals": 1, "duration": 7.0,
+                "max_duration": 5.0})
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "run":
+        D_RESULTS = analyze_logs(sys.argv[2:] or get_scraper_logs())
+        pprint(D_RESULTS)
+        pprint(get_totals(D_RESULTS))
+    else:
+        unittest.main()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+log_range.py - reads the lines of a log file between two times without
+walking the whole file: the start is found by binary search over byte
+offsets (log lines start with a sortable timestamp), optionally helped by
+a sparse sidecar index of offsets
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import unittest
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from log_utils import LogUtilsError, get_log_line_components
+
+
+# default values:
+
+# bytes of log between two entries of a sidecar index
+INDEX_STRIDE = 1024*1024
+
+# suffix of the sidecar index file of a log file
+INDEX_SUFFIX = ".idx"
+
+# sidecar index file header: magic, log size when indexed, hash of the
+# log's first bytes (to tell a rotated log from one that grew), stride
+INDEX_HEADER_FORMAT = "<8sQ8sQ"
+
+INDEX_MAGIC = b"LOGIDX1\n"
+
+# sidecar index entry: timestamp (as in log lines) and line offset
+INDEX_ENTRY_FORMAT = "<19sQ"
+
+# number of first bytes of the log whose hash the index keeps
+INDEX_HASHED_BYTES = 4096
+
+# format of the timestamp at the start of text log lines
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# start of json log lines, just before their timestamp (see log_utils)
+JSON_TIME_PREFIX = b'{"time": "'
+
+TIME_LENGTH = 19
+
+
+def get_time_key(when):
+    """
+    returns the timestamp (bytes) that log lines of datetime 'when' (or of
+    a 'YYYY-mm-dd HH:MM:SS' string) start with
+    """
+    if isinstance(when, datetime):
+        return when.strftime(TIME_FORMAT).encode("ascii")
+    return str(when)[:TIME_LENGTH].encode("ascii")
+
+
+def get_line_time_key(s_line):
+    """
+    returns the timestamp (bytes) of log line 's_line' (bytes, text or
+    json), or None if it has none (e.g. the later lines of a multi-line
+    message)
+    """
+    if s_line[:1] == b"{":
+        if not s_line.startswith(JSON_TIME_PREFIX):
+            return None
+        s_line = s_line[len(JSON_TIME_PREFIX):]
+    s_key = s_line[:TIME_LENGTH]
+    if len(s_key) < TIME_LENGTH or not s_key[:4].isdigit() or \
+            s_key[4:5] != b"-" or s_key[10:11] != b" ":
+        return None
+    return bytes(s_key)
+
+
+class LogRangeReader():
+    """
+    reads the lines of log file 's_log_filename' (text or json lines, see
+    log_utils.Logger) between two times, finding the first by binary search
+    over byte offsets. if 'b_index' is True, a sparse index of the offset
+    of a line every 'n_index_stride' bytes is kept in a sidecar file (and
+    updated when the log grows, rebuilt when it is rotated), so repeated
+    queries need only a few probes of the log
+    """
+
+    def __init__(self, s_log_filename, b_index=False,
+                 n_index_stride=INDEX_STRIDE):
+        """
+        constructor
+        """
+        self._s_log_filename = s_log_filename
+        self._n_index_stride = n_index_stride
+        self._mmap = None
+        self._n_size = 0
+        with open(s_log_filename, "rb") as h_file:
+            self._n_size = os.fstat(h_file.fileno()).st_size
+            if self._n_size > 0:
+                self._mmap = mmap.mmap(h_file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+        # sorted timestamps and line offsets of the sparse index, if any
+        self._l_index_keys = []
+        self._l_index_offsets = []
+        if b_index and self._mmap is not None:
+            self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        unmaps the log file
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _get_line_start(self, n_offset):
+        """
+        returns the offset of the first line that starts at or after byte
+        offset 'n_offset' (the file size if there is none)
+        """
+        if n_offset <= 0:
+            return 0
+        n_newline = self._mmap.find(b"\n", n_offset-1)
+        return self._n_size if n_newline < 0 else n_newline+1
+
+    def _get_line_end(self, n_offset):
+        """
+        returns the offset of the end (newline excluded) of the line that
+        starts at byte offset 'n_offset'
+        """
+        n_newline = self._mmap.find(b"\n", n_offset)
+        return self._n_size if n_newline < 0 else n_newline
+
+    def _get_time_at(self, n_offset, n_limit=None):
+        """
+        returns tuple (timestamp, offset) of the first line with a
+        timestamp that starts at or after line start 'n_offset' and before
+        'n_limit' (default: the end of the file), (None, n_limit) if none
+        """
+        if n_limit is None:
+            n_limit = self._n_size
+        while n_offset < n_limit:
+            n_end = self._get_line_end(n_offset)
+            s_key = get_line_time_key(
+                self._mmap[n_offset:min(n_end, n_offset+len(
+                    JSON_TIME_PREFIX)+TIME_LENGTH)])
+            if s_key is not None:
+                return s_key, n_offset
+            n_offset = n_end+1
+        return None, n_limit
+
+    def find_offset(self, start):
+        """
+        returns the offset of the first line whose time is 'start' (a
+        datetime or a 'YYYY-mm-dd HH:MM:SS' string) or later, the file size
+        if there is none
+        """
+        if self._mmap is None:
+            return 0
+        s_target = get_time_key(start)
+        n_low, n_high = 0, self._n_size
+        if self._l_index_keys:
+            i_entry = bisect_left(self._l_index_keys, s_target)
+            if i_entry > 0:
+                n_low = self._l_index_offsets[i_entry-1]
+            if i_entry < len(self._l_index_offsets):
+                n_high = self._l_index_offsets[i_entry]
+        # n_low is a line start before the first line at or after 's_target'
+        # (or that line), n_high a line start at or after it (or the end)
+        while n_low < n_high:
+            n_middle = self._get_line_start((n_low+n_high)//2)
+            if n_middle >= n_high:
+                break
+            s_key, n_line = self._get_time_at(n_middle, n_high)
+            if s_key is None or s_key >= s_target:
+                n_high = n_middle
+            else:
+                n_low = self._get_line_start(n_line+1)
+        # the few lines left in between
+        while n_low < n_high:
+            s_key, n_line = self._get_time_at(n_low, n_high)
+            if s_key is None or s_key >= s_target:
+                return n_line
+            n_low = self._get_line_start(n_line+1)
+        return n_high
+
+    def iter_lines(self, start, end=None):
+        """
+        generator of the lines (strings, without newlines) from the first
+        one whose time is 'start' or later, up to (not including) the first
+        one whose time is 'end' or later - 'start' and 'end' are datetimes
+        or 'YYYY-mm-dd HH:MM:SS' strings, 'end' None for the end of the file
+        """
+        if self._mmap is None:
+            return
+        s_end = None if end is None else get_time_key(end)
+        n_offset = self.find_offset(start)
+        while n_offset < self._n_size:
+            n_end = self._get_line_end(n_offset)
+            s_line = self._mmap[n_offset:n_end]
+            if s_end is not None:
+                s_key = get_line_time_key(s_line)
+                if s_key is not None and s_key >= s_end:
+                    return
+            yield str(s_line, "utf-8", "replace").rstrip("\r")
+            n_offset = n_end+1
+
+    def iter_records(self, start, end=None):
+        """
+        same as iter_lines() but generates (message, datetime, log level)
+        tuples like log_utils.get_log_line_components(), the lines of a
+        multi-line message joined back into it
+        """
+        record = None
+        for s_line in self.iter_lines(start, end):
+            try:
+                next_record = get_log_line_components(s_line)
+            except LogUtilsError:
+                if record is None:
+                    continue
+                record = (record[0]+"\n"+s_line, record[1], record[2])
+                continue
+            if record is not None:
+                yield record
+            record = next_record
+        if record is not None:
+            yield record
+
+    def get_index_filename(self):
+        """
+        returns the name of the sidecar index file of the log
+        """
+        return self._s_log_filename+INDEX_SUFFIX
+
+    def _get_head_hash(self):
+        """
+        returns the hash of the first bytes of the log
+        """
+        return hashlib.blake2b(self._mmap[:INDEX_HASHED_BYTES],
+                               digest_size=8).digest()
+
+    def _load_index(self):
+        """
+        reads the sidecar index, rebuilding it if the log was rotated and
+        extending it if the log grew
+        """
+        s_head_hash = self._get_head_hash()
+        n_indexed_size = 0
+        try:
+            with open(self.get_index_filename(), "rb") as h_file:
+                s_data = h_file.read()
+            n_header_size = struct.calcsize(INDEX_HEADER_FORMAT)
+            s_magic, n_size, s_hash, n_stride = struct.unpack(
+                INDEX_HEADER_FORMAT, s_data[:n_header_size])
+            if s_magic == INDEX_MAGIC and s_hash == s_head_hash and \
+                    n_stride == self._n_index_stride and \
+                    n_size <= self._n_size:
+                n_indexed_size = n_size
+                n_entry_size = struct.calcsize(INDEX_ENTRY_FORMAT)
+                s_entries = s_data[n_header_size:]
+                for s_key, n_offset in struct.iter_unpack(
+                        INDEX_ENTRY_FORMAT,
+                        s_entries[:len(s_entries)-len(s_entries) %
+                                  n_entry_size]):
+                    self._l_index_keys.append(s_key)
+                    self._l_index_offsets.append(n_offset)
+        except (OSError, struct.error):
+            pass
+        if n_indexed_size < self._n_size:
+            self._extend_index(n_indexed_size)
+            self._save_index(s_head_hash)
+
+    def _extend_index(self, n_indexed_size):
+        """
+        adds the index entries of the log after 'n_indexed_size' bytes
+        """
+        n_stride = self._n_index_stride
+        # the last indexed line may have been incomplete, probe again from it
+        while self._l_index_offsets and \
+                self._l_index_offsets[-1] >= n_indexed_size-n_stride:
+            self._l_index_keys.pop()
+            self._l_index_offsets.pop()
+        n_position = self._l_index_offsets[-1]+n_stride \
+            if self._l_index_offsets else 0
+        while n_position < self._n_size:
+            s_key, n_line = self._get_time_at(
+                self._get_line_start(n_position))
+            if s_key is None:
+                break
+            if self._get_line_end(n_line) >= self._n_size:
+                # an incomplete last line may still be written
+                break
+            if not self._l_index_offsets or \
+                    n_line > self._l_index_offsets[-1]:
+                self._l_index_keys.append(s_key)
+                self._l_index_offsets.append(n_line)
+            n_position = max(n_position+n_stride, n_line+1)
+
+    def _save_index(self, s_head_hash):
+        """
+        writes the sidecar index, atomically
+        """
+        s_filename = self.get_index_filename()
+        s_tmp_filename = s_filename+".tmp"
+        try:
+            with open(s_tmp_filename, "wb") as h_file:
+                h_file.write(struct.pack(INDEX_HEADER_FORMAT, INDEX_MAGIC,
+                                         self._n_size, s_head_hash,
+                                         self._n_index_stride))
+                for s_key, n_offset in zip(self._l_index_keys,
+                                           self._l_index_offsets):
+                    h_file.write(struct.pack(INDEX_ENTRY_FORMAT, s_key,
+                                             n_offset))
+            os.replace(s_tmp_filename, s_filename)
+        except OSError:
+            # the index is only an optimization (e.g. a read-only log dir)
+            pass
+
+
+def get_log_range(s_log_filename, start, end=None, b_index=False):
+    """
+    returns the list of (message, datetime, log level) records of log file
+    's_log_filename' from time 'start' up to (not including) time 'end',
+    see LogRangeReader
+    """
+    with LogRangeReader(s_log_filename, b_index) as reader:
+        return list(reader.iter_records(start, end))
+
+
+def verify_log_range(s_log_filename, start, end=None, b_index=False):
+    """
+    same as log_utils.verify_last_log_session() but over the records from
+    time 'start' up to (not including) time 'end': returns tuple (duration,
+    number of records, warnings, errors, criticals), duration None if
+    there are no records
+    """
+    n_lines = n_warnings = n_errors = n_criticals = 0
+    start_dtime = end_dtime = None
+    with LogRangeReader(s_log_filename, b_index) as reader:
+        for _, dtime, s_log_type in reader.iter_records(start, end):
+            if start_dtime is None:
+                start_dtime = dtime
+            end_dtime = dtime
+            n_lines += 1
+            if s_log_type == "W":
+                n_warnings += 1
+            elif s_log_type == "E":
+                n_errors += 1
+            elif s_log_type == "C":
+                n_criticals += 1
+    delta_time = None if start_dtime is None else end_dtime-start_dtime
+    return delta_time, n_lines, n_warnings, n_errors, n_criticals
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    @staticmethod
+    def _write_log(s_log_filename, n_seconds, b_json=False):
+        """
+        writes a log with a line every second (two every tenth second, the
+        second one of them a multi-line error) starting at midnight
+        """
+        base_dtime = datetime(2024, 1, 1)
+        with open(s_log_filename, "w") as h_file:
+            for i_second in range(n_seconds):
+                s_time = (base_dtime+timedelta(seconds=i_second)).strftime(
+                    TIME_FORMAT)+",000"
+                if b_json:
+                    h_file.write('{"time": "%s", "level": "INFO", '
+                                 '"message": "line %d"}\n' %
+                                 (s_time, i_second))
+                else:
+                    h_file.write("%s INFO line %d\n" % (s_time, i_second))
+                if i_second % 10 == 0:
+                    h_file.write("%s ERROR failed %d\nsecond line\n" %
+                                 (s_time, i_second))
+
+    def test01(self):
+        """
+        tests range queries against a linear scan, with and without index
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_log_filename = os.path.join(s_dir, "range.log")
+            self._write_log(s_log_filename, 5000)
+            l_all = get_log_range(s_log_filename, "2000-01-01 00:00:00")
+            self.assertEqual(len(l_all), 5500)
+            self.assertEqual(l_all[1][0], "failed 0\nsecond line")
+            for b_index in (False, True):
+                with LogRangeReader(s_log_filename, b_index,
+                                    n_index_stride=4096) as reader:
+                    for s_start, s_end in (
+                            ("2024-01-01 00:10:00", "2024-01-01 00:20:00"),
+                            ("2024-01-01 00:00:00", "2024-01-01 00:00:01"),
+                            ("2023-12-31 23:00:00", "2024-01-01 00:00:00"),
+                            ("2024-01-01 01:23:19", None),
+                            ("2024-01-01 05:00:00", None)):
+                        l_expected = [
+                            record for record in l_all
+                            if get_time_key(record[1]) >= s_start.encode()
+                            and (s_end is None or get_time_key(record[1]) <
+                                 s_end.encode())]
+                        self.assertEqual(
+                            list(reader.iter_records(s_start, s_end)),
+                            l_expected, (s_start, s_end))
+            self.assertTrue(os.path.exists(s_log_filename+INDEX_SUFFIX))
+            self.assertEqual(verify_log_range(
+                s_log_filename, "2024-01-01 00:10:00",
+                datetime(2024, 1, 1, 0, 20))[1:], (660, 0, 60, 0))
+
+    def test02(self):
+        """
+        tests json lines and an index that follows the log's growth and
+        rotation
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_log_filename = os.path.join(s_dir, "range.log")
+            self._write_log(s_log_filename, 100, b_json=True)
+            self.assertEqual(len(get_log_range(
+                s_log_filename, "2024-01-01 00:01:00", b_index=True)), 44)
+            with open(s_log_filename, "a") as h_file:
+                h_file.write('{"time": "2024-01-01 00:05:00,000", '
+                             '"level": "WARNING", "message": "late"}\n')
+            self.assertEqual(get_log_range(
+                s_log_filename, "2024-01-01 00:02:00", b_index=True)[0][0],
+                             "late")
+            self._write_log(s_log_filename, 10)
+            self.assertEqual(len(get_log_range(
+                s_log_filename, "2024-01-01 00:00:05", b_index=True)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,14 +3,51 @@
 """
 log_utils.py - wraps python loggging facility for simple usage
 """
+import atexit
+import json
+from array import array
 import unittest
 import logging.handlers
 import os.path
-from datetime import datetime
-from file_utils import ReverseFileIterator
+import queue
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from file_utils import MmapReverseFileIterator
 
 DEFAULT_LOG_LEVEL = "DEBUG"
 
+# number of backups we keep of log files when they get recycled (name.log.1
+# is the most recent one, name.log.9 the oldest one)
+MAX_LOG_FILE_BACKUPS = 9
+
+# fields of log records (given with extra=) that json log lines keep
+JSON_LOG_FIELDS = ("scraper", "url", "duration", "bytes", "attempt")
+
+# seconds LogFollower.follow() waits before checking the log again when it
+# had no new lines
+FOLLOW_POLL_SECONDS = 1.0
+
+# number of bytes at the start of a followed log that LogFollower.poll()
+# compares with those it saw before, to tell a log truncated and written
+# again past the old offset from one that only grew (the first line starts
+# with its time, to the millisecond)
+FOLLOW_HEAD_BYTES = 64
+
+# log level character -> offset of the message in text log lines
+_D_MESSAGE_OFFSETS = {"D": 30, "I": 29, "W": 32, "E": 30, "C": 33}
+
+# 'YYYY-mm-dd' -> seconds from 1970-01-01 to that date, see parse_log_lines()
+_D_DATE_SECONDS = {}
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# log filename -> QueueListener writing the records of that queued log
+_D_LISTENERS = {}
+
+_LISTENERS_LOCK = threading.Lock()
+
 # anything going wrong in this module
 class LogUtilsError(Exception):
     """
@@ -29,21 +66,86 @@ class LogUtilsError(Exception):
         """
         return repr(self.value)
 
+class _LazyMessage():
+    """
+    log message that is the result of a callable, called only when the
+    message is written (logging makes a string of messages only then), and
+    only once (the rotating file handler formats each record twice)
+    """
+    __slots__ = ("_get_message", "_s_message")
+
+    def __init__(self, get_message):
+        """
+        constructor
+        """
+        self._get_message = get_message
+        self._s_message = None
+
+    def __str__(self):
+        if self._s_message is None:
+            self._s_message = str(self._get_message())
+        return self._s_message
+
+
+def get_message(message, args=()):
+    """
+    returns log message 'message' (a format string, or a callable returning
+    one) formatted with the tuple of arguments 'args', as logging does
+    """
+    if callable(message):
+        message = message()
+    return str(message) % args if args else str(message)
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    formats log records as json objects, one per line: "time" (as in text
+    log lines, and first, so that lines still start with it), "level",
+    "message" and those of the JSON_LOG_FIELDS the record has
+    """
+
+    def format(self, record):
+        """
+        returns the json line of 'record'
+        """
+        d_line = {"time": self.formatTime(record),
+                  "level": record.levelname,
+                  "message": record.getMessage()}
+        for s_field in JSON_LOG_FIELDS:
+            value = record.__dict__.get(s_field)
+            if value is not None:
+                d_line[s_field] = value
+        if record.exc_info:
+            d_line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(d_line, default=str)
+
 # Logger class, features:
 # 1) the caller's file path and line number are printed with each message
 # 2) multiple instantiations of this object are possible in the same program
 #    wherever you need to log, instantiate a Logger object and call its
 #    debug() or info() or warning() or critical() function with a string
+# 3) messages are formatted only if their level is logged: pass the format
+#    string and its arguments separately, or a callable that returns the
+#    message
 #
 # Example usage:
 #    >>> my_log_utils = Logger("log_filename", "DEBUG")
 #    >>> my_log_utils.debug("oh no, what have i done!")
 # or
 #    >>> my_log_utils.info("oh no, what have i done!")
+#    >>> my_log_utils.debug("url=%s, duration=%f", s_url, duration)
+#    >>> my_log_utils.debug(lambda: "entries: %s" % get_entries())
+#    >>> my_log_utils.debug("done", extra={"url": s_url, "duration": 0.5})
 # and so on..
 #
 # 1st argument to Logger(): the filename to which logging occurs
 # 2nd argument to Logger: the log level above which we do not log
+# 3rd argument to Logger: if True, log calls only format their message and
+#    enqueue the record, a background thread formats the line (time, level
+#    or json) and writes (and rotates) the file - by default True if
+#    the LOG_QUEUE environment variable is set to anything but ""
+# 4th argument to Logger: if True, lines are json objects (with the
+#    JSON_LOG_FIELDS given as extra=) - by default True if the LOG_JSON
+#    environment variable is set to anything but ""
 
 class Logger():
     """
@@ -55,21 +157,35 @@ class Logger():
     useful text analysis tools embedded.
     """
 
-    def __init__(self, s_log_filename, s_log_level=os.environ.get('LOG_LEVEL')):
+    def __init__(self, s_log_filename, s_log_level=os.environ.get('LOG_LEVEL'),
+                 b_queued=None, b_json=None):
         """
         Constructor: initializes logging
         1st argument: the filename to which logging occurs
         2nd argument: the log level above which we do not log
         (hierarchy is debug->info->warning->error->critical)
+        3rd argument: whether a background thread does the file writes
+        (None: according to the LOG_QUEUE environment variable)
+        4th argument: whether lines are json objects (None: according to the
+        LOG_JSON environment variable)
+        the last two only count for the first Logger of a file, later ones
+        share its setup
         """
         if not s_log_level:
             s_log_level = DEFAULT_LOG_LEVEL
+        if b_queued is None:
+            b_queued = bool(os.environ.get("LOG_QUEUE"))
+        if b_json is None:
+            b_json = bool(os.environ.get("LOG_JSON"))
 
-        self._log = self._init_logging(s_log_filename, s_log_level)
+        self._s_log_filename = s_log_filename
+        self._log = self._init_logging(s_log_filename, s_log_level, b_queued,
+                                       b_json)
 
 
     @staticmethod
-    def _init_logging(s_log_filename, s_log_level):
+    def _init_logging(s_log_filename, s_log_level, b_queued=False,
+                      b_json=False):
         """
         Set up the member variable self._log for logging use.
         """
@@ -90,7 +206,7 @@ class Logger():
         # number of backups we keep of log files when they get recycled when
         # they reach MAX_LOG_FILE_SIZE number of bytes, not relevant to html
         # logging
-        max_log_file_backups = 9
+        max_log_file_backups = MAX_LOG_FILE_BACKUPS
 
         log_utils.propagate = False
 
@@ -109,13 +225,52 @@ class Logger():
             maxBytes=max_log_file_size,
             backupCount=max_log_file_backups)
 
-        formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+        if b_json:
+            formatter = JsonLinesFormatter()
+        else:
+            formatter = logging.Formatter(
+                "%(asctime)s %(levelname)s %(message)s")
 
         handler.setFormatter(formatter)
+
+        if b_queued:
+            # the caller still formats the message (QueueHandler.prepare()
+            # merges the arguments into it, so that later changes to them
+            # do not show), the listener's thread formats the line with the
+            # time and level (or as json), writes it and rotates the file
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, handler)
+            with _LISTENERS_LOCK:
+                _D_LISTENERS[s_log_filename] = listener
+            listener.start()
+            handler = logging.handlers.QueueHandler(log_queue)
+
         log_utils.addHandler(handler)
 
         return log_utils
 
+    def flush(self):
+        """
+        returns once every message logged so far is written to the file
+        """
+        with _LISTENERS_LOCK:
+            listener = _D_LISTENERS.get(self._s_log_filename)
+            if listener is not None:
+                # stopping waits for the queue to be drained
+                listener.stop()
+                listener.start()
+        for handler in self._log.handlers:
+            handler.flush()
+
+    def is_enabled_for(self, s_log_level):
+        """
+        returns True if messages of level 's_log_level' ("DEBUG", "INFO",
+        ...) are logged, so that callers can skip building what only such
+        messages need
+        """
+        return self._log.isEnabledFor(
+            logging.getLevelName(s_log_level.upper()))
+
     # NOTE: the functions below have repeated code - it has to remain
     # this way, because when the repeated code (first four lines of
     # each of the functions below) is put in its own function, it
@@ -123,86 +278,128 @@ class Logger():
     # instead of returning the file which called this module, it returns
     # this module's file.
 
-    def debug(self, s_message):
+    def debug(self, s_message, *args, extra=None):
         """
-        write debug message
+        write debug message - 's_message' % 'args', formatted only if debug
+        messages are logged ('s_message' may be a callable returning it),
+        'extra' is a dictionary of JSON_LOG_FIELDS for json log lines
         """
-        self._log.debug(s_message)
+        if callable(s_message):
+            s_message = _LazyMessage(s_message)
+        self._log.debug(s_message, *args, extra=extra)
 
-    def info(self, s_message):
+    def info(self, s_message, *args, extra=None):
         """
-        write info message
+        write info message - 's_message' % 'args', formatted only if info
+        messages are logged ('s_message' may be a callable returning it),
+        'extra' is a dictionary of JSON_LOG_FIELDS for json log lines
         """
-        self._log.info(s_message)
+        if callable(s_message):
+            s_message = _LazyMessage(s_message)
+        self._log.info(s_message, *args, extra=extra)
 
-    def warning(self, s_message):
+    def warning(self, s_message, *args, extra=None):
         """
-        write warning message
+        write warning message - 's_message' % 'args', formatted only if warning
+        messages are logged ('s_message' may be a callable returning it),
+        'extra' is a dictionary of JSON_LOG_FIELDS for json log lines
         """
-        self._log.warning(s_message)
+        if callable(s_message):
+            s_message = _LazyMessage(s_message)
+        self._log.warning(s_message, *args, extra=extra)
 
-    def error(self, s_message):
+    def error(self, s_message, *args, extra=None):
         """
-        write error message
+        write error message - 's_message' % 'args', formatted only if error
+        messages are logged ('s_message' may be a callable returning it),
+        'extra' is a dictionary of JSON_LOG_FIELDS for json log lines
         """
-        self._log.error(s_message)
+        if callable(s_message):
+            s_message = _LazyMessage(s_message)
+        self._log.error(s_message, *args, extra=extra)
 
 
-    def critical(self, s_message):
+    def critical(self, s_message, *args, extra=None):
         """
-        write critical message
+        write critical message - 's_message' % 'args', formatted only if
+        critical messages are logged ('s_message' may be a callable
+        returning it), 'extra' is a dictionary of JSON_LOG_FIELDS for json
+        log lines
         """
-        self._log.critical(s_message)
+        if callable(s_message):
+            s_message = _LazyMessage(s_message)
+        self._log.critical(s_message, *args, extra=extra)
 
-def log_warning(log_obj, s_phrase):
+@atexit.register
+def stop_queue_listeners(l_log_filenames=None):
+    """
+    writes the records still queued by the queued Loggers of the log files
+    in list 'l_log_filenames' (default: all of them) and stops their
+    background threads (called at exit, after which they log synchronously)
+    """
+    with _LISTENERS_LOCK:
+        for s_log_filename, listener in list(_D_LISTENERS.items()):
+            if l_log_filenames is not None and \
+                    s_log_filename not in l_log_filenames:
+                continue
+            listener.stop()
+            del _D_LISTENERS[s_log_filename]
+            log_utils = logging.getLogger(s_log_filename)
+            for handler in list(log_utils.handlers):
+                if isinstance(handler, logging.handlers.QueueHandler):
+                    log_utils.removeHandler(handler)
+                    for file_handler in listener.handlers:
+                        log_utils.addHandler(file_handler)
+
+def log_warning(log_obj, s_phrase, *args):
     """
     helper function to know if to log to a file or stdout based on 'log_obj'
-    being None or not
+    being None or not ('args' are formatted into 's_phrase' as Logger does)
     """
     if log_obj is None:
-        print(s_phrase)
+        print(get_message(s_phrase, args))
     else:
-        log_obj.warning(s_phrase)
+        log_obj.warning(s_phrase, *args)
 
-def log_info(log_obj, s_phrase):
+def log_info(log_obj, s_phrase, *args):
     """
     helper function to know if to log to a file or stdout based on 'log_obj'
-    being None or not
+    being None or not ('args' are formatted into 's_phrase' as Logger does)
     """
     if log_obj is None:
-        print(s_phrase)
+        print(get_message(s_phrase, args))
     else:
-        log_obj.info(s_phrase)
+        log_obj.info(s_phrase, *args)
 
-def log_critical(log_obj, s_phrase):
+def log_critical(log_obj, s_phrase, *args):
     """
     helper function to know if to log to a file or stdout based on 'log_obj'
-    being None or not
+    being None or not ('args' are formatted into 's_phrase' as Logger does)
     """
     if log_obj is None:
-        print(s_phrase)
+        print(get_message(s_phrase, args))
     else:
-        log_obj.critical(s_phrase)
+        log_obj.critical(s_phrase, *args)
 
-def log_error(log_obj, s_phrase):
+def log_error(log_obj, s_phrase, *args):
     """
     helper function to know if to log to a file or stdout based on 'log_obj'
-    being None or not
+    being None or not ('args' are formatted into 's_phrase' as Logger does)
     """
     if log_obj is None:
-        print(s_phrase)
+        print(get_message(s_phrase, args))
     else:
-        log_obj.error(s_phrase)
+        log_obj.error(s_phrase, *args)
 
-def log_debug(log_obj, s_phrase):
+def log_debug(log_obj, s_phrase, *args):
     """
     helper function to know if to log to a file or stdout based on 'log_obj'
-    being None or not
+    being None or not ('args' are formatted into 's_phrase' as Logger does)
     """
     if log_obj is None:
-        print(s_phrase)
+        print(get_message(s_phrase, args))
     else:
-        log_obj.debug(s_phrase)
+        log_obj.debug(s_phrase, *args)
 
 def init_logging(log_obj, s_name="unnamed"):
     """
@@ -224,14 +421,46 @@ def init_logging(log_obj, s_name="unnamed"):
 
     return Logger(os.path.join(s_log_dir, s_date+"_"+s_name+".log"))
 
+def get_log_line_fields(s_line):
+    """
+    returns the dictionary of the fields of json log line 's_line' (see
+    JsonLinesFormatter), or, for a text log line, of its "time", "level"
+    and "message"
+    """
+    if s_line[:1] == "{":
+        try:
+            d_fields = json.loads(s_line)
+        except ValueError:
+            raise LogUtilsError("Not a proper json log line!")
+        if not isinstance(d_fields, dict) or "time" not in d_fields or \
+                "level" not in d_fields:
+            raise LogUtilsError("Not a proper json log line!")
+        return d_fields
+    s_message = get_log_line_components(s_line)[0]
+    s_level = s_line[24:s_line.find(" ", 24)]
+    return {"time": s_line[0:23], "level": s_level, "message": s_message}
+
 def get_log_line_components(s_line):
     """
     given a log line, returns its datetime as a datetime object
     and its log level as a string and the message itself as another
     string - those three are returned as a tuple.  the log level
     is returned as a single character (first character of the level's
-    name, capitalized).
+    name, capitalized).  json log lines (see JsonLinesFormatter) are
+    read too.
     """
+    if s_line[:1] == "{":
+        d_fields = get_log_line_fields(s_line)
+        try:
+            dtime = datetime.strptime(d_fields["time"][0:19],
+                                      "%Y-%m-%d %H:%M:%S")
+        except (ValueError, TypeError):
+            raise LogUtilsError("Not a proper date/time in json log line!")
+        log_level = str(d_fields["level"])[:1]
+        if log_level not in ("D", "I", "W", "E", "C"):
+            raise LogUtilsError("log-level not in log line!")
+        return str(d_fields.get("message", "")), dtime, log_level
+
     try:
         dtime = datetime.strptime(s_line[0:19], "%Y-%m-%d %H:%M:%S")
     except ValueError:
@@ -258,6 +487,92 @@ def get_log_line_components(s_line):
     return s_line, dtime, log_level
 
 
+def _get_date_seconds(s_date):
+    """
+    returns the seconds from 1970-01-01 to date string 's_date'
+    ('YYYY-mm-dd'), computed once per date
+    """
+    n_seconds = _D_DATE_SECONDS.get(s_date)
+    if n_seconds is None:
+        if s_date[4:5] != "-" or s_date[7:8] != "-":
+            raise ValueError(s_date)
+        n_seconds = (date(int(s_date[0:4]), int(s_date[5:7]),
+                          int(s_date[8:10])).toordinal()-_EPOCH_ORDINAL)*86400
+        _D_DATE_SECONDS[s_date] = n_seconds
+    return n_seconds
+
+def parse_log_lines(l_lines, b_strict=True):
+    """
+    parses the log lines of list 'l_lines' (text or json) at once, returns
+    three parallel arrays: their times (seconds from 1970-01-01 00:00:00 by
+    the log's clock, see get_log_line_datetime()), their log levels (the
+    code of the level's first character, e.g. ord("E")) and the offsets of
+    their messages in the lines (-1 for json lines, see
+    get_log_line_message()). the fixed-width timestamps of text lines are
+    decoded by slicing, with the dates looked up in a table, instead of
+    by strptime(). raises LogUtilsError for lines that are not log lines,
+    like get_log_line_components() does, or, if not 'b_strict', gives them
+    time, log level and offset 0
+    """
+    n_lines = len(l_lines)
+    a_times = array("q", [0])*n_lines
+    a_levels = array("B", [0])*n_lines
+    a_offsets = array("l", [0])*n_lines
+    d_offsets = _D_MESSAGE_OFFSETS
+    for i_line, s_line in enumerate(l_lines):
+        try:
+            if s_line[:1] == "{":
+                d_fields = get_log_line_fields(s_line)
+                s_time = str(d_fields["time"])
+                log_level = str(d_fields["level"])[:1]
+                n_offset = -1
+            else:
+                s_time = s_line
+                log_level = s_line[24:25]
+                n_offset = d_offsets.get(log_level)
+            if s_time[10:11] != " " or s_time[13:14] != ":" or \
+                    s_time[16:17] != ":":
+                raise ValueError(s_time)
+            n_hour = int(s_time[11:13])
+            n_minute = int(s_time[14:16])
+            n_second = int(s_time[17:19])
+            if n_hour > 23 or n_minute > 59 or n_second > 61:
+                raise ValueError(s_time)
+            n_time = _get_date_seconds(s_time[0:10]) + \
+                n_hour*3600+n_minute*60+n_second
+        except ValueError:
+            if b_strict:
+                raise LogUtilsError(
+                    "Not a proper date/time at start of log line!")
+            continue
+        except LogUtilsError:
+            if b_strict:
+                raise
+            continue
+        if log_level not in d_offsets:
+            if b_strict:
+                raise LogUtilsError("log-level not in log line!")
+            continue
+        a_times[i_line] = n_time
+        a_levels[i_line] = ord(log_level)
+        a_offsets[i_line] = n_offset
+    return a_times, a_levels, a_offsets
+
+def get_log_line_datetime(n_time):
+    """
+    returns the datetime of time 'n_time' from parse_log_lines()
+    """
+    return datetime(1970, 1, 1)+timedelta(seconds=n_time)
+
+def get_log_line_message(s_line, n_offset):
+    """
+    returns the message of log line 's_line' whose message offset (from
+    parse_log_lines()) is 'n_offset'
+    """
+    if n_offset < 0:
+        return str(get_log_line_fields(s_line).get("message", ""))
+    return s_line[n_offset:]
+
 class ReverseLogFileIterator():
     """
     class to iterate through a log file from end to start, verifying
@@ -272,7 +587,8 @@ class ReverseLogFileIterator():
         do some checking right off the bat
         """
         self._s_log_filename = s_log_filename
-        self._iterator = ReverseFileIterator(s_log_filename)
+        # bytes-based, so seeking never splits a utf-8 character
+        self._iterator = MmapReverseFileIterator(s_log_filename)
         self._b_started = False
         self._b_ended = False
 
@@ -326,47 +642,101 @@ class ReverseLogFileIterator():
         """
         return [i for i in self]
 
-def verify_last_log_session(s_log_filename, log_obj=None):
+def get_rotated_log_filenames(s_log_filename):
+    """
+    returns the list of the files of log 's_log_filename' that exist, the
+    log itself then its backups (name.log.1, name.log.2, ...), that is the
+    most recent lines first
+    """
+    l_filenames = []
+    for i_backup in range(MAX_LOG_FILE_BACKUPS+1):
+        s_filename = s_log_filename if i_backup == 0 else \
+            "%s.%d" % (s_log_filename, i_backup)
+        if not os.path.exists(s_filename):
+            break
+        l_filenames.append(s_filename)
+    return l_filenames
+
+def _iter_log_batches(l_filenames):
+    """
+    generator of the lines of files 'l_filenames' from the end of the first
+    file to the start of the last one, in batches of lines in file order
+    """
+    for s_filename in l_filenames:
+        with MmapReverseFileIterator(s_filename) as iterator:
+            for l_batch in iterator.iter_batches():
+                yield l_batch
+
+def verify_last_log_session(s_log_filename, log_obj=None, b_rotated=False):
     """
     verify some basic things about last log session, returns the
     duration of the entire session if successful, or None, if
-    verification failed
+    verification failed. if 'b_rotated' is True the backups of the log
+    (see get_rotated_log_filenames()) are read after it, as one log, so
+    that sessions started before the log was rotated are found
     """
-    # s_short_filename = os.path.split(s_log_filename)[-1]
-    end_dtime = None
+    # same checks as ReverseLogFileIterator, but parsing the lines a batch
+    # at a time and counting the log levels of a batch at once
+    end_time = None
+    start_time = None
     n_errors = 0
     n_criticals = 0
     n_warnings = 0
     n_lines = 0
-    dtime = None
-    for s_line, dtime, s_log_type in ReverseLogFileIterator(s_log_filename):
-        s_line_len = len(s_line) > 0
-        assert s_line_len > 0
-        if s_log_type == "E":
-            n_errors += 1
-        elif s_log_type == "C":
-            n_criticals += 1
-        elif s_log_type == "W":
-            n_warnings += 1
-
-        if not end_dtime:
-            end_dtime = dtime
-
-        n_lines += 1
+    if b_rotated:
+        # a missing log fails the same way as without 'b_rotated'
+        l_filenames = get_rotated_log_filenames(s_log_filename) or \
+            [s_log_filename]
+    else:
+        l_filenames = [s_log_filename]
+    batches = _iter_log_batches(l_filenames)
+    try:
+        for l_batch in batches:
+            # lines before the session are not verified, so they may be bad
+            a_times, a_levels, a_offsets = parse_log_lines(l_batch, False)
+            i_start = 0
+            for i_line in range(len(l_batch)-1, -1, -1):
+                if not a_levels[i_line]:
+                    # raises the error for the bad line
+                    get_log_line_components(l_batch[i_line])
+                s_message = get_log_line_message(l_batch[i_line],
+                                                 a_offsets[i_line])
+                if end_time is None:
+                    if s_message[0:3] != "END":
+                        raise LogUtilsError(
+                            "Last line has no 'END'; file: %s" %
+                            (s_log_filename,))
+                    end_time = a_times[i_line]
+                elif s_message[0:3] == "END":
+                    raise LogUtilsError("2nd 'END' found before any 'START'!")
+                elif s_message[0:5] == "START":
+                    start_time = a_times[i_line]
+                    i_start = i_line
+                    break
+                assert len(s_message) > 0
+            a_levels = a_levels[i_start:]
+            n_lines += len(a_levels)
+            n_warnings += a_levels.count(ord("W"))
+            n_errors += a_levels.count(ord("E"))
+            n_criticals += a_levels.count(ord("C"))
+            if start_time is not None:
+                break
+    finally:
+        batches.close()
 
-    # start_time = dtime
-    # delta_time = end_dtime-start_time
-    assert dtime is not None
-    delta_time = end_dtime-dtime
+    if start_time is None:
+        raise LogUtilsError("log file %s has no START directive!" %
+                            (s_log_filename,))
+    delta_time = timedelta(seconds=end_time-start_time)
 
     if log_obj:
         # log_obj.info("session duration (seconds): %d" % delta_time.seconds)
         if n_warnings > 0:
-            log_obj.warning("# of warnings: %d" % n_warnings)
+            log_obj.warning("# of warnings: %d", n_warnings)
         if n_errors > 0:
-            log_obj.error("# of errors: %d" % n_errors)
+            log_obj.error("# of errors: %d", n_errors)
         if n_criticals > 0:
-            log_obj.critical("# of criticals: %d" % n_criticals)
+            log_obj.critical("# of criticals: %d", n_criticals)
 
     return delta_time, n_lines, n_warnings, n_errors, n_criticals
 
@@ -384,6 +754,181 @@ def get_last_session_query(s_log_filename):
 
     return None
 
+class LogFollower():
+    """
+    follows a log file as it grows, like 'tail -F': keeps the offset of the
+    first line not read yet, and poll() parses only the lines appended
+    since, found with a cheap os.stat(). a rollover by RotatingFileHandler
+    (the log renamed to a backup and a new one started, seen by the inode
+    changing, or the log truncated, seen by its size going down or by its
+    first FOLLOW_HEAD_BYTES changing) is followed too: the rest of the old
+    file is read, then the new file from its start. the last record read
+    is held back until the next one starts (or a rollover), or until a
+    poll finds that the log has not grown since the one before, since more
+    lines of its message may still be coming
+    """
+
+    def __init__(self, s_log_filename, b_from_start=False):
+        """
+        constructor - follows from the end of the log, or from its start if
+        'b_from_start' is True (a log that does not exist yet is followed
+        from its start once it does)
+        """
+        self._s_log_filename = s_log_filename
+        self._h_file = None
+        self._t_inode = None
+        self._n_offset = 0
+        # the first bytes of the log, to tell when it was truncated
+        self._head = b""
+        # the lines of the record held back by the last poll()
+        self._l_pending = []
+        # the size of the log at the last poll() (or when opened)
+        self._n_polled_size = None
+        self._open(b_from_start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        closes the log
+        """
+        if self._h_file is not None:
+            self._h_file.close()
+            self._h_file = None
+
+    def _open(self, b_from_start=True):
+        """
+        opens the log (the file now named 's_log_filename'), returns False
+        if there is none
+        """
+        try:
+            # unbuffered, a read buffer would keep showing the old head
+            h_file = open(self._s_log_filename, "rb", buffering=0)
+        except FileNotFoundError:
+            return False
+        stat = os.fstat(h_file.fileno())
+        self._h_file = h_file
+        self._t_inode = (stat.st_dev, stat.st_ino)
+        self._n_offset = 0 if b_from_start else stat.st_size
+        self._n_polled_size = stat.st_size
+        self._head = self._read_head()
+        return True
+
+    def _read_head(self, n_bytes=FOLLOW_HEAD_BYTES):
+        """
+        returns the first 'n_bytes' bytes of the open file
+        """
+        self._h_file.seek(0)
+        return self._h_file.read(n_bytes)
+
+    def _read_lines(self):
+        """
+        returns the list of the whole lines of the open file from the offset
+        on, and moves the offset past them (a line still being written is
+        read on a later call)
+        """
+        self._h_file.seek(self._n_offset)
+        contents = self._h_file.read()
+        n_end = contents.rfind(b"\n")+1
+        if n_end == 0:
+            return []
+        self._n_offset += n_end
+        return [s_line.rstrip("\r") for s_line
+                in str(contents[:n_end-1], "utf-8", "replace").split("\n")]
+
+    def poll(self, b_flush=False):
+        """
+        returns the list of (message, datetime, log level) tuples, as from
+        get_log_line_components(), of the records appended to the log since
+        the last call, the lines of a multi-line message joined back into
+        it (lines that do not start a record are dropped at the start of
+        the log). the last record is held back for the next call, unless
+        the log has not grown since the last call or 'b_flush' is True
+        (e.g. once the log is known to be complete)
+        """
+        if self._h_file is None and not self._open():
+            return self._get_records([], b_flush)
+        try:
+            stat = os.stat(self._s_log_filename)
+            t_inode = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            # being rolled over, the new log comes next time
+            t_inode = None
+        # a record whose log stopped growing is complete (e.g. the last
+        # words of a scraper that died), and must not wait for the next one
+        b_flush = b_flush or (t_inode == self._t_inode and
+                              stat.st_size == self._n_polled_size)
+        l_records = []
+        if t_inode == self._t_inode and (
+                stat.st_size < self._n_offset or
+                stat.st_size >= self._n_offset and
+                self._read_head(len(self._head)) != self._head):
+            # truncated (and maybe written again past the offset since):
+            # what was left of the old log is lost, its record is complete
+            l_records = self._get_records([], True)
+            self._n_offset = 0
+            self._head = b""
+        l_lines = self._read_lines()
+        if t_inode is not None and t_inode != self._t_inode:
+            # checked before reading, so nothing more goes to the old file
+            l_records += self._get_records(l_lines, True)
+            self.close()
+            l_lines = self._read_lines() if self._open() else []
+        if self._h_file is not None and len(self._head) < FOLLOW_HEAD_BYTES:
+            self._head = self._read_head()
+        if t_inode == self._t_inode:
+            self._n_polled_size = stat.st_size
+        return l_records+self._get_records(l_lines, b_flush)
+
+    def _get_records(self, l_lines, b_flush=False):
+        """
+        returns the (message, datetime, log level) tuples of log lines
+        'l_lines', after the lines held back by the last call - holding
+        back the lines of the last record, unless 'b_flush' is True
+        """
+        l_lines = self._l_pending+l_lines
+        self._l_pending = []
+        a_times, a_levels, a_offsets = parse_log_lines(l_lines, False)
+        l_records = []
+        i_last = None
+        for i_line, s_line in enumerate(l_lines):
+            if a_levels[i_line]:
+                l_records.append((
+                    get_log_line_message(s_line, a_offsets[i_line]),
+                    get_log_line_datetime(a_times[i_line]),
+                    chr(a_levels[i_line])))
+                i_last = i_line
+            elif l_records:
+                s_message, dtime, log_level = l_records[-1]
+                l_records[-1] = (s_message+"\n"+s_line, dtime, log_level)
+        if not b_flush and i_last is not None:
+            self._l_pending = l_lines[i_last:]
+            l_records.pop()
+        return l_records
+
+    def follow(self, poll_seconds=FOLLOW_POLL_SECONDS, stop_event=None):
+        """
+        generator of the records of poll() as they come, waiting
+        'poll_seconds' whenever there are none, until threading.Event
+        'stop_event' is set (forever if it is None), then of the record
+        held back
+        """
+        while stop_event is None or not stop_event.is_set():
+            l_records = self.poll()
+            for record in l_records:
+                yield record
+            if not l_records:
+                if stop_event is None:
+                    time.sleep(poll_seconds)
+                else:
+                    stop_event.wait(poll_seconds)
+        for record in self.poll(True):
+            yield record
+
 class ModuleTests(unittest.TestCase):
     """
     module tests
@@ -400,6 +945,242 @@ class ModuleTests(unittest.TestCase):
         log.error("-->error<--:hello world!")
         log.critical("-->critical<--:hello world!")
 
+    def test02(self):
+        """
+        tests that messages are formatted only if their level is logged
+        """
+        l_calls = []
+
+        def get_message_text():
+            """
+            returns a message, remembering that it was called
+            """
+            l_calls.append(1)
+            return "100%"
+
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_log_filename = os.path.join(s_dir, "lazy.log")
+            log = Logger(s_log_filename, "INFO")
+            log.debug(get_message_text)
+            log.debug("%s", ValueError)
+            self.assertEqual(l_calls, [])
+            self.assertFalse(log.is_enabled_for("debug"))
+            self.assertTrue(log.is_enabled_for("INFO"))
+            log.info(get_message_text)
+            log.info("url=%s, duration=%.1f", "http://x/", 1.25)
+            log.info("no args, 50%")
+            with open(s_log_filename) as h_file:
+                l_messages = [get_log_line_components(s_line)[0].rstrip()
+                              for s_line in h_file]
+            self.assertEqual(l_messages, ["100%", "url=http://x/, "
+                                          "duration=1.2", "no args, 50%"])
+            self.assertEqual(l_calls, [1])
+            self.assertEqual(get_message(get_message_text, ()), "100%")
+            for handler in logging.getLogger(s_log_filename).handlers:
+                handler.close()
+
+    def test03(self):
+        """
+        tests json log lines, and reading them back
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_log_filename = os.path.join(s_dir, "json.log")
+            log = Logger(s_log_filename, "DEBUG", b_json=True)
+            log.warning("START")
+            log.debug("fetched %s", "http://x/",
+                      extra={"scraper": "X", "url": "http://x/",
+                             "duration": 0.25, "bytes": 100})
+            log.error("Cannot open\nhttp://x/", extra={"attempt": 2})
+            log.warning("END")
+            l_lines = ReverseLogFileIterator(s_log_filename).all()
+            self.assertEqual([(s_message, s_level)
+                              for s_message, _, s_level in l_lines],
+                             [("END", "W"), ("Cannot open\nhttp://x/", "E"),
+                              ("fetched http://x/", "D"), ("START", "W")])
+            self.assertEqual(verify_last_log_session(s_log_filename)[1:],
+                             (4, 2, 1, 0))
+            with open(s_log_filename) as h_file:
+                l_fields = [get_log_line_fields(s_line) for s_line in h_file]
+            self.assertEqual(l_fields[1]["duration"], 0.25)
+            self.assertEqual(l_fields[1]["bytes"], 100)
+            self.assertEqual(l_fields[2]["attempt"], 2)
+            self.assertNotIn("url", l_fields[2])
+            for handler in logging.getLogger(s_log_filename).handlers:
+                handler.close()
+
+    def test04(self):
+        """
+        tests queued logging from several threads, and stopping one log's
+        listener only
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_log_filename = os.path.join(s_dir, "queued.log")
+            log = Logger(s_log_filename, "DEBUG", b_queued=True)
+            s_other_filename = os.path.join(s_dir, "other.log")
+            other_log = Logger(s_other_filename, "DEBUG", b_queued=True)
+            self.assertIsInstance(
+                logging.getLogger(s_log_filename).handlers[0],
+                logging.handlers.QueueHandler)
+
+            def log_lines(i_thread):
+                """
+                logs 100 lines
+                """
+                for i_line in range(100):
+                    log.debug("thread %d line %d", i_thread, i_line)
+
+            l_threads = [threading.Thread(target=log_lines, args=(i_thread,))
+                         for i_thread in range(4)]
+            for thread in l_threads:
+                thread.start()
+            for thread in l_threads:
+                thread.join()
+            log.flush()
+            with open(s_log_filename) as h_file:
+                l_lines = h_file.readlines()
+            self.assertEqual(len(l_lines), 400)
+            self.assertEqual(get_log_line_components(l_lines[0])[2], "D")
+            log.debug("after flush")
+            stop_queue_listeners([s_log_filename])
+            # records queued before stopping are written, later ones are
+            # written synchronously
+            log.info("after stop")
+            with open(s_log_filename) as h_file:
+                l_lines = h_file.readlines()
+            self.assertEqual(len(l_lines), 402)
+            self.assertIsInstance(
+                logging.getLogger(s_other_filename).handlers[0],
+                logging.handlers.QueueHandler)
+            other_log.info("still queued")
+            stop_queue_listeners([s_other_filename])
+            with open(s_other_filename) as h_file:
+                self.assertEqual(len(h_file.readlines()), 1)
+            for s_filename in (s_log_filename, s_other_filename):
+                for handler in logging.getLogger(s_filename).handlers:
+                    handler.close()
+
+    def test05(self):
+        """
+        tests batch parsing against get_log_line_components()
+        """
+        l_lines = ["2023-12-31 23:59:58,123 WARNING START",
+                   "2024-02-29 00:00:01,000 DEBUG fetched",
+                   '{"time": "2024-03-01 10:20:30,500", "level": "ERROR",'
+                   ' "message": "Cannot open"}',
+                   "2024-03-01 10:20:31,000 CRITICAL down",
+                   "2024-03-01 10:20:32,000 INFO x",
+                   "2024-03-01 10:20:33,000 WARNING END"]
+        a_times, a_levels, a_offsets = parse_log_lines(l_lines)
+        for i_line, s_line in enumerate(l_lines):
+            s_message, dtime, log_level = get_log_line_components(s_line)
+            self.assertEqual(get_log_line_datetime(a_times[i_line]), dtime)
+            self.assertEqual(chr(a_levels[i_line]), log_level)
+            self.assertEqual(get_log_line_message(s_line, a_offsets[i_line]),
+                             s_message)
+        for s_line in ("2024-03-01 10:20:3x,000 INFO x",
+                       "2024-02-30 10:20:30,000 INFO x",
+                       "2024-03-01 10:20:30,000 NOTSET x", "cont'd"):
+            with self.assertRaises(LogUtilsError):
+                parse_log_lines([s_line])
+            self.assertEqual(parse_log_lines([s_line], False)[1][0], 0)
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_log_filename = os.path.join(s_dir, "session.log")
+            with open(s_log_filename, "w") as h_file:
+                # a bad line before the last session is not verified
+                h_file.write("bad line\n"+"\n".join(l_lines*2)+"\n")
+            l_lines = ReverseLogFileIterator(s_log_filename).all()
+            self.assertEqual(verify_last_log_session(s_log_filename),
+                             (l_lines[0][1]-l_lines[-1][1], 6, 2, 1, 1))
+            with open(s_log_filename, "a") as h_file:
+                h_file.write("2024-03-01 10:20:34,000 INFO after END\n")
+            with self.assertRaises(LogUtilsError):
+                verify_last_log_session(s_log_filename)
+
+    def test06(self):
+        """
+        tests following a log through appends, rollover and truncation
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_log_filename = os.path.join(s_dir, "follow.log")
+            log = Logger(s_log_filename, "DEBUG")
+            log.warning("START")
+            with LogFollower(s_log_filename) as follower:
+                self.assertEqual(follower.poll(), [])
+                log.info("a")
+                log.error("multi\nline")
+                # the last record is held back until the next one starts
+                self.assertEqual([(s_message, s_level) for s_message, _,
+                                  s_level in follower.poll()], [("a", "I")])
+                handler = logging.getLogger(s_log_filename).handlers[0]
+                log.info("before rollover")
+                handler.doRollover()
+                log.critical("after rollover")
+                self.assertEqual([record[0] for record in follower.poll()],
+                                 ["multi\nline", "before rollover"])
+                with open(s_log_filename, "w") as h_file:
+                    h_file.write("2024-01-01 00:00:00,000 INFO t\n")
+                self.assertEqual([record[0] for record in follower.poll()],
+                                 ["after rollover"])
+                stop_event = threading.Event()
+                with open(s_log_filename, "a") as h_file:
+                    h_file.write("2024-01-01 00:00:01,000 DEBUG u\n")
+                l_messages = []
+                for record in follower.follow(0.01, stop_event):
+                    l_messages.append(record[0])
+                    stop_event.set()
+                self.assertEqual(l_messages, ["t", "u"])
+            for handler in logging.getLogger(s_log_filename).handlers:
+                handler.close()
+
+    def test07(self):
+        """
+        tests following a record whose lines come in separate polls, a
+        last record released once the log stops growing, and a log
+        truncated and written again up to or past the old offset between
+        polls
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_log_filename = os.path.join(s_dir, "follow.log")
+            with open(s_log_filename, "w") as h_file:
+                h_file.write("2024-01-01 00:00:00,000 WARNING START\n")
+            with LogFollower(s_log_filename, True) as follower:
+                with open(s_log_filename, "a") as h_file:
+                    h_file.write("2024-01-01 00:00:00,000 ERROR multi\n")
+                self.assertEqual([record[0] for record in follower.poll()],
+                                 ["START"])
+                with open(s_log_filename, "a") as h_file:
+                    h_file.write("line\n2024-01-01 00:00:01,000 INFO next\n")
+                self.assertEqual(follower.poll(), [
+                    ("multi\nline", datetime(2024, 1, 1), "E")])
+                self.assertEqual(follower.poll(True), [
+                    ("next", datetime(2024, 1, 1, 0, 0, 1), "I")])
+                n_size = os.path.getsize(s_log_filename)
+                with open(s_log_filename, "w") as h_file:
+                    h_file.write("2024-01-02 00:00:00,000 INFO %s\n" %
+                                 ("x"*n_size))
+                self.assertEqual(follower.poll(True), [
+                    ("x"*n_size, datetime(2024, 1, 2), "I")])
+                n_size = os.path.getsize(s_log_filename)
+                s_line = "2024-01-03 00:00:00,000 CRITICAL scraper died\n"
+                with open(s_log_filename, "w") as h_file:
+                    h_file.write(s_line+"x"*(n_size-len(s_line)-1)+"\n")
+                self.assertEqual(os.path.getsize(s_log_filename), n_size)
+                # the log has not grown since the last poll
+                self.assertEqual(follower.poll()[0][0],
+                                 "scraper died\n"+"x"*(n_size-len(s_line)-1))
+                self.assertEqual(follower.poll(), [])
+            with LogFollower(s_log_filename) as follower:
+                with open(s_log_filename, "a") as h_file:
+                    h_file.write(s_line)
+                self.assertEqual(follower.poll(), [])
+                self.assertEqual(follower.poll(), [
+                    ("scraper died", datetime(2024, 1, 3), "C")])
+                with open(s_log_filename, "a") as h_file:
+                    h_file.write(s_line)
+                for record in follower.follow(0.01, threading.Event()):
+                    self.assertEqual(record[2], "C")
+                    break
+
 
 if __name__ == "__main__":
     unittest.main()
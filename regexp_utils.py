@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+regexp_utils.py - compiled regular expression cache and single-pass
+extraction of several named fields from a document
+"""
+
+import functools
+import re
+import unittest
+
+
+# default values:
+
+# maximum number of compiled regular expressions get_regexp() keeps (the
+# least recently used ones beyond that are dropped)
+MAX_REGEXPS = 512
+
+# text between two html tags
+RE_HTML_TEXT = re.compile(">([^<>]+)<")
+
+
+@functools.lru_cache(maxsize=MAX_REGEXPS)
+def _compile(pattern, flags):
+    """
+    returns re.compile(pattern, flags), cached
+    """
+    return re.compile(pattern, flags)
+
+
+def get_regexp(pattern, flags=0):
+    """
+    returns the compiled regular expression of string 'pattern' with flags
+    'flags', compiling it only the first time it is asked for (of the last
+    MAX_REGEXPS asked for) - 'pattern' may also be an already compiled
+    regular expression, which is returned
+    """
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    return _compile(pattern, flags)
+
+
+class FieldExtractor():
+    """
+    extracts several named fields from a document in one pass: the pattern
+    of each field becomes a named alternative of one combined regular
+    expression. the value of a field is the first group of its pattern,
+    or the whole match if its pattern has no groups. matches of different
+    fields must not overlap and the patterns must not use numbered
+    backreferences (named ones are fine, if their names are unique)
+    """
+
+    def __init__(self, d_patterns, flags=0):
+        """
+        constructor - 'd_patterns' is a dictionary of field name -> pattern
+        string (field names must be valid python identifiers)
+        """
+        l_alternatives = []
+        # field name -> index of the group that holds its value
+        self._d_value_groups = {}
+        i_group = 1
+        for s_name, s_pattern in d_patterns.items():
+            n_groups = get_regexp(s_pattern, flags).groups
+            l_alternatives.append("(?P<%s>%s)" % (s_name, s_pattern))
+            self._d_value_groups[s_name] = i_group+1 if n_groups else i_group
+            i_group += 1+n_groups
+        self._regexp = get_regexp("|".join(l_alternatives), flags)
+
+    def extract(self, s_text, b_all=False):
+        """
+        returns a dictionary of field name -> value of the first match of
+        the field in 's_text' (None if there is none), or, if 'b_all' is
+        True, field name -> list of the values of all its matches. bytes
+        are decoded as utf-8
+        """
+        if isinstance(s_text, bytes):
+            s_text = s_text.decode("utf-8", "replace")
+        d_value_groups = self._d_value_groups
+        if b_all:
+            d_values = dict((s_name, []) for s_name in d_value_groups)
+        else:
+            d_values = dict.fromkeys(d_value_groups)
+        n_missing = len(d_value_groups)
+        for match in self._regexp.finditer(s_text):
+            s_name = match.lastgroup
+            value = match.group(d_value_groups[s_name])
+            if b_all:
+                d_values[s_name].append(value)
+            elif d_values[s_name] is None:
+                d_values[s_name] = value
+                n_missing -= 1
+                if n_missing == 0:
+                    break
+        return d_values
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests the compiled pattern cache
+        """
+        regexp = get_regexp(r"\d+")
+        self.assertIs(get_regexp(r"\d+"), regexp)
+        self.assertIs(get_regexp(regexp), regexp)
+        self.assertIsNot(get_regexp(r"\d+", re.I), regexp)
+        # the cache is bounded
+        for i_pattern in range(MAX_REGEXPS+1):
+            get_regexp("x{%d}" % i_pattern)
+        self.assertEqual(_compile.cache_info().currsize, MAX_REGEXPS)
+
+    def test02(self):
+        """
+        tests single-pass extraction of several fields
+        """
+        extractor = FieldExtractor({
+            "title": r"<title>([^<]*)</title>",
+            "price": r"\$(\d+)\.(\d\d)",
+            "date": r"\d{4}-\d\d-\d\d"})
+        s_html = "<title>Hi</title> $12.50 2024-01-02 $3.99 2024-02-03"
+        self.assertEqual(extractor.extract(s_html),
+                         {"title": "Hi", "price": "12", "date": "2024-01-02"})
+        self.assertEqual(extractor.extract(s_html.encode(), b_all=True),
+                         {"title": ["Hi"], "price": ["12", "3"],
+                          "date": ["2024-01-02", "2024-02-03"]})
+        self.assertEqual(extractor.extract("nothing")["title"], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+result_cache.py - cache of parsed fetch results, keyed by url and by a
+hash of the downloaded bytes, so that the same bytes are never parsed twice
+"""
+
+import collections
+import hashlib
+import threading
+import time
+import unittest
+
+
+# default values:
+
+# maximum number of results kept (least recently used ones are evicted)
+MAX_ENTRIES = 256
+
+# seconds a result is returned without fetching its url again, as a float
+TTL_SECONDS = 30.0
+
+
+def get_content_hash(contents):
+    """
+    returns the 128-bit hash (bytes) of downloaded bytes 'contents'
+    """
+    return hashlib.blake2b(contents, digest_size=16).digest()
+
+
+class ResultCache():
+    """
+    url key -> (hash of the bytes it was parsed from, time cached, parsed
+    result), bounded in size (least recently used first out). a result is
+    fresh for 'ttl_seconds' after it was cached, and after that it is still
+    good for new downloads with the same bytes (which make it fresh again).
+    results are shared, callers must not modify them
+    """
+
+    def __init__(self, n_max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS):
+        """
+        constructor
+        """
+        self._n_max_entries = n_max_entries
+        self._ttl_seconds = ttl_seconds
+        self._d_results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._d_results)
+
+    def get(self, s_key, contents=None, now=None):
+        """
+        returns the result cached under 's_key' if it is fresh or, if bytes
+        'contents' are given, if it was parsed from the same bytes - else
+        None
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            entry = self._d_results.get(s_key)
+            if entry is None:
+                return None
+            s_hash, cached_time, result = entry
+            if contents is not None and s_hash == get_content_hash(contents):
+                # same bytes as last time, so fresh again
+                self._d_results[s_key] = (s_hash, now, result)
+            elif now-cached_time >= self._ttl_seconds:
+                return None
+            self._d_results.move_to_end(s_key)
+            return result
+
+    def put(self, s_key, contents, result, now=None):
+        """
+        caches 'result', parsed from bytes 'contents', under 's_key' (None
+        results are not cached)
+        """
+        if result is None:
+            return
+        if now is None:
+            now = time.time()
+        s_hash = get_content_hash(contents)
+        with self._lock:
+            self._d_results[s_key] = (s_hash, now, result)
+            self._d_results.move_to_end(s_key)
+            while len(self._d_results) > self._n_max_entries:
+                self._d_results.popitem(last=False)
+
+    def clear(self):
+        """
+        drops all the cached results
+        """
+        with self._lock:
+            self._d_results.clear()
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests freshness, content hash hits and LRU eviction
+        """
+        cache = ResultCache(n_max_entries=2, ttl_seconds=10.0)
+        cache.put("a", b"page a", ["parsed a"], 100.0)
+        self.assertEqual(cache.get("a", now=105.0), ["parsed a"])
+        self.assertIsNone(cache.get("a", now=110.0))
+        # stale, but the same bytes were downloaded again
+        self.assertIsNone(cache.get("a", b"page a2", now=110.0))
+        self.assertEqual(cache.get("a", b"page a", now=110.0), ["parsed a"])
+        self.assertEqual(cache.get("a", now=115.0), ["parsed a"])
+        cache.put("b", b"page b", ["parsed b"], 116.0)
+        cache.get("a", now=117.0)
+        cache.put("c", b"page c", ["parsed c"], 118.0)
+        # "b" was the least recently used
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b", b"page b", now=118.0))
+        self.assertEqual(cache.get("a", now=118.0), ["parsed a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+retry_policy.py - when and how long to wait before retrying a failed fetch
+"""
+
+import email.utils
+import random
+import socket
+import time
+import unittest
+from datetime import datetime, timezone
+from urllib import request
+
+
+# default values:
+
+# maximum number of tries before declaring failure if they all fail
+MAX_RETRIES = 10
+
+# delay, in seconds, before the first retry - each retry doubles it
+BASE_DELAY_SECONDS = 1.0
+
+# no single delay, in seconds, is ever longer than this
+MAX_DELAY_SECONDS = 30.0
+
+# seconds after the first try beyond which no retry is started (the one
+# deadline of all scrapers' fetches)
+DEADLINE_SECONDS = 30.0
+
+# http codes worth retrying, all others are permanent failures
+RETRYABLE_HTTP_CODES = (408, 425, 429, 500, 502, 503, 504)
+
+
+class RetryPolicy():
+    """
+    exponential backoff with full jitter (each delay is uniformly random
+    between 0 and the exponential backoff value, so that scrapers that
+    failed together do not retry in lockstep), bounded by an overall
+    per-call deadline, retrying only failures that may be transient and
+    honoring the Retry-After header of 429 / 503 responses
+    """
+
+    def __init__(self, n_max_retries=MAX_RETRIES,
+                 base_delay=BASE_DELAY_SECONDS, max_delay=MAX_DELAY_SECONDS,
+                 deadline=DEADLINE_SECONDS,
+                 retryable_codes=RETRYABLE_HTTP_CODES):
+        """
+        constructor - delays and deadline in seconds
+        """
+        self.n_max_retries = n_max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retryable_codes = retryable_codes
+
+    def is_retryable(self, ex):
+        """
+        returns True if exception 'ex' (raised by a fetch) may be transient
+        """
+        if isinstance(ex, request.HTTPError):
+            return ex.code in self.retryable_codes
+        if isinstance(ex, request.URLError):
+            # an unknown host name will not resolve on the next try either
+            if isinstance(ex.reason, socket.gaierror):
+                return ex.reason.errno == socket.EAI_AGAIN
+            return True
+        return isinstance(ex, (OSError, RuntimeError))
+
+    @staticmethod
+    def get_retry_after(ex):
+        """
+        returns the delay, in seconds, requested by the Retry-After header
+        of http error 'ex' or None if there is no such (valid) header
+        """
+        headers = getattr(ex, "headers", None)
+        s_value = headers.get("Retry-After") if headers else None
+        if not s_value:
+            return None
+        s_value = s_value.strip()
+        if s_value.isdigit():
+            return float(s_value)
+        try:
+            dtime = email.utils.parsedate_to_datetime(s_value)
+        except (TypeError, ValueError):
+            return None
+        if dtime.tzinfo is None:
+            dtime = dtime.replace(tzinfo=timezone.utc)
+        return max(0.0, (dtime-datetime.now(timezone.utc)).total_seconds())
+
+    def get_delay(self, n_tries, ex=None):
+        """
+        returns the delay, in seconds, before the next try after 'n_tries'
+        failed tries, the last of which raised 'ex'
+        """
+        retry_after = self.get_retry_after(ex)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(
+            0.0, min(self.max_delay, self.base_delay*2**(n_tries-1)))
+
+    def get_next_delay(self, n_tries, start_time, ex):
+        """
+        returns the delay, in seconds, before the next try after 'n_tries'
+        failed tries (the first of which started at time 'start_time' and
+        the last of which raised 'ex') or None if we should give up
+        """
+        if n_tries >= self.n_max_retries or not self.is_retryable(ex):
+            return None
+        delay = self.get_delay(n_tries, ex)
+        if time.time()+delay-start_time > self.deadline:
+            return None
+        return delay
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests backoff bounds, retry limits and the deadline
+        """
+        policy = RetryPolicy(n_max_retries=4, base_delay=1.0, max_delay=3.0,
+                             deadline=10.0)
+        ex = request.URLError(ConnectionRefusedError())
+        for n_tries in range(1, 4):
+            delay = policy.get_next_delay(n_tries, time.time(), ex)
+            self.assertTrue(0.0 <= delay <= min(3.0, 2**(n_tries-1)))
+        self.assertIsNone(policy.get_next_delay(4, time.time(), ex))
+        self.assertIsNone(policy.get_next_delay(1, time.time()-11.0, ex))
+
+    def test02(self):
+        """
+        tests the classification of failures and Retry-After
+        """
+        policy = RetryPolicy()
+        ex = request.HTTPError("http://x", 503, "", {"Retry-After": "7"},
+                               None)
+        self.assertEqual(policy.get_next_delay(1, time.time(), ex), 7.0)
+        ex = request.HTTPError("http://x", 404, "", {}, None)
+        self.assertIsNone(policy.get_next_delay(1, time.time(), ex))
+        ex = request.URLError(socket.gaierror(socket.EAI_NONAME, "unknown"))
+        self.assertFalse(policy.is_retryable(ex))
+        ex = request.HTTPError("http://x", 429, "", {
+            "Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}, None)
+        self.assertEqual(policy.get_delay(1, ex), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
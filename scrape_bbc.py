@@ -21,9 +21,7 @@ class ScrapeBBC(ScraperBase):
         s_url = "http://newsrss.bbc.co.uk/rss/newsonline_world_edition/" + \
             "americas/rss.xml"
 
-        feed = self.fetch_rss(s_url)
-
-        return [post.title for post in feed.entries]
+        return self.fetch_headlines(s_url)
 
 
 class ModuleTests(unittest.TestCase):
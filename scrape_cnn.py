@@ -18,9 +18,7 @@ class ScrapeCNN(ScraperBase):
         abstract method implementation - does all the scraping work
         """
         s_url = "http://rss.cnn.com/rss/cnn_topstories.rss"
-        feed = self.fetch_rss(s_url)
-
-        return [post.title for post in feed.entries]
+        return self.fetch_headlines(s_url)
 
 
 class ModuleTests(unittest.TestCase):
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+scrape_metrics.py - counters and histograms of the scraping stages (dns /
+connect, time to first byte, download, parse, extract) per scraper and
+host, exportable in the prometheus text format or as a json snapshot
+"""
+
+import json
+import threading
+import unittest
+
+
+# default values:
+
+# upper bounds, in seconds, of the buckets of the duration histograms
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0, 30.0)
+
+# metric name -> (type, help text), for the prometheus export
+METRICS = {
+    "scraper_stage_seconds": (
+        "histogram", "duration of a scraping stage (connect includes dns)"),
+    "scraper_scrape_seconds": (
+        "histogram", "duration of a whole scrape() call"),
+    "scraper_fetches_total": ("counter", "fetches, by result"),
+    "scraper_retries_total": ("counter", "fetch attempts that were retried"),
+    "scraper_bytes_total": ("counter", "bytes downloaded"),
+    }
+
+
+class Histogram():
+    """
+    cumulative-bucket histogram, as prometheus has them
+    """
+
+    def __init__(self, t_buckets=DURATION_BUCKETS):
+        """
+        constructor
+        """
+        self.t_buckets = t_buckets
+        self.l_counts = [0]*len(t_buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        adds 'value' to the histogram
+        """
+        for i_bucket, bound in enumerate(self.t_buckets):
+            if value <= bound:
+                self.l_counts[i_bucket] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _get_label_key(d_labels):
+    """
+    returns dictionary of labels 'd_labels' as a hashable, sorted tuple
+    """
+    return tuple(sorted(d_labels.items()))
+
+
+def _format_labels(t_labels, t_extra=()):
+    """
+    returns label tuple 't_labels' (plus 't_extra') in the prometheus text
+    format, e.g. '{host="x",scraper="BBC"}'
+    """
+    l_labels = list(t_labels)+list(t_extra)
+    if not l_labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (s_name, str(value).replace("\\", "\\\\").replace(
+            '"', '\\"').replace("\n", "\\n"))
+        for s_name, value in l_labels)
+
+
+def _format_value(value):
+    """
+    returns number 'value' in the prometheus text format
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry():
+    """
+    thread-safe set of counters and histograms, each identified by a
+    metric name and a dictionary of labels (e.g. scraper, host, stage)
+    """
+
+    def __init__(self, t_buckets=DURATION_BUCKETS):
+        """
+        constructor
+        """
+        self._t_buckets = t_buckets
+        # metric name -> label tuple -> value (number or Histogram)
+        self._d_counters = {}
+        self._d_histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, s_name, d_labels, value=1):
+        """
+        adds 'value' to counter 's_name' with labels 'd_labels'
+        """
+        key = _get_label_key(d_labels)
+        with self._lock:
+            d_values = self._d_counters.setdefault(s_name, {})
+            d_values[key] = d_values.get(key, 0)+value
+
+    def observe(self, s_name, d_labels, value):
+        """
+        adds 'value' to histogram 's_name' with labels 'd_labels'
+        """
+        key = _get_label_key(d_labels)
+        with self._lock:
+            d_values = self._d_histograms.setdefault(s_name, {})
+            histogram = d_values.get(key)
+            if histogram is None:
+                histogram = d_values[key] = Histogram(self._t_buckets)
+            histogram.observe(value)
+
+    def clear(self):
+        """
+        drops all the metrics
+        """
+        with self._lock:
+            self._d_counters.clear()
+            self._d_histograms.clear()
+
+    def get_snapshot(self):
+        """
+        returns all the metrics as a json-serializable dictionary: metric
+        name -> list of {"labels": ..., "value": ...} for counters, and of
+        {"labels": ..., "count": ..., "sum": ..., "buckets": [[upper bound,
+        cumulative count], ...]} for histograms
+        """
+        d_snapshot = {}
+        with self._lock:
+            for s_name, d_values in sorted(self._d_counters.items()):
+                d_snapshot[s_name] = [
+                    {"labels": dict(t_labels), "value": value}
+                    for t_labels, value in sorted(d_values.items())]
+            for s_name, d_values in sorted(self._d_histograms.items()):
+                d_snapshot[s_name] = [
+                    {"labels": dict(t_labels), "count": histogram.count,
+                     "sum": histogram.sum,
+                     "buckets": [list(bucket) for bucket in zip(
+                         histogram.t_buckets, histogram.l_counts)]}
+                    for t_labels, histogram in sorted(d_values.items())]
+        return d_snapshot
+
+    def to_json(self):
+        """
+        returns get_snapshot() as a json string
+        """
+        return json.dumps(self.get_snapshot(), sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        returns all the metrics in the prometheus text exposition format
+        """
+        l_lines = []
+        with self._lock:
+            for s_name, d_values in sorted(self._d_counters.items()):
+                self._add_help(l_lines, s_name, "counter")
+                for t_labels, value in sorted(d_values.items()):
+                    l_lines.append("%s%s %s" % (s_name,
+                                                _format_labels(t_labels),
+                                                _format_value(value)))
+            for s_name, d_values in sorted(self._d_histograms.items()):
+                self._add_help(l_lines, s_name, "histogram")
+                for t_labels, histogram in sorted(d_values.items()):
+                    for bound, n_count in zip(histogram.t_buckets +
+                                              (float("inf"),),
+                                              histogram.l_counts +
+                                              [histogram.count]):
+                        l_lines.append("%s_bucket%s %d" % (
+                            s_name, _format_labels(
+                                t_labels, (("le", _format_value(bound)),)),
+                            n_count))
+                    l_lines.append("%s_sum%s %s" % (
+                        s_name, _format_labels(t_labels),
+                        _format_value(histogram.sum)))
+                    l_lines.append("%s_count%s %d" % (
+                        s_name, _format_labels(t_labels), histogram.count))
+        return "\n".join(l_lines)+"\n"
+
+    @staticmethod
+    def _add_help(l_lines, s_name, s_default_type):
+        """
+        appends the HELP and TYPE lines of metric 's_name' to 'l_lines'
+        """
+        s_type, s_help = METRICS.get(s_name, (s_default_type, s_name))
+        l_lines.append("# HELP %s %s" % (s_name, s_help))
+        l_lines.append("# TYPE %s %s" % (s_name, s_type))
+
+
+_METRICS = MetricsRegistry()
+
+
+def get_metrics():
+    """
+    returns the metrics registry shared by all scrapers in this process
+    """
+    return _METRICS
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests counters, histograms and both exports
+        """
+        metrics = MetricsRegistry((0.1, 1.0))
+        d_labels = {"scraper": "BBC", "host": "bbc.co.uk"}
+        metrics.inc("scraper_bytes_total", d_labels, 100)
+        metrics.inc("scraper_bytes_total", d_labels, 50)
+        for value in (0.05, 0.5, 5.0):
+            metrics.observe("scraper_stage_seconds",
+                            dict(d_labels, stage="parse"), value)
+        d_snapshot = json.loads(metrics.to_json())
+        self.assertEqual(d_snapshot["scraper_bytes_total"][0]["value"], 150)
+        d_histogram = d_snapshot["scraper_stage_seconds"][0]
+        self.assertEqual(d_histogram["labels"]["stage"], "parse")
+        self.assertEqual(d_histogram["buckets"], [[0.1, 1], [1.0, 2]])
+        self.assertEqual(d_histogram["count"], 3)
+        s_text = metrics.to_prometheus()
+        self.assertIn("# TYPE scraper_stage_seconds histogram", s_text)
+        self.assertIn('scraper_bytes_total{host="bbc.co.uk",scraper="BBC"} '
+                      '150\n', s_text)
+        self.assertIn('scraper_stage_seconds_bucket{host="bbc.co.uk",'
+                      'scraper="BBC",stage="parse",le="+Inf"} 3\n', s_text)
+        self.assertIn('scraper_stage_seconds_count{host="bbc.co.uk",'
+                      'scraper="BBC",stage="parse"} 3\n', s_text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,9 +20,7 @@ class ScrapeNPR(ScraperBase):
         """
         s_url = "http://www.npr.org/rss/rss.php?id=1001"
 
-        feed = self.fetch_rss(s_url)
-
-        return [post.title for post in feed.entries]
+        return self.fetch_headlines(s_url)
 
 
 class ModuleTests(unittest.TestCase):
@@ -17,13 +17,11 @@ class ScrapeNYT(ScraperBase):
     def scrape_worker(self):
         """
         the abstract method implementation - does all the scraping work
-        returns a list of current titles from the NY Times rss feed
+        returns a list of current headlines from the NY Times rss feed
         """
         s_url = "http://www.nytimes.com/services/xml/rss/nyt/HomePage.xml"
 
-        feed = self.fetch_rss(s_url)
-
-        return [post.title for post in feed.entries]
+        return self.fetch_headlines(s_url)
 
 
 class ModuleTests(unittest.TestCase):
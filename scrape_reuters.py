@@ -20,9 +20,7 @@ class ScrapeReuters(ScraperBase):
         """
         s_url = "http://feeds.reuters.com/reuters/topNews"
 
-        feed = self.fetch_rss(s_url)
-
-        return [post.title for post in feed.entries]
+        return self.fetch_headlines(s_url)
 
 
 class ModuleTests(unittest.TestCase):
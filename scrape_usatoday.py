@@ -20,9 +20,7 @@ class ScrapeUSAToday(ScraperBase):
         """
         s_url = "http://rssfeeds.usatoday.com/usatoday-NewsTopStories"
 
-        feed = self.fetch_rss(s_url)
-
-        return [post.title for post in feed.entries]
+        return self.fetch_headlines(s_url)
 
 
 class ModuleTests(unittest.TestCase):
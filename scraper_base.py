@@ -5,29 +5,146 @@ scraper_base - abstract scraper base class definition and scraping utilities
 """
 
 import abc
+import contextvars
+import os
+from concurrent.futures import ProcessPoolExecutor
 import sys
+import threading
 import unittest
 # import urllib2
 from urllib import request
+from urllib.parse import urlsplit
 import time
-import re
-from bs4 import BeautifulSoup
 import feedparser
+from circuit_breaker import CLOSED, COOLDOWN_SECONDS, FAILURE_THRESHOLD, \
+    OPEN, get_breaker, is_host_failure
+from dedup_index import DedupIndex
+from headline import Headline
+from html_table import get_parser_backend, get_table_from_soup, \
+    iter_table_rows
+from http_pool import get_shared_pool
 from log_utils import Logger
+from regexp_utils import RE_HTML_TEXT, FieldExtractor, get_regexp
+from result_cache import ResultCache
+from retry_policy import BASE_DELAY_SECONDS, RetryPolicy
+from scrape_metrics import MetricsRegistry, get_metrics
+from validator_store import MemoryValidatorStore
 
 
 # default values:
 
-# maximum number of retries before declaring failure if they all fail
-MAX_RETRIES = 10
+# number of processes of the shared parse pool (None: one per cpu core)
+PARSE_WORKERS = None
 
-# delay, in seconds, as a float
-RETRY_DELAY_SECONDS = 1.0
+# seconds a scraper reuses a parsed feed without fetching it again (after
+# that it is fetched, but parsed again only if its bytes changed)
+RESULT_TTL_SECONDS = 30.0
+
+# maximum number of parsed results each scraper caches
+RESULT_CACHE_ENTRIES = 64
+
+# the fields of each feed entry that compact parse results keep
+COMPACT_ENTRY_KEYS = ("title", "link", "id", "published", "published_parsed",
+                      "updated", "updated_parsed")
 
 
 NYT_TOP_HEADLINES_URL = \
     "http://www.nytimes.com/services/xml/rss/nyt/HomePage.xml"
 
+TEST_RSS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>test</title>
+<item><title>first headline</title><link>http://x/1</link></item>
+<item><title>second headline</title><link>http://x/2</link></item>
+</channel></rss>
+"""
+
+def parse_rss_bytes(contents, d_response_headers=None):
+    """
+    the parse stage of fetching an rss feed: parses feed bytes 'contents'
+    given the (lower-cased) http response headers 'd_response_headers',
+    a module-level function so that it can run in a process pool
+    """
+    return feedparser.parse(contents, response_headers=d_response_headers)
+
+
+def parse_rss_compact(contents, d_response_headers=None):
+    """
+    parses like parse_rss_bytes() but returns only the feed's title, its
+    bozo flag and its entries' COMPACT_ENTRY_KEYS fields, so that parsing
+    in a process pool sends back little more than the headlines
+    """
+    response = parse_rss_bytes(contents, d_response_headers)
+    compact = feedparser.FeedParserDict()
+    compact["bozo"] = response.get("bozo", 0)
+    compact["feed"] = feedparser.FeedParserDict(
+        title=response.feed.get("title"))
+    compact["entries"] = [
+        feedparser.FeedParserDict((s_key, entry[s_key])
+                                  for s_key in COMPACT_ENTRY_KEYS
+                                  if s_key in entry)
+        for entry in response.entries]
+    return compact
+
+
+_PARSE_POOL = None
+
+# number of processes _PARSE_POOL was created with
+_N_PARSE_WORKERS = None
+
+_PARSE_POOL_LOCK = threading.Lock()
+
+
+def get_parse_pool(n_workers=PARSE_WORKERS):
+    """
+    returns the process pool shared by all scrapers in this process for
+    parse work (created with 'n_workers' processes on first use), pass it
+    as the 'parse_executor' of scrapers. raises ValueError if the pool
+    already exists with another number of processes
+    """
+    # pylint: disable=global-statement
+    global _PARSE_POOL, _N_PARSE_WORKERS
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None:
+            _PARSE_POOL = ProcessPoolExecutor(n_workers)
+            _N_PARSE_WORKERS = n_workers
+        elif n_workers != _N_PARSE_WORKERS:
+            raise ValueError("the parse pool has %d processes, not %d" %
+                             (_N_PARSE_WORKERS, n_workers))
+        return _PARSE_POOL
+
+
+# the tally of the scrape() call running in this thread or asyncio task:
+# dictionary of "hits" / "misses" (of result caches) and "bytes" downloaded
+_SCRAPE_TALLY = contextvars.ContextVar("scrape_tally", default=None)
+
+_SCRAPE_TALLY_LOCK = threading.Lock()
+
+
+def add_to_scrape_tally(s_name, value=1):
+    """
+    adds 'value' to entry 's_name' of the tally of the scrape() call running
+    in this thread or asyncio task, if any
+    """
+    d_tally = _SCRAPE_TALLY.get()
+    if d_tally is not None:
+        with _SCRAPE_TALLY_LOCK:
+            d_tally[s_name] += value
+
+
+def get_scrape_tally():
+    """
+    returns (a copy of) the tally of the scrape() call running in this
+    thread or asyncio task, None if there is none
+    """
+    d_tally = _SCRAPE_TALLY.get()
+    if d_tally is None:
+        return None
+    with _SCRAPE_TALLY_LOCK:
+        return dict(d_tally)
+
+
 class ScraperBase:
     """
     Scraper abstract base class - to derive from this class:
@@ -36,19 +153,67 @@ class ScraperBase:
     """
     __metaclass__ = abc.ABCMeta
 
+    # BeautifulSoup tree builder of parse_table(), None for the streaming
+    # html.parser extractor (and html.parser when a whole tree is needed),
+    # "lxml" to opt in to the faster builder, whose tables may differ for
+    # malformed html - see html_table.get_parser_backend()
+    parser_backend = None
+
+    # seconds parsed results are reused without fetching, see result_cache
+    result_ttl_seconds = RESULT_TTL_SECONDS
+
     def __init__(self, s_log_filename="scraper_base.log",
                  s_log_level="DEBUG", s_url=None, regexp=None,
-                 b_global=False):
+                 b_global=False, validator_store=None, retry_policy=None,
+                 parse_executor=None, dedup_index=None, result_cache=None,
+                 metrics=None, http_pool=None):
         """
-        constructor - must supply the logging parameters
+        constructor - must supply the logging parameters. 'regexp' is a
+        regular expression (compiled or not) or a dictionary of field name
+        -> pattern string, see extract(). 'validator_store'
+        keeps the ETag / Last-Modified validators of fetched urls for
+        conditional GETs (default: a new in-memory store), pass a
+        validator_store.FileValidatorStore to keep them across restarts.
+        'retry_policy' (a retry_policy.RetryPolicy) decides how fetches
+        are retried. 'parse_executor' is an optional concurrent.futures
+        executor (e.g. a ProcessPoolExecutor) that parse work is sent to.
+        'dedup_index' (a dedup_index.DedupIndex) remembers the headlines
+        already scraped, for scrape(b_only_new=True). 'result_cache' (a
+        result_cache.ResultCache) keeps parsed feeds by url and content
+        hash (default: a new one with this class' result_ttl_seconds).
+        'metrics' (a scrape_metrics.MetricsRegistry, default: the shared
+        one) gets the timings of the scraping stages, retries and bytes.
+        'http_pool' (an http_pool.HttpPool, default: the shared one) is the
+        connection pool fetches go through
         """
         self.log = Logger(s_log_filename, s_log_level)
         self._s_url = s_url
+        if isinstance(regexp, dict):
+            regexp = FieldExtractor(regexp)
+        elif regexp is not None and not isinstance(regexp, FieldExtractor):
+            regexp = get_regexp(regexp)
         self._regexp = regexp
-        self._retry_delay_seconds = RETRY_DELAY_SECONDS
-        self._max_retries = MAX_RETRIES
+        if retry_policy is None:
+            # the tries, delays and deadline are retry_policy's defaults
+            retry_policy = RetryPolicy()
+        self._retry_policy = retry_policy
         self._last_scraped_url = None
         self._b_global = b_global
+        # hosts this scraper has fetched from, for its circuit breakers
+        self._set_hosts = set()
+        if validator_store is None:
+            validator_store = MemoryValidatorStore()
+        self._validator_store = validator_store
+        self._parse_executor = parse_executor
+        self._http_pool = http_pool
+        self._dedup_index = dedup_index
+        if result_cache is None:
+            result_cache = ResultCache(RESULT_CACHE_ENTRIES,
+                                       self.result_ttl_seconds)
+        self._result_cache = result_cache
+        if metrics is None:
+            metrics = get_metrics()
+        self._metrics = metrics
 
 
     @abc.abstractmethod
@@ -58,64 +223,302 @@ class ScraperBase:
         does all the scraping work, the rest of this class here is just for
         structural support only
         """
-        s_html = None
         if self._s_url is None:
             self.log.warning("this object was initialized without a URL!")
             return None
-        else:
-            s_html = self.fetch_html(self._s_url)[0]
-        if self._regexp is None:
+        return self.extract(self.fetch_html(self._s_url)[0])
+
+
+    def extract(self, s_html):
+        """
+        applies this object's regexp to page 's_html': returns the page
+        itself if there is no regexp, the list of all matches if the
+        object is global, otherwise the groups of the first match - or, if
+        the regexp is a dictionary of field name -> pattern, a dictionary of
+        field name -> first value (or list of all values, if global), all
+        fields extracted in one pass (see regexp_utils.FieldExtractor)
+        """
+        if self._regexp is None or s_html is None:
             return s_html
-        elif s_html is not None:
-            if self._b_global:
-                return self._regexp.findall(s_html)
-            else:
-                match = self._regexp.search(s_html)
-                if match is not None:
-                    return match.groups()
-                else:
-                    return None
+        start_time = time.perf_counter()
+        if isinstance(self._regexp, FieldExtractor):
+            result = self._regexp.extract(s_html, self._b_global)
+        elif self._b_global:
+            result = self._regexp.findall(s_html)
+        else:
+            match = self._regexp.search(s_html)
+            result = match.groups() if match is not None else None
+        self.record_stage("extract", self._last_scraped_url,
+                          time.perf_counter()-start_time)
+        return result
 
 
-    def scrape(self):
+    def scrape(self, b_only_new=False):
         """
-        calls scrape_worker() but with logging and timing infrastructure
+        calls scrape_worker() but with logging and timing infrastructure -
+        if 'b_only_new' is True, and scrape_worker() returns a list of
+        headline.Headline records or key strings, only the items not
+        returned by previous scrape(b_only_new=True) calls are returned
+        (other items, e.g. table rows, are all returned, see
+        DedupIndex.filter_new())
         """
         start_time = time.time()
-        response = self.scrape_worker()
-        elapsed_time = time.time()-start_time
-        self.log.debug("url=%s, duration=%f seconds" %
-                       (self._last_scraped_url, elapsed_time))
+        # counts of this call only, whatever other calls run meanwhile
+        d_tally = self.new_scrape_tally()
+        token = _SCRAPE_TALLY.set(d_tally)
+        try:
+            response = self.scrape_worker()
+            if b_only_new:
+                response = self.filter_new(response)
+        finally:
+            _SCRAPE_TALLY.reset(token)
+        self.record_scrape(time.time()-start_time, d_tally)
 
         return response
 
 
+    @staticmethod
+    def new_scrape_tally():
+        """
+        returns a new, zeroed tally of a scrape() call, see
+        add_to_scrape_tally()
+        """
+        return {"hits": 0, "misses": 0, "bytes": 0}
+
+
+    def record_scrape(self, elapsed_time, d_tally):
+        """
+        records the metrics and the log line of a scrape() call that took
+        'elapsed_time' seconds and whose tally is 'd_tally'
+        """
+        self._metrics.observe("scraper_scrape_seconds",
+                              {"scraper": self.get_source_name()},
+                              elapsed_time)
+        if not self.log.is_enabled_for("DEBUG"):
+            # not even the fields of the log line are built
+            return
+        self.log.debug("url=%s, duration=%f seconds, cache hits=%d, "
+                       "misses=%d", self._last_scraped_url, elapsed_time,
+                       d_tally["hits"], d_tally["misses"],
+                       extra=self.get_log_fields(
+                           self._last_scraped_url, duration=elapsed_time,
+                           bytes=d_tally["bytes"]))
+
+
+    def filter_new(self, response):
+        """
+        returns the items of list 'response' that this scraper's dedup index
+        has not seen yet (creating an in-memory index if it has none), then
+        saves the index if it has a file, so that the next process knows
+        them too
+        """
+        if not isinstance(response, list):
+            return response
+        if self._dedup_index is None:
+            self._dedup_index = DedupIndex()
+        l_new = self._dedup_index.filter_new(response)
+        if self._dedup_index.get_filename() is not None:
+            self._dedup_index.save()
+        return l_new
+
+
     def fetch_rss(self, s_url):
         """
-        fetches the rss feed at a url given by url string s_url
+        fetches the rss feed at a url given by url string s_url - the feed
+        is downloaded by fetch_html(), then its bytes are parsed by
+        parse_rss(). if the feed has not changed since it was last fetched
+        (http code 304) the previously parsed feed is returned
         """
-        b_noanswer = True
-        n_tries = 0
-        response = None
-        while b_noanswer and n_tries < self._max_retries:
-            try:
-                response = feedparser.parse(s_url)
-                self._last_scraped_url = s_url
-                b_noanswer = False
-            except RuntimeError as ex:
-                self.log.error("Cannot open %s\n%s\nretrying in %2.2f s\n" %
-                               (s_url, str(ex), self._retry_delay_seconds))
-                time.sleep(1)
-                b_noanswer = True
-            n_tries += 1
+        return self._fetch_parsed(s_url, "rss", self.parse_rss)
+
+
+    def fetch_headlines(self, s_url):
+        """
+        fetches the rss feed at a url given by url string s_url and returns
+        its entries as a list of headline.Headline records - like
+        fetch_rss(), but the parsed feed itself is not kept
+        """
+        return self._fetch_parsed(s_url, "headlines", self.parse_headlines)
+
+
+    def _fetch_parsed(self, s_url, s_kind, parse):
+        """
+        downloads url string s_url with fetch_html(), returns the result of
+        parsing it with parse(contents, headers, s_url) - unless the result
+        cache has a fresh result for 's_kind' (the kind of parsing) and
+        s_url, or one parsed from the same bytes (which is also how a feed
+        that has not changed since it was last fetched, http code 304, is
+        not parsed again) - parsed results are kept in the result cache
+        only, the validator store keeps the downloaded bytes
+        """
+        s_key = s_kind+" "+s_url
+        response = self.get_cached_result(s_key)
+        if response is not None:
+            return response
+        contents, headers, _ = self.fetch_html(s_url)
+        if contents is None:
+            return parse(b"", None, s_url)
+        response = self.get_cached_result(s_key, contents)
+        if response is not None:
+            return response
+        start_time = time.perf_counter()
+        response = parse(contents, headers, s_url)
+        self.record_stage("parse", s_url, time.perf_counter()-start_time)
+        self._result_cache.put(s_key, contents, response)
 
         return response
 
 
+    def get_cached_result(self, s_key, contents=None):
+        """
+        returns the result cached under key 's_key' if it is fresh or, if
+        downloaded bytes 'contents' are given, if it was parsed from the
+        same bytes - else None - counting the hits and misses for scrape()
+        (a lookup without 'contents' that fails is not a miss yet)
+        """
+        response = self._result_cache.get(s_key, contents)
+        if response is not None:
+            add_to_scrape_tally("hits")
+        elif contents is not None:
+            add_to_scrape_tally("misses")
+        return response
+
+
+    def parse_rss(self, contents, headers=None, s_url=None):
+        """
+        parses rss feed bytes 'contents' downloaded from url string 's_url'
+        with http response headers 'headers' - right here, or, if this
+        object has a parse executor, there, in which case the result is
+        compact (see parse_rss_compact())
+        """
+        d_headers = self.get_parse_headers(headers, s_url)
+        if self._parse_executor is None:
+            return parse_rss_bytes(contents, d_headers)
+        return self._parse_executor.submit(
+            self.get_rss_parser(), contents, d_headers).result()
+
+
+    def get_rss_parser(self):
+        """
+        returns the function that rss feed bytes are parsed with, given
+        the bytes and the parse headers: parse_rss_compact() if this object
+        has a parse executor (which the result is sent back from), else
+        parse_rss_bytes()
+        """
+        if self._parse_executor is None:
+            return parse_rss_bytes
+        return parse_rss_compact
+
+
+    def parse_headlines(self, contents, headers=None, s_url=None):
+        """
+        parses rss feed bytes 'contents' like parse_rss() does, returns the
+        feed's entries as a list of headline.Headline records
+        """
+        return self.get_headlines(self.parse_rss(contents, headers, s_url))
+
+
+    def get_headlines(self, feed):
+        """
+        returns the entries of parsed feed 'feed' as a list of
+        headline.Headline records whose source is this scraper's outlet
+        """
+        s_source = self.get_source_name()
+        return [Headline.from_entry(s_source, entry) for entry in feed.entries]
+
+
+    def get_source_name(self):
+        """
+        returns the name of the outlet this scraper scrapes, by default the
+        class name without its 'Scrape' prefix (e.g. 'BBC' for ScrapeBBC)
+        """
+        s_name = type(self).__name__
+        if s_name.startswith("Scrape") and \
+                s_name[len("Scrape"):][:1].isupper():
+            return s_name[len("Scrape"):]
+        return s_name
+
+
+    def parse_table(self, s_html, i_table=0):
+        """
+        same as get_table_from_html() but on the parse executor, if this
+        object has one - only the html goes there and the table rows back
+        """
+        start_time = time.perf_counter()
+        if self._parse_executor is None:
+            l_rows = self.get_table_from_html(s_html, i_table,
+                                              self.parser_backend)
+        else:
+            l_rows = self._parse_executor.submit(
+                ScraperBase.get_table_from_html, s_html, i_table,
+                self.parser_backend).result()
+        self.record_stage("parse", self._last_scraped_url,
+                          time.perf_counter()-start_time)
+        return l_rows
+
+
+    def get_metric_labels(self, s_url):
+        """
+        returns the dictionary of metric labels of this scraper fetching
+        url string 's_url' (which may be None): scraper and host
+        """
+        return {"scraper": self.get_source_name(),
+                "host": urlsplit(s_url).netloc.lower() if s_url else ""}
+
+
+    def record_stage(self, s_stage, s_url, seconds):
+        """
+        records that scraping stage 's_stage' ("connect", "ttfb",
+        "download", "parse" or "extract") of url string 's_url' took
+        'seconds' seconds
+        """
+        d_labels = self.get_metric_labels(s_url)
+        d_labels["stage"] = s_stage
+        self._metrics.observe("scraper_stage_seconds", d_labels, seconds)
+
+
+    def get_log_fields(self, s_url, **d_fields):
+        """
+        returns the dictionary of json log line fields (see
+        log_utils.JSON_LOG_FIELDS) of this scraper and url string 's_url',
+        plus 'd_fields'
+        """
+        d_fields["scraper"] = self.get_source_name()
+        d_fields["url"] = s_url
+        return d_fields
+
+
+    def record_fetch(self, s_url, b_success, n_tries, d_timings):
+        """
+        records the metrics of a fetch of url string 's_url': whether it
+        succeeded, after 'n_tries' tries, and the stage timings and bytes
+        of dictionary 'd_timings' (see http_pool.HttpPool.get()), which
+        cover all the tries
+        """
+        d_labels = self.get_metric_labels(s_url)
+        self._metrics.inc("scraper_fetches_total", dict(
+            d_labels, result="success" if b_success else "failure"))
+        if n_tries > 1:
+            self._metrics.inc("scraper_retries_total", d_labels, n_tries-1)
+        if d_timings.get("bytes"):
+            self._metrics.inc("scraper_bytes_total", d_labels,
+                              d_timings["bytes"])
+            add_to_scrape_tally("bytes", d_timings["bytes"])
+        for s_stage in ("connect", "ttfb", "download"):
+            if s_stage in d_timings:
+                self.record_stage(s_stage, s_url, d_timings[s_stage])
+
+
     def fetch_html(self, s_url):
         """
-        fetches the html at a url given by url string s_url
+        fetches the html at a url given by url string s_url, returns tuple
+        (contents, headers, code), all None if the fetch failed
         """
+        breaker = self.get_breaker(s_url)
+        if not breaker.allow_request():
+            self.log.warning("circuit open, not fetching %s", s_url,
+                             extra=self.get_log_fields(s_url))
+            return None, None, None
 
         # spoof the user agent to appear like an iphone's
         # "User-Agent" : "Mozilla/5.0(Windows; U; Windows NT 5.1; en-US) Ap"+
@@ -125,76 +528,167 @@ class ScraperBase:
             "User-Agent" : "",
             "Referer" : "http://python.org"
             }
+        s_key = "html "+s_url
+        cached = self._validator_store.get(s_key)
+        d_headers.update(self.get_conditional_headers(cached))
 
-        # create a request object for the URL
-        # request = urllib2.Request(s_url, headers=d_headers)
-        req = request.Request(s_url, headers=d_headers)
-
-        # create an opener object
-        # opener = urllib2.build_opener()
-        opener = request.build_opener()
+        # all scrapers share one keep-alive connection pool (unless given
+        # their own), so repeated fetches to the same host reuse their sockets
+        pool = self._http_pool
+        if pool is None:
+            pool = get_shared_pool()
 
         # open a connection and receive the http response headers + contents
-        b_noanswer = True
+        start_time = time.time()
         n_tries = 0
         contents = None
         headers = None
         code = None
-        while b_noanswer and n_tries < self._max_retries:
-            try:
-                response = opener.open(req)
-
-                self._last_scraped_url = s_url
-                b_noanswer = False
-                # return values
-                contents = response.read()
-                headers = response.headers
-                code = response.code
-            # except (urllib2.HTTPError, urllib2.URLError) as ex:
-            except (request.HTTPError, urllib2.URLError) as ex:
-                s_message = "Cannot open %s\n%s\nretrying in %2.2f s\n" % \
-                            (s_url, str(ex), self._retry_delay_seconds)
-                sys.stderr.write(s_message+"\n")
-                self.log.error(s_message)
-                time.sleep(1)
-                b_noanswer = True
-            n_tries += 1
-
+        b_success = False
+        # whether the host answered the last try, for its circuit breaker
+        b_host_up = False
+        d_timings = {}
+        try:
+            while True:
+                n_tries += 1
+                try:
+                    contents, headers, code = pool.get(s_url, d_headers,
+                                                       d_timings)
+
+                    self._last_scraped_url = s_url
+                    b_success = True
+                    b_host_up = True
+                    if code == 304 and cached:
+                        # not modified since last fetched, reuse those
+                        # contents
+                        contents = cached[2]
+                    else:
+                        self.save_validators(s_key, headers, contents)
+                    break
+                # except (urllib2.HTTPError, urllib2.URLError) as ex:
+                except (request.HTTPError, request.URLError) as ex:
+                    b_host_up = not is_host_failure(ex)
+                    delay = self._retry_policy.get_next_delay(
+                        n_tries, start_time, ex)
+                    if delay is None:
+                        s_message = "Cannot open %s\n%s\ngiving up after " \
+                                    "%d tries\n" % (s_url, str(ex), n_tries)
+                    else:
+                        s_message = "Cannot open %s\n%s\nretrying in " \
+                                    "%2.2f s\n" % (s_url, str(ex), delay)
+                    sys.stderr.write(s_message+"\n")
+                    self.log.error(s_message, extra=self.get_log_fields(
+                        s_url, attempt=n_tries))
+                    if delay is None:
+                        break
+                    time.sleep(delay)
+        finally:
+            # also when something unexpected escapes, so that a half-open
+            # circuit is never left waiting for its probe's result
+            if b_host_up:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        self.record_fetch(s_url, b_success, n_tries, d_timings)
 
         return contents, headers, code
 
 
+    def get_breaker(self, s_url):
+        """
+        returns the circuit breaker (see get_host_breaker()) of the host
+        (and port, if any) of url string 's_url', remembering that this
+        scraper fetches from that host
+        """
+        s_host = urlsplit(s_url).netloc.lower()
+        self._set_hosts.add(s_host)
+        return self.get_host_breaker(s_host)
+
+
+    def get_host_breaker(self, s_host):
+        """
+        returns the circuit breaker of host 's_host' - the process-wide one,
+        subclasses may keep their own
+        """
+        return get_breaker(s_host)
+
+
+    def is_circuit_open(self):
+        """
+        returns True if the circuit of any host this scraper has fetched
+        from is open, i.e. if scraping now would fail fast
+        """
+        return any(self.get_host_breaker(s_host).is_open()
+                   for s_host in list(self._set_hosts))
+
+
+    @staticmethod
+    def get_parse_headers(headers, s_url=None):
+        """
+        returns http response headers 'headers' of url string 's_url' as the
+        (picklable) dictionary of lower-cased header names feedparser takes
+        """
+        d_headers = dict((s_name.lower(), s_value)
+                         for s_name, s_value in (headers or {}).items())
+        if s_url and "content-location" not in d_headers:
+            # base url for resolving relative links
+            d_headers["content-location"] = s_url
+        return d_headers
+
+
+    @staticmethod
+    def get_conditional_headers(cached):
+        """
+        returns the dictionary of conditional GET request headers
+        (If-None-Match / If-Modified-Since) for the validator store entry
+        'cached', which may be None
+        """
+        d_headers = {}
+        if cached:
+            s_etag, s_last_modified = cached[0:2]
+            if s_etag:
+                d_headers["If-None-Match"] = s_etag
+            if s_last_modified:
+                d_headers["If-Modified-Since"] = s_last_modified
+        return d_headers
+
+
+    def save_validators(self, s_key, headers, payload):
+        """
+        stores the ETag / Last-Modified validators of http response headers
+        'headers', if it has any, along with 'payload' under key 's_key'
+        """
+        s_etag = headers.get("ETag")
+        s_last_modified = headers.get("Last-Modified")
+        if s_etag or s_last_modified:
+            self._validator_store.put(s_key, s_etag, s_last_modified, payload)
+
+
     @staticmethod
     def get_text_from_html(s_html, s_separator=" "):
         """
         returns list of non-empty text elements in html string snippet 's_html'
         """
-        re_text = re.compile('>([^<>]+)<')
-        s_result = re_text.findall(str(s_html))[0]
+        s_result = RE_HTML_TEXT.findall(str(s_html))[0]
 
         return s_separator.join(s_result.split())
 
 
     @staticmethod
-    def get_table_from_html(s_html, i_table=0):
+    def get_table_from_html(s_html, i_table=0, s_parser=None):
         """
         return a list of lists, each containing the text elements of an
-        html table extracted from soup 'soup' (specifically, using zero
-        indexing, table 'i_table' of all the tables detected in 'soup')
+        html table extracted from html 's_html' (specifically, using zero
+        indexing, table 'i_table' of all the tables in 's_html') - with
+        's_parser' None or "html.parser" the html is parsed only up to the
+        end of that table, otherwise (and for negative indices, which need
+        the whole tree) BeautifulSoup builds the tree with 's_parser', None
+        meaning html.parser
         """
-        soup = BeautifulSoup(s_html, features="html.parser")
-        tables = soup('table')
-        table = tables[i_table]
-        l_text_rows = []
-        l_html_rows = table.findAll('tr')
-        for html_row in l_html_rows:
-            l_text_cells = []
-            l_html_cells = html_row.findAll('td')
-            for html_cell in l_html_cells:
-                l_text_cells.append(ScraperBase.get_text_from_html(html_cell))
-            l_text_rows.append(l_text_cells)
-
-        return l_text_rows
+        if i_table >= 0 and s_parser in (None, "html.parser"):
+            return list(iter_table_rows(s_html, i_table))
+        return get_table_from_soup(s_html, i_table,
+                                   get_parser_backend(s_parser))
 
 
 class ModuleTests(unittest.TestCase):
@@ -216,9 +710,9 @@ class ModuleTests(unittest.TestCase):
                 """
                 s_url = "http://biz.yahoo.com/c/e.html"
                 s_html = self.fetch_html(s_url)[0]
-                table = self.get_table_from_html(s_html, 0)
+                table = self.parse_table(s_html, 0)
                 print('yahoo-calendar-len:', len(table))
-                return self.get_table_from_html(s_html, 0)
+                return table
 
         sobj = YahooCalendarScraper()
         sobj.scrape()
@@ -236,13 +730,184 @@ class ModuleTests(unittest.TestCase):
                 """
                 the abstract method implementation - does all the scraping work
                 """
-                feed = self.fetch_rss(NYT_TOP_HEADLINES_URL)
-                print('# of NYT titles:', len(feed.entries))
-                return [post.title for post in feed.entries]
+                l_headlines = self.fetch_headlines(NYT_TOP_HEADLINES_URL)
+                print('# of NYT titles:', len(l_headlines))
+                return l_headlines
 
         sobj = NYTScraper()
         sobj.scrape()
 
+    def test03(self):
+        """
+        tests conditional GETs against a local http server
+        """
+        from local_server import LocalServer
+        with LocalServer({"/": (200, {"ETag": '"v1"'}, b"page")}) as server:
+            sobj = ScraperBase()
+            contents, _, code = sobj.fetch_html(server.get_url())
+            self.assertEqual((contents, code), (b"page", 200))
+            contents, _, code = sobj.fetch_html(server.get_url())
+            self.assertEqual((contents, code), (b"page", 304))
+
+    def test04(self):
+        """
+        tests that a 503 with a Retry-After header is retried
+        """
+        from local_server import LocalServer
+        with LocalServer({"/": [(503, {"Retry-After": "0"}, b"no"),
+                                (200, {}, b"ok")]}) as server:
+            sobj = ScraperBase()
+            start_time = time.time()
+            self.assertEqual(sobj.fetch_html(server.get_url())[2], 200)
+            self.assertLess(time.time()-start_time, BASE_DELAY_SECONDS)
+            self.assertEqual(len(server.l_paths), 2)
+
+    def test05(self):
+        """
+        tests downloading an rss feed and parsing it in a process pool
+        """
+        from local_server import LocalServer
+        with LocalServer({"/": (200, {"Content-Type": "application/rss+xml"},
+                                TEST_RSS)}) as server:
+            s_url = server.get_url()
+            with ProcessPoolExecutor(1) as executor:
+                sobj = ScraperBase(parse_executor=executor)
+                feed = sobj.fetch_rss(s_url)
+                l_headlines = sobj.fetch_headlines(s_url)
+                self.assertEqual(sobj.filter_new(l_headlines), l_headlines)
+                self.assertEqual(sobj.filter_new(sobj.fetch_headlines(s_url)),
+                                 [])
+        self.assertEqual([post.title for post in feed.entries],
+                         ["first headline", "second headline"])
+        self.assertEqual(feed.entries[1].link, "http://x/2")
+        self.assertEqual(l_headlines[1].as_tuple(),
+                         ("ScraperBase", "second headline", "http://x/2",
+                          None, None))
+
+    def test06(self):
+        """
+        tests table parsing on the shared parse pool, and that tables are
+        not deduplicated
+        """
+        s_html = b"<html><table><tr><td>a</td></tr></table><table>" + \
+            b"<tr><td> b  c </td><td><b>d</b></td></tr></table></html>"
+        sobj = ScraperBase(parse_executor=get_parse_pool(1))
+        self.assertEqual(sobj.parse_table(s_html, 1), [["b c", "d"]])
+        for _ in range(2):
+            self.assertEqual(sobj.filter_new(sobj.parse_table(s_html, 1)),
+                             [["b c", "d"]])
+        # without a parser backend, whole trees are html.parser's too, so
+        # malformed tables come out the same as streamed
+        s_html = "<table><tr><td>a<td>b<tr><td><p>c</table><td>d"
+        self.assertEqual(ScraperBase.get_table_from_html(s_html, -1),
+                         ScraperBase.get_table_from_html(s_html, 0))
+        self.assertIs(get_parse_pool(1), sobj._parse_executor)
+        with self.assertRaises(ValueError):
+            get_parse_pool(2)
+
+    def test07(self):
+        """
+        tests regexp extraction, single and multi-field
+        """
+        s_html = "<b>x=1</b><i>y=2</i><b>x=3</b>"
+        self.assertEqual(ScraperBase(regexp=r"x=(\d)").extract(s_html),
+                         ("1",))
+        self.assertEqual(ScraperBase(regexp=r"x=(\d)",
+                                     b_global=True).extract(s_html),
+                         ["1", "3"])
+        sobj = ScraperBase(regexp={"x": r"x=(\d)", "y": r"y=(\d)"},
+                           b_global=True)
+        self.assertEqual(sobj.extract(s_html), {"x": ["1", "3"], "y": ["2"]})
+
+    def test08(self):
+        """
+        tests that scrapes within the ttl do not fetch, and that a feed
+        fetched again with the same bytes is not parsed again, and the
+        metrics of the stages
+        """
+        from local_server import LocalServer
+        with LocalServer({"/": (200, {}, TEST_RSS)}) as server:
+            s_url = server.get_url()
+            metrics = MetricsRegistry()
+            sobj = ScraperBase(metrics=metrics)
+            feed = sobj.fetch_rss(s_url)
+            self.assertIs(sobj.fetch_rss(s_url), feed)
+            self.assertEqual(len(server.l_paths), 1)
+            d_snapshot = metrics.get_snapshot()
+            self.assertEqual(d_snapshot["scraper_bytes_total"][0]["value"],
+                             len(TEST_RSS))
+            l_stages = sorted(d_histogram["labels"]["stage"] for d_histogram
+                              in d_snapshot["scraper_stage_seconds"])
+            self.assertEqual(l_stages,
+                             ["connect", "download", "parse", "ttfb"])
+            sobj = ScraperBase(result_cache=ResultCache(ttl_seconds=0.0))
+            d_tally = sobj.new_scrape_tally()
+            token = _SCRAPE_TALLY.set(d_tally)
+            try:
+                feed = sobj.fetch_rss(s_url)
+                self.assertIs(sobj.fetch_rss(s_url), feed)
+            finally:
+                _SCRAPE_TALLY.reset(token)
+            self.assertEqual(len(server.l_paths), 3)
+            self.assertEqual((d_tally["hits"], d_tally["misses"]), (1, 1))
+            self.assertIsNone(sobj._validator_store.get("rss "+s_url))
+
+    def test09(self):
+        """
+        tests that 404s do not open the host's circuit, and that an
+        unexpected exception is a failure of the half-open probe
+        """
+        from local_server import LocalServer
+        with LocalServer({}) as server:
+            sobj = ScraperBase()
+            for _ in range(FAILURE_THRESHOLD+1):
+                self.assertIsNone(sobj.fetch_html(server.get_url("/x"))[0])
+            self.assertEqual(sobj.get_breaker(server.get_url()).get_state(),
+                             CLOSED)
+        s_url = "http://127.0.0.1:no-port/"
+        breaker = sobj.get_breaker(s_url)
+        for _ in range(FAILURE_THRESHOLD):
+            breaker.record_failure()
+        # the cooldown is over, the next fetch is the probe
+        breaker._opened_time -= COOLDOWN_SECONDS
+        with self.assertRaises(ValueError):
+            sobj.fetch_html(s_url)
+        self.assertEqual(breaker.get_state(), OPEN)
+        self.assertTrue(sobj.is_circuit_open())
+        breaker.record_success()
+
+    def test10(self):
+        """
+        tests that concurrent scrape() calls each count their own cache
+        hits, misses and bytes
+        """
+        from local_server import LocalServer
+        barrier = threading.Barrier(2)
+
+        class TwoFetchScraper(ScraperBase):
+            """
+            fetches the feed twice, in step with the other thread
+            """
+            def scrape_worker(self):
+                self.fetch_rss(server.get_url())
+                barrier.wait(5)
+                self.fetch_rss(server.get_url())
+                return get_scrape_tally()
+
+        with LocalServer({"/": (200, {}, TEST_RSS)}) as server:
+            sobj = TwoFetchScraper(result_cache=ResultCache(ttl_seconds=0.0))
+            sobj.fetch_rss(server.get_url())
+            l_tallies = []
+            l_threads = [threading.Thread(
+                target=lambda: l_tallies.append(sobj.scrape()))
+                         for _ in range(2)]
+            for thread in l_threads:
+                thread.start()
+            for thread in l_threads:
+                thread.join()
+        self.assertEqual(l_tallies, [{"hits": 2, "misses": 0,
+                                      "bytes": 2*len(TEST_RSS)}]*2)
+
 
 if __name__ == "__main__":
     unittest.main()
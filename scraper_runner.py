@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+scraper_runner.py - run all ScraperBase subclasses concurrently
+"""
+
+import glob
+import importlib
+import os.path
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pprint import pprint
+from circuit_breaker import FAILURE_THRESHOLD, CircuitOpenError, get_breaker
+from dedup_index import DedupIndex
+from retry_policy import RetryPolicy
+from scraper_base import ScraperBase, get_parse_pool
+
+
+# default values:
+
+# maximum number of scrapers running at the same time
+MAX_WORKERS = 8
+
+# glob pattern (relative to this file's directory) of the scraper modules
+SCRAPER_MODULES_GLOB = "scrape_*.py"
+
+# suffix of the files of the scrapers' dedup indexes
+DEDUP_SUFFIX = ".dedup"
+
+
+def import_scraper_modules(s_dir=None):
+    """
+    imports every scraper module (scrape_*.py) in directory 's_dir' (default:
+    the directory of this file) so that their ScraperBase subclasses get
+    defined, returns the list of imported module names
+    """
+    if s_dir is None:
+        s_dir = os.path.dirname(os.path.abspath(__file__))
+    if s_dir not in sys.path:
+        sys.path.insert(0, s_dir)
+    l_names = []
+    for s_path in sorted(glob.glob(os.path.join(s_dir, SCRAPER_MODULES_GLOB))):
+        s_name = os.path.splitext(os.path.basename(s_path))[0]
+        importlib.import_module(s_name)
+        l_names.append(s_name)
+    return l_names
+
+
+def get_scraper_classes(base_class=ScraperBase):
+    """
+    returns all (direct or indirect) subclasses of 'base_class' that are
+    defined at module level, sorted by name - call import_scraper_modules()
+    first to make sure the outlet scrapers are among them
+    """
+    l_classes = []
+    l_todo = list(base_class.__subclasses__())
+    while l_todo:
+        cls = l_todo.pop()
+        l_todo.extend(cls.__subclasses__())
+        # skips classes defined inside functions (e.g. in module tests)
+        if "<locals>" not in cls.__qualname__ and cls not in l_classes:
+            l_classes.append(cls)
+    return sorted(l_classes, key=lambda cls: cls.__name__)
+
+
+class ScraperRunner():
+    """
+    runs the scrape() method of many scrapers concurrently on a bounded
+    thread pool, so that a sweep over all outlets takes about as long as
+    the slowest one instead of the sum of all of them
+    """
+
+    def __init__(self, l_classes=None, s_log_level="DEBUG",
+                 n_max_workers=MAX_WORKERS, parse_executor=None,
+                 s_dedup_dir=None):
+        """
+        constructor - 'l_classes' is the list of ScraperBase subclasses to
+        run, if None all scraper modules are imported and all the
+        ScraperBase subclasses found are used. each scraper logs into a
+        file named after its module (e.g. scrape_bbc.log). the scrapers
+        parse on 'parse_executor' (e.g. scraper_base.get_parse_pool()) if
+        given, so that parsing is spread over all cpu cores. each scraper
+        keeps the headlines it has returned for run(b_only_new=True) in a
+        dedup index file in directory 's_dedup_dir' (None for the current
+        directory) named after its module and class (e.g.
+        scrape_bbc.ScrapeBBC.dedup), so that they are known to later runs
+        """
+        if l_classes is None:
+            import_scraper_modules()
+            l_classes = get_scraper_classes()
+        self._d_scrapers = {}
+        for cls in l_classes:
+            s_module = cls.__module__.split(".")[-1]
+            s_dedup_filename = "%s.%s%s" % (s_module, cls.__name__,
+                                            DEDUP_SUFFIX)
+            if s_dedup_dir is not None:
+                s_dedup_filename = os.path.join(s_dedup_dir, s_dedup_filename)
+            self._d_scrapers[cls.__name__] = cls(
+                s_module+".log", s_log_level, parse_executor=parse_executor,
+                dedup_index=DedupIndex(s_dedup_filename))
+        self._n_max_workers = n_max_workers
+
+    def get_scrapers(self):
+        """
+        returns a dictionary of scraper name -> scraper object
+        """
+        return self._d_scrapers
+
+    @staticmethod
+    def _timed_scrape(sobj, b_only_new=False):
+        """
+        runs sobj.scrape(b_only_new), returns tuple (result, duration,
+        exception) where exception is None if scrape() did not raise -
+        scrapers whose hosts have an open circuit are skipped
+        (CircuitOpenError)
+        """
+        if sobj.is_circuit_open():
+            return None, 0.0, CircuitOpenError(
+                "circuit open for %s" % type(sobj).__name__)
+        start_time = time.time()
+        try:
+            result = sobj.scrape(b_only_new)
+            ex = None
+        # pylint: disable=broad-except
+        except Exception as exc:
+            result = None
+            ex = exc
+        return result, time.time()-start_time, ex
+
+    def run(self, b_only_new=False):
+        """
+        scrapes all outlets concurrently, returns a dictionary of scraper
+        name -> (result, duration, exception) tuple, durations in seconds.
+        outlets whose hosts are failing (open circuit) are skipped without
+        any network time, their exception is a CircuitOpenError. if
+        'b_only_new' is True only headlines not returned by previous
+        run(b_only_new=True) calls (of this or earlier runners, the dedup
+        indexes are saved after each scrape) are returned
+        """
+        n_workers = max(1, min(self._n_max_workers, len(self._d_scrapers)))
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            d_futures = dict(
+                (s_name, executor.submit(self._timed_scrape, sobj,
+                                         b_only_new))
+                for s_name, sobj in self._d_scrapers.items())
+            return dict((s_name, future.result())
+                        for s_name, future in d_futures.items())
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests that scrapers run concurrently and that exceptions are captured
+        """
+        class SlowScraper(ScraperBase):
+            """
+            scraper that only sleeps
+            """
+            def scrape_worker(self):
+                """
+                abstract method implementation - sleeps, returns a title list
+                """
+                time.sleep(0.5)
+                return ["title"]
+
+        class BrokenScraper(ScraperBase):
+            """
+            scraper that always fails
+            """
+            def scrape_worker(self):
+                """
+                abstract method implementation - raises
+                """
+                raise ValueError("broken")
+
+        class OtherSlowScraper(SlowScraper):
+            """
+            another sleeping scraper
+            """
+
+        runner = ScraperRunner(
+            [SlowScraper, OtherSlowScraper, BrokenScraper], "DEBUG")
+        start_time = time.time()
+        d_results = runner.run()
+        elapsed_time = time.time()-start_time
+        self.assertLess(elapsed_time, 0.9)
+        self.assertEqual(d_results["SlowScraper"][0], ["title"])
+        self.assertGreaterEqual(d_results["OtherSlowScraper"][1], 0.5)
+        self.assertIsInstance(d_results["BrokenScraper"][2], ValueError)
+
+    def test02(self):
+        """
+        tests scraper discovery
+        """
+        import_scraper_modules()
+        l_names = [cls.__name__ for cls in get_scraper_classes()]
+        for s_name in ["ScrapeBBC", "ScrapeCNN", "ScrapeNPR", "ScrapeNYT",
+                       "ScrapeReuters", "ScrapeUSAToday"]:
+            self.assertIn(s_name, l_names)
+
+    def test03(self):
+        """
+        tests that scrapers whose host has an open circuit are skipped
+        """
+        class DeadHostScraper(ScraperBase):
+            """
+            scraper of an unreachable host
+            """
+            def scrape_worker(self):
+                """
+                abstract method implementation - fails to fetch
+                """
+                return self.fetch_html("http://127.0.0.1:1/")[0]
+
+        runner = ScraperRunner([DeadHostScraper], "DEBUG")
+        sobj = runner.get_scrapers()["DeadHostScraper"]
+        sobj._retry_policy = RetryPolicy(1)
+        for _ in range(FAILURE_THRESHOLD):
+            runner.run()
+        result, duration, ex = runner.run()["DeadHostScraper"]
+        self.assertIsNone(result)
+        self.assertEqual(duration, 0.0)
+        self.assertIsInstance(ex, CircuitOpenError)
+        get_breaker("127.0.0.1:1").record_success()
+
+    def test04(self):
+        """
+        tests that only new headlines are returned, across runners
+        """
+        class FixedScraper(ScraperBase):
+            """
+            scraper that always returns the same titles
+            """
+            def scrape_worker(self):
+                """
+                abstract method implementation - returns a title list
+                """
+                return ["a", "b"]
+
+        with tempfile.TemporaryDirectory() as s_dir:
+            runner = ScraperRunner([FixedScraper], "DEBUG", s_dedup_dir=s_dir)
+            self.assertEqual(runner.run(True)["FixedScraper"][0], ["a", "b"])
+            self.assertEqual(runner.run(True)["FixedScraper"][0], [])
+            l_filenames = os.listdir(s_dir)
+            self.assertEqual(len(l_filenames), 1)
+            self.assertTrue(l_filenames[0].endswith(".FixedScraper" +
+                                                    DEDUP_SUFFIX))
+            # a new runner, as in a new process
+            runner = ScraperRunner([FixedScraper], "DEBUG", s_dedup_dir=s_dir)
+            self.assertEqual(runner.run(True)["FixedScraper"][0], [])
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "run":
+        pprint(ScraperRunner(parse_executor=get_parse_pool()).run())
+    else:
+        unittest.main()
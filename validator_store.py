@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+validator_store.py - stores of http cache validators (ETag / Last-Modified)
+along with the last result fetched, for conditional GETs
+"""
+
+import os
+import shelve
+import tempfile
+import threading
+import unittest
+
+
+class MemoryValidatorStore():
+    """
+    in-memory validator store, its contents are lost when the process exits
+    """
+
+    def __init__(self):
+        """
+        constructor
+        """
+        self._d_entries = {}
+
+    def get(self, s_key):
+        """
+        returns tuple (s_etag, s_last_modified, payload) stored for key
+        's_key' (usually a url) or None if nothing is stored for it
+        """
+        return self._d_entries.get(s_key)
+
+    def put(self, s_key, s_etag, s_last_modified, payload):
+        """
+        stores the validators 's_etag' and 's_last_modified' (any of which
+        may be None) along with 'payload', the result they validate
+        """
+        self._d_entries[s_key] = (s_etag, s_last_modified, payload)
+
+    def close(self):
+        """
+        nothing to release for this store
+        """
+
+
+class FileValidatorStore():
+    """
+    on-disk validator store (a shelve file), so that conditional GETs keep
+    working across process restarts - payloads must be picklable
+    """
+
+    def __init__(self, s_filename):
+        """
+        constructor - opens (or creates) shelve file 's_filename'
+        """
+        self._shelf = shelve.open(s_filename)
+        self._lock = threading.Lock()
+
+    def __del__(self):
+        self.close()
+
+    def get(self, s_key):
+        """
+        returns tuple (s_etag, s_last_modified, payload) stored for key
+        's_key' (usually a url) or None if nothing is stored for it
+        """
+        with self._lock:
+            return self._shelf.get(s_key)
+
+    def put(self, s_key, s_etag, s_last_modified, payload):
+        """
+        stores the validators 's_etag' and 's_last_modified' (any of which
+        may be None) along with 'payload', the result they validate
+        """
+        with self._lock:
+            self._shelf[s_key] = (s_etag, s_last_modified, payload)
+            self._shelf.sync()
+
+    def close(self):
+        """
+        closes the shelve file
+        """
+        with self._lock:
+            self._shelf.close()
+
+
+class ModuleTests(unittest.TestCase):
+    """
+    module tests
+    """
+    def test01(self):
+        """
+        tests the in-memory store
+        """
+        store = MemoryValidatorStore()
+        self.assertIsNone(store.get("http://x"))
+        store.put("http://x", '"abc"', None, b"payload")
+        self.assertEqual(store.get("http://x"), ('"abc"', None, b"payload"))
+
+    def test02(self):
+        """
+        tests that the on-disk store survives being closed and reopened
+        """
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_filename = os.path.join(s_dir, "validators")
+            store = FileValidatorStore(s_filename)
+            store.put("http://x", None, "Mon, 01 Jan 2024 00:00:00 GMT",
+                      ["title"])
+            store.close()
+            store = FileValidatorStore(s_filename)
+            self.assertEqual(store.get("http://x"),
+                             (None, "Mon, 01 Jan 2024 00:00:00 GMT",
+                              ["title"]))
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()